@@ -1,11 +1,18 @@
 import streamlit as st
-from utils import storage
+from utils import storage, profiler, tenancy
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Language Learning Hub", page_icon="🪐", layout="wide")
 
+# --- Profiling (add ?debug=1 to the URL for the timing panel) ---
+profiler.start_run("app", force=st.query_params.get("debug") == "1")
+
+# --- Current user (logged-in user, or ?user=<id> in the URL) ---
+tenancy.init_user()
+
 # --- Load Lesson Plan ---
-lesson_plan = storage.load_lesson_plan()  # Assuming lesson plan is stored as a list of dicts
+with profiler.section("load plan"):
+    lesson_plan = storage.load_lesson_plan()  # Assuming lesson plan is stored as a list of dicts
 
 # --- Calculate Progress ---
 total_tasks = sum(len(week['assignments']) for week in lesson_plan)
@@ -28,17 +35,17 @@ col1, col2, col3, col4 = st.columns(4)
 
 with col1:
     if st.button("💬 Talk to your teaching assistant", key="main_chatbot"):
-        st.switch_page("pages/chatbot.py")
+        profiler.switch_page("pages/chatbot.py")
 with col2:
     if st.button("📖 Check out your vocabulary", key="main_vocab"):
-        st.switch_page("pages/vocab.py")
+        profiler.switch_page("pages/vocab.py")
 
 with col3:
     if st.button("📚 Review your lessons plan", key="main_lesson_plan"):
-        st.switch_page("pages/lesson_plan.py")
+        profiler.switch_page("pages/lesson_plan.py")
 with col4:
     if st.button("📜 Look through the previous lessons", key="main_history"):
-        st.switch_page("pages/history.py")
+        profiler.switch_page("pages/history.py")
 
 
 # --- Space-Themed Progress Bar ---
@@ -108,3 +115,5 @@ elif progress < 100:
 else:
     st.balloons()
     st.success("🌟 Mission Accomplished! Well done, space explorer!")
+
+profiler.render_panel()
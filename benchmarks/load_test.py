@@ -0,0 +1,261 @@
+# Multi-user load test: simulated learners drive app.py and the pages headlessly
+# through Streamlit's AppTest with the fake LLM provider. Reports latency
+# percentiles, throughput and error rates per action as the number of concurrent
+# users rises.
+#
+# AppTest installs a process-global runtime for every run, so concurrent runs in
+# one process interfere. Each simulated user therefore runs in its own process;
+# the users share the asset files and the CPU like replicas on shared storage,
+# but not in-process caches or the LLM scheduler.
+#
+# Every simulated user is its own tenant (?user=user-<n>) with its own synthetic
+# data; --single-user makes them all work on the same learner's files instead.
+#
+#   python -m benchmarks.load_test                          # 1, 2, 4 and 8 users
+#   python -m benchmarks.load_test --users 1 8 32 --turns 5 --llm-latency 0.5
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+sys.path.insert(0, REPO_DIR)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from benchmarks import synthetic_data  # noqa: E402
+from benchmarks.run import _git_commit  # noqa: E402
+from utils import tenancy  # noqa: E402
+
+ACTIONS = ["app", "lesson_plan", "start_session", "chat_turn", "history", "vocab"]
+USER_MESSAGES = [
+    "Ich bin gestern ins Kino gegangen.",
+    "Kannst du mir den Dativ nach mit erklären?",
+    "Ich habe mit der Kollege gesprochen.",
+    "Wie sage ich 'to postpone a meeting'?",
+    "Morgen fahre ich mit dem Zug nach Berlin."
+]
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class Recorder:
+    """Latency and outcome of the actions of one simulated user"""
+
+    def __init__(self):
+        self.samples = []  # (action, start wall time, seconds, error)
+
+    def record(self, action, at, run):
+        started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            run()
+            if at.exception:
+                error = at.exception[0].value
+            elif at.error:
+                error = at.error[0].value
+        except Exception as e:
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        self.samples.append((action, started_at, time.perf_counter() - start, error))
+
+
+def summarize(samples):
+    """Per-action count, error rate, throughput and latency percentiles over the samples of all users"""
+    # Measured from the first action to the last, so process start-up is not counted
+    elapsed = max(s[1] + s[2] for s in samples) - min(s[1] for s in samples)
+    report = {}
+    for action in ACTIONS + ["all"]:
+        action_samples = [s for s in samples if action in ("all", s[0])]
+        if not action_samples:
+            continue
+        latencies = [s[2] for s in action_samples]
+        errors = [s[3] for s in action_samples if s[3]]
+        report[action] = {
+            "count": len(action_samples),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(action_samples),
+            "throughput": len(action_samples) / elapsed,
+            "p50": _percentile(latencies, 50),
+            "p90": _percentile(latencies, 90),
+            "p99": _percentile(latencies, 99),
+            "max": max(latencies),
+            "sample_errors": sorted(set(errors))[:3]
+        }
+    return elapsed, report
+
+
+def _fail(message):
+    raise RuntimeError(message)
+
+
+def _page(name, timeout, user_id):
+    path = os.path.join(REPO_DIR, "app.py" if name == "app" else os.path.join("pages", f"{name}.py"))
+    at = AppTest.from_file(path, default_timeout=timeout)
+    at.query_params["user"] = user_id
+    return at
+
+
+def simulate_user(user, user_id, workspace, lesson_plan, turns, timeout):
+    """
+    One learner: opens the app and the lesson plan, practices an assignment, then reviews history and vocabulary
+
+    Returns:
+        list: (action, start wall time, seconds, error) samples
+    """
+    os.chdir(workspace)
+    rng = random.Random(user)
+    recorder = Recorder()
+
+    at = _page("app", timeout, user_id)
+    recorder.record("app", at, at.run)
+
+    at = _page("lesson_plan", timeout, user_id)
+    recorder.record("lesson_plan", at, at.run)
+
+    # What the lesson plan's Practice button hands over to the chatbot page
+    lesson = rng.choice(lesson_plan)
+    at = _page("chatbot", timeout, user_id)
+    at.session_state["start_session_data"] = {
+        "action": "new",
+        "lesson_key": lesson["week_or_day"],
+        "assignment": rng.choice(lesson["assignments"])["title"]
+    }
+    recorder.record("start_session", at, at.run)
+    for _ in range(turns):
+        if not at.chat_input:
+            recorder.record("chat_turn", at, lambda: _fail("The chat input is missing"))
+            break
+        message = rng.choice(USER_MESSAGES)
+        recorder.record("chat_turn", at, lambda: at.chat_input[0].set_value(message).run())
+
+    at = _page("history", timeout, user_id)
+    recorder.record("history", at, at.run)
+
+    at = _page("vocab", timeout, user_id)
+    recorder.record("vocab", at, at.run)
+    return recorder.samples
+
+
+def _prepare_workspace(workspace, args, user_ids):
+    """
+    Synthetic assets for each user plus a config that uses the fake LLM with the requested latency
+
+    Returns:
+        dict: user id -> lesson plan
+    """
+    os.makedirs(os.path.join(workspace, "utils"), exist_ok=True)
+    with open(os.path.join(REPO_DIR, "utils", "config.json"), "r") as f:
+        config = json.load(f)
+    config["llm_provider"] = "fake"
+    config["fake_llm"] = dict(
+        config.get("fake_llm", {}),
+        latency=args.llm_latency,
+        tokens_per_second=args.llm_tokens_per_second,
+        error_rate=args.llm_error_rate
+    )
+    config["profiling"] = False
+    with open(os.path.join(workspace, "utils", "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    return {
+        user_id: synthetic_data.generate_assets(
+            workspace, args.sessions, args.messages, args.words, seed=i, user_id=user_id
+        )["lesson_plan"]
+        for i, user_id in enumerate(user_ids)
+    }
+
+
+def run_level(users, args):
+    """Run one concurrency level on fresh assets and summarize it"""
+    workspace = tempfile.mkdtemp(prefix=f"tutor-load-{users}-")
+    try:
+        if args.single_user:
+            user_ids = [tenancy.DEFAULT_USER_ID] * users
+        else:
+            user_ids = [f"user-{user}" for user in range(users)]
+        lesson_plans = _prepare_workspace(workspace, args, sorted(set(user_ids)))
+        samples = []
+        with ProcessPoolExecutor(max_workers=users) as executor:
+            futures = [
+                executor.submit(
+                    simulate_user, user, user_id, workspace, lesson_plans[user_id], args.turns, args.timeout
+                )
+                for user, user_id in enumerate(user_ids)
+            ]
+            for future in futures:
+                samples.extend(future.result())
+        elapsed, actions = summarize(samples)
+        return {"users": users, "elapsed": elapsed, "actions": actions}
+    finally:
+        if not args.keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+def print_level(level):
+    print(f"\n{level['users']} concurrent user(s), {level['elapsed']:.1f}s")
+    print(f"  {'action':<14}{'count':>7}{'errors':>8}{'ops/s':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for action, stats in level["actions"].items():
+        print(f"  {action:<14}{stats['count']:>7}{stats['errors']:>8}{stats['throughput']:>8.2f}"
+              f"{stats['p50'] * 1000:>10.0f}{stats['p90'] * 1000:>10.0f}{stats['p99'] * 1000:>10.0f}")
+        for error in stats["sample_errors"]:
+            print(f"    ! {error[:160]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent learners against the Streamlit pages")
+    parser.add_argument("--users", nargs="+", type=int, default=[1, 2, 4, 8], help="Concurrency levels")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per simulated user")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds one page run may take")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--sessions", type=int, default=100, help="Synthetic sessions per learner")
+    parser.add_argument("--messages", type=int, default=5000, help="Synthetic messages per learner")
+    parser.add_argument("--words", type=int, default=500, help="Synthetic vocabulary per learner")
+    parser.add_argument("--single-user", action="store_true", help="All simulated users share one learner's data")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load-<commit>-<timestamp>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated assets")
+    args = parser.parse_args()
+
+    # Also covers code paths that read the provider from the environment
+    os.environ["LLM_PROVIDER"] = "fake"
+
+    commit = _git_commit()
+    levels = []
+    for users in args.users:
+        level = run_level(users, args)
+        print_level(level)
+        levels.append(level)
+
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+        "levels": levels
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{commit or 'unknown'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
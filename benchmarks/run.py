@@ -0,0 +1,200 @@
+# Benchmarks for utils/storage.py and the page logic that scales with the data
+# (history grouping, vocabulary normalization, the HTML summary of the PDF),
+# run on synthetic assets of increasing size. Results are written as JSON so
+# two commits can be compared.
+#
+#   python -m benchmarks.run                        # small and medium
+#   python -m benchmarks.run --sizes large --repeat 3
+#   python -m benchmarks.run --compare benchmarks/results/old.json benchmarks/results/new.json
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks import synthetic_data  # noqa: E402
+from utils import tenancy  # noqa: E402
+
+SIZES = {
+    "small": {"sessions": 100, "messages": 10000, "words": 1000, "pdf_items": 5},
+    "medium": {"sessions": 1000, "messages": 100000, "words": 10000, "pdf_items": 20},
+    "large": {"sessions": 5000, "messages": 1000000, "words": 30000, "pdf_items": 50}
+}
+DEFAULT_SIZES = ["small", "medium"]
+
+
+def _time(func, setup=None, repeat=5):
+    """Run func repeat times, excluding setup, and return timing statistics in seconds"""
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "repeat": repeat
+    }
+
+
+def _persisted(func):
+    """func followed by writing out the storage writes it queued, so write-behind is timed too"""
+    from utils import storage
+
+    def run(*args):
+        func(*args)
+        storage.flush_writes()
+    return run
+
+
+def _cases(data, pdf_data):
+    """(name, func, setup) for every benchmarked function"""
+    from utils import storage, pdf_generator
+
+    sessions = data["sessions"]
+    last = sessions[-1] if sessions else None
+    messages = storage.load_chat_history()
+    vocabulary = storage.load_vocabulary()
+    message = {"role": "user", "content": "Benchmark", "timestamp": datetime.now().isoformat(), "session_id": None}
+    summary = {
+        "summary": "Benchmark", "what_worked": "-", "understood": "-", "difficulties": "-",
+        "common_mistakes": ["der instead of dem after mit"]
+    }
+
+    def new_session():
+        return (storage.create_session("Week 1 - Benchmark", "Benchmark assignment"), summary)
+
+    return [
+        ("storage.load_lesson_plan_inputs", storage.load_lesson_plan_inputs, None),
+        ("storage.save_lesson_plan_inputs", lambda: storage.save_lesson_plan_inputs(storage.load_lesson_plan_inputs()), None),
+        ("storage.load_lesson_plan", storage.load_lesson_plan, None),
+        ("storage.save_lesson_plan", lambda: storage.save_lesson_plan(data["lesson_plan"]), None),
+        ("storage.load_vocabulary", storage.load_vocabulary, None),
+        ("storage.save_vocabulary", lambda: storage.save_vocabulary(vocabulary), None),
+        ("storage.load_vocab_candidates", storage.load_vocab_candidates, None),
+        ("storage.save_vocab_candidates", lambda: storage.save_vocab_candidates(storage.load_vocab_candidates()), None),
+        ("storage.load_chat_history", storage.load_chat_history, None),
+        ("storage.save_chat_history", lambda: storage.save_chat_history(messages), None),
+        ("storage.append_messages", lambda: storage.append_messages([message]), None),
+        ("storage.load_sessions", storage.load_sessions, None),
+        ("storage.save_sessions", lambda: storage.save_sessions(storage.load_sessions()), None),
+        ("storage.create_session", lambda: storage.create_session("Week 1 - Benchmark", "Benchmark assignment"), None),
+        ("storage.get_session", lambda: storage.get_session(last["session_id"]), None),
+        ("storage.update_session", lambda: storage.update_session(last["session_id"], {"pdf_path": None}), None),
+        ("storage.get_session_by_assignment",
+         lambda: storage.get_session_by_assignment(last["lesson_key"], last["assignment"]), None),
+        ("storage.get_in_progress_sessions", storage.get_in_progress_sessions, None),
+        ("storage.get_completed_sessions", storage.get_completed_sessions, None),
+        ("storage.complete_session", storage.complete_session, new_session),
+        ("storage.load_mistake_index", storage.load_mistake_index, None),
+        ("storage.get_top_mistakes", storage.get_top_mistakes, None),
+        ("storage.get_messages_by_session", lambda: storage.get_messages_by_session(last["session_id"]), None),
+        ("storage.get_recent_messages", lambda: storage.get_recent_messages(last["session_id"]), None),
+        ("storage.get_all_summaries", storage.get_all_summaries, None),
+        ("history.group_messages_by_date", lambda: storage.group_messages_by_date(messages), None),
+        ("vocab.normalize_vocabulary", lambda: storage.normalize_vocabulary(vocabulary), None),
+        ("pdf_generator.create_html_summary",
+         lambda: pdf_generator.create_html_summary(pdf_data, last, "German"), None)
+    ]
+
+
+def run_size(name, size, repeat, keep=False):
+    """Generate the assets for one data size in a scratch directory and time every case there"""
+    workspace = tempfile.mkdtemp(prefix=f"tutor-bench-{name}-")
+    previous_dir = os.getcwd()
+    try:
+        os.makedirs(os.path.join(workspace, "utils"))
+        shutil.copy(os.path.join(REPO_DIR, "utils", "config.json"), os.path.join(workspace, "utils", "config.json"))
+        started = time.perf_counter()
+        data = synthetic_data.generate_assets(
+            workspace, size["sessions"], size["messages"], size["words"], user_id=tenancy.DEFAULT_USER_ID
+        )
+        print(f"[{name}] generated assets in {time.perf_counter() - started:.1f}s ({workspace})")
+        pdf_data = synthetic_data.make_pdf_data(synthetic_data.random.Random(0), size["pdf_items"])
+
+        os.chdir(workspace)
+        results = {}
+        for case, func, setup in _cases(data, pdf_data):
+            results[case] = _time(_persisted(func), setup, repeat)
+            print(f"[{name}] {case:<40} median {results[case]['median'] * 1000:10.2f} ms")
+        return results
+    finally:
+        if "utils.storage" in sys.modules:
+            sys.modules["utils.storage"].flush_writes()
+        os.chdir(previous_dir)
+        if not keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """Print the median ratio new/old for every case both result files have"""
+    with open(old_path, "r") as f:
+        old = json.load(f)
+    with open(new_path, "r") as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for size_name, cases in new["results"].items():
+        old_cases = old["results"].get(size_name, {})
+        for case, timing in cases.items():
+            if case not in old_cases:
+                continue
+            ratio = timing["median"] / old_cases[case]["median"] if old_cases[case]["median"] else float("inf")
+            print(f"[{size_name}] {case:<40} {old_cases[case]['median'] * 1000:10.2f} ms -> "
+                  f"{timing['median'] * 1000:10.2f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark storage and page logic on synthetic data")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<commit>-<timestamp>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated assets")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {name: SIZES[name] for name in args.sizes},
+        "results": {name: run_size(name, SIZES[name], args.repeat, args.keep) for name in args.sizes}
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{commit or 'unknown'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
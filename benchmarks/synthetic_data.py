@@ -0,0 +1,183 @@
+# Generator of realistic synthetic assets for the benchmarks: sessions with
+# summaries, chat history (session and free chat messages), vocabulary,
+# lesson plan and vocabulary candidates, in the formats utils/storage.py uses.
+#
+#   python -m benchmarks.synthetic_data /tmp/bench_assets --sessions 2000 --messages 200000 --words 20000
+import argparse
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+TOPICS = [
+    "Meeting new people", "Travel and transport", "Home, family and friends", "Work and meetings",
+    "Health and daily routines", "Culture and media", "Shopping and money", "Food and restaurants"
+]
+TASKS = [
+    "Introduce yourself", "Role play: at the railway station", "Describe your apartment",
+    "Schedule a meeting and postpone it", "At the doctor's", "Talk about a film or a book",
+    "Buying clothes", "Order food in a restaurant", "Describe your daily routine", "Compare traditions"
+]
+WORDS = [
+    "Haus", "Baum", "Besprechung", "verschieben", "Fahrkarte", "Bahnhof", "Wohnung", "Freund",
+    "Arbeit", "Kollege", "Termin", "Arzt", "Gesundheit", "Buch", "Film", "Geld", "Essen", "Kellner",
+    "Rechnung", "Urlaub", "Reise", "Zug", "Flughafen", "Familie", "Schwester", "Bruder", "Stadt",
+    "Wetter", "Sprache", "Übung", "Frage", "Antwort", "Zeit", "Morgen", "Abend", "Woche", "Jahr"
+]
+VERBS = ["gehe", "habe", "bin", "mache", "sehe", "kaufe", "fahre", "arbeite", "lerne", "spreche"]
+MISTAKES = [
+    "der instead of dem after mit", "verb not at the end of a weil clause", "haben instead of sein in Perfekt",
+    "wrong plural of Buch", "missing article before Arzt", "ich bin gegangen vs ich habe gegangen",
+    "word order after deshalb", "den instead of dem in dative", "wrong adjective ending after ein"
+]
+
+
+def _sentence(rng, length=None):
+    words = [rng.choice(WORDS) for _ in range(length or rng.randint(5, 14))]
+    words.insert(1, rng.choice(VERBS))
+    return "Ich " + " ".join(words) + "."
+
+
+def _tutor_reply(rng):
+    parts = [_sentence(rng)]
+    if rng.random() < 0.4:
+        parts.append(f"Fast richtig: ich ~~habe~~ **bin** {rng.choice(WORDS).lower()} gegangen.")
+    if rng.random() < 0.3:
+        parts.append("\n".join(f"- {w} – meaning" for w in rng.sample(WORDS, 3)))
+    parts.append(_sentence(rng) + " Was meinst du?")
+    return "\n\n".join(parts)
+
+
+def make_lesson_plan(rng, weeks=12):
+    return [
+        {
+            "week_or_day": f"Week {i + 1} - {TOPICS[i % len(TOPICS)]}",
+            "assignments": [
+                {"title": task, "completed": rng.random() < 0.3}
+                for task in rng.sample(TASKS, 3)
+            ]
+        }
+        for i in range(weeks)
+    ]
+
+
+def make_sessions(rng, count, start):
+    sessions = []
+    for i in range(count):
+        started = start + timedelta(minutes=i * 90 + rng.randint(0, 60))
+        completed = rng.random() < 0.85
+        sessions.append({
+            "session_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "lesson_key": f"Week {i % 12 + 1} - {TOPICS[i % len(TOPICS)]}",
+            "assignment": f"{rng.choice(TASKS)} #{i}",
+            "start_time": started.isoformat(),
+            "end_time": (started + timedelta(minutes=rng.randint(10, 60))).isoformat() if completed else None,
+            "message_count": 0,
+            "summary": _sentence(rng, 20) if completed else None,
+            "what_worked": _sentence(rng) if completed else None,
+            "understood": _sentence(rng) if completed else None,
+            "difficulties": _sentence(rng) if completed else None,
+            "common_mistakes": rng.sample(MISTAKES, rng.randint(1, 3)) if completed else [],
+            "pdf_path": None,
+            "status": "completed" if completed else "in_progress"
+        })
+    return sessions
+
+
+def make_messages(rng, count, sessions, start, free_chat_ratio=0.2):
+    """Messages in user/assistant pairs, spread over the sessions in time order"""
+    messages = []
+    for i in range(0, count, 2):
+        timestamp = (start + timedelta(seconds=i * 30)).isoformat()
+        if sessions and rng.random() >= free_chat_ratio:
+            session = sessions[min(i * len(sessions) // max(count, 1), len(sessions) - 1)]
+            session_id = session["session_id"]
+            session["message_count"] += 2
+        else:
+            session_id = None
+        messages.append({"role": "user", "content": _sentence(rng), "timestamp": timestamp, "session_id": session_id})
+        if i + 1 < count:
+            messages.append({"role": "assistant", "content": _tutor_reply(rng), "timestamp": timestamp, "session_id": session_id})
+    return messages
+
+
+def make_vocabulary(rng, count):
+    vocabulary = []
+    for i in range(count):
+        word = f"{rng.choice(WORDS)}{i}"
+        if rng.random() < 0.02:
+            # Old format entries, as normalize_vocabulary has to handle them
+            vocabulary.append(word)
+        else:
+            vocabulary.append({"word": word, "translation": f"{word} (translated)", "example": _sentence(rng)})
+    return vocabulary
+
+
+def make_pdf_data(rng, items):
+    """pdf_generator review data with the given number of items per list"""
+    def items_of(prefix):
+        return [f"{prefix}: {_sentence(rng)}" for _ in range(items)]
+    return {
+        "objectives": _sentence(rng, 30),
+        "learnings": {
+            "grammar_points": items_of("Grammar"),
+            "vocabulary": items_of("Word"),
+            "structures": items_of("Structure"),
+            "key_concepts": items_of("Concept")
+        },
+        "improvements": {
+            "areas_to_focus": items_of("Area"),
+            "common_mistakes": items_of("Mistake"),
+            "recommendations": items_of("Recommendation")
+        }
+    }
+
+
+def generate_assets(directory, sessions=1000, messages=100000, words=10000, seed=0, user_id=None):
+    """
+    Write synthetic asset files into directory/assets, or into the user's
+    directory (directory/assets/users/<user_id>) if user_id is given
+
+    Returns:
+        dict: The generated data ("sessions", "messages", "vocabulary", "lesson_plan")
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 6, 9, 0)
+    data = {
+        "lesson_plan": make_lesson_plan(rng),
+        "sessions": make_sessions(rng, sessions, start),
+        "vocabulary": make_vocabulary(rng, words)
+    }
+    data["messages"] = make_messages(rng, messages, data["sessions"], start)
+
+    assets = os.path.join(directory, "assets", "users", user_id) if user_id else os.path.join(directory, "assets")
+    os.makedirs(assets, exist_ok=True)
+    files = {
+        "lesson_plan.json": data["lesson_plan"],
+        "lesson_plan_inputs.json": {"user_level": "Intermediate", "learning_period": "3 Months", "user_goals": "Business German"},
+        "session_summaries.json": data["sessions"],
+        "chat_history.json": data["messages"],
+        "user_vocabulary.json": data["vocabulary"],
+        "vocab_candidates.json": [
+            {"word": w, "context": _sentence(rng), "source": "suggestion", "first_seen": start.isoformat(), "count": 1}
+            for w in rng.sample(WORDS, 10)
+        ]
+    }
+    for name, content in files.items():
+        with open(os.path.join(assets, name), "w") as f:
+            json.dump(content, f, indent=2 if name == "session_summaries.json" else None)
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic tutor assets")
+    parser.add_argument("directory", help="Target directory (assets/ is created inside it)")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--user", help="Write into this user's directory instead of the single-user files")
+    args = parser.parse_args()
+    generate_assets(args.directory, args.sessions, args.messages, args.words, args.seed, args.user)
+    print(f"Synthetic assets written to {args.directory}")
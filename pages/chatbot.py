@@ -1,12 +1,19 @@
 import streamlit as st
-from utils import storage
+from utils import storage, dictionary_cache, vocab_harvester, quiz_pool, session_context, prompts, llm, opening_prefetch, session_analysis, chat_tasks, profiler, metrics, tenancy
 from sidebar import render_sidebar
 import openai
-import random
 import json
+import time
+import uuid
 
 st.set_page_config(page_title="Let's talk", page_icon="💬", layout="wide")
 
+# --- Profiling (add ?debug=1 to the URL for the timing panel) ---
+profiler.start_run("chatbot", force=st.query_params.get("debug") == "1")
+
+# --- Current user (logged-in user, or ?user=<id> in the URL) ---
+tenancy.init_user()
+
 # --- 💬 Chatbot Section ---
 st.title("💬 Let's Talk")
 st.write("Talk to your AI teaching assistant on any topic, ask for explanations of rules, useful vocabulary, or exercises.")
@@ -24,100 +31,106 @@ LANGUAGE = config.get('language', 'English')
 
 # AI Response Function from the whole history
 def get_ai_response_history(messages):
-    client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-    # Include system prompt if available
-    full_messages = [st.session_state.get("system_prompt")] if "system_prompt" in st.session_state else []
-    full_messages.extend(messages)
-    response = client.chat.completions.create(
+    # Stable system blocks first, conversation next, current assignment last
+    full_messages = prompts.assemble_messages(st.session_state.get("prompt_layout"), messages)
+    response = llm.complete(
+        "chat",
+        full_messages,
         model=OPENAI_MODEL,
-        messages=full_messages,
         temperature=TEMPERATURE
     )
+    prompts.record_usage("chat", response.usage)
     return response.choices[0].message.content
 
-# --- Load user level and goals ---
-lesson_plan_inputs = storage.load_lesson_plan_inputs()
-user_level = lesson_plan_inputs.get("user_level", "Beginner") if lesson_plan_inputs else "Beginner"
-user_goals = lesson_plan_inputs.get("user_goals", "") if lesson_plan_inputs else ""
+# Streamed AI response, cancelled if this browser session sends another message first
+def start_ai_response_task(messages):
+    full_messages = prompts.assemble_messages(st.session_state.get("prompt_layout"), messages)
+    return chat_tasks.start(
+        st.session_state.browser_session_id,
+        "chat",
+        full_messages,
+        model=OPENAI_MODEL,
+        temperature=TEMPERATURE,
+        on_usage=lambda usage: prompts.record_usage("chat", usage)
+    )
 
-# --- Get all previous session summaries for context ---
-session_summaries_context = storage.get_all_summaries()
+# --- System prompt with the previous session summaries most relevant to the current lesson ---
+def build_prompt_layout(lesson_key=None, assignment=None):
+    return session_context.build_chat_layout(config, lesson_key, assignment)
 
-# --- Initialize session state for messages if not present ---
-if "messages" not in st.session_state:
-    st.session_state.system_prompt = {"role": "system", "content": f"""
-        You are a friendly personal {LANGUAGE} language tutor, helping to improve speaking skills.
-        
-        **Student Profile:**
-        - Current level: {user_level}
-        - Learning goals: {user_goals if user_goals else "General language improvement"}
-        
-        {session_summaries_context}
-        
-        **Your role:**
-        - Speak only in {LANGUAGE}, but provide translations if requested.
-        - Plan lesson topics covering everyday situations, professional settings, and cultural aspects of {LANGUAGE} speaking countries.
-        - Provide a list of key words and phrases for each topic, along with examples of usage.
-        - Check user's answers to questions, correct mistakes, and explain grammar and pronunciation nuances. When correcting mistakes, you strike out incorrect words and write the correct ones in bold next to them, so the user can see errors. In the case of grammar mistakes, you remind the user of the relevant rule.
-        - Keep the conversation going, ask guiding questions, engage the user in dialogues, and help them develop fluency.
-        - Suggest more advanced vocabulary based on responses, ask follow-up questions, and encourage the user to use new words in context.
-        - Maintain a vocabulary list of new words and occasionally remind the user to use them in conversation.
-        - Recommend additional materials: movies, books, podcasts, and articles in {LANGUAGE}.
-        - Encourage the user to think in {LANGUAGE} and not be afraid of mistakes, creating a friendly and motivating learning environment.
-        - When practicing a specific assignment, monitor progress and suggest ending the session with a final test when you think the goals have been achieved.
-        """}
+# --- Initialize the prompt layout if not present ---
+if "messages" not in st.session_state or "prompt_layout" not in st.session_state:
+    st.session_state.prompt_layout = build_prompt_layout()
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# --- Id of this browser session, owner of its in-flight chat generation ---
+if "browser_session_id" not in st.session_state:
+    st.session_state.browser_session_id = uuid.uuid4().hex
+
 # --- Initialize current session ID if not present ---
 if "current_session_id" not in st.session_state:
     st.session_state.current_session_id = None
 
 # --- Handle session creation/continuation from lesson plan ---
 if "start_session_data" in st.session_state and st.session_state.start_session_data:
-    session_data = st.session_state.start_session_data
+    with profiler.section("start session"):
+        session_data = st.session_state.start_session_data
     
-    if session_data["action"] == "new":
-        # Create new session
-        session_id = storage.create_session(session_data["lesson_key"], session_data["assignment"])
-        st.session_state.current_session_id = session_id
-        st.session_state.messages = []
-        
-        # Add preset message
-        preset_message = f"Let's practice {session_data['assignment']}"
-        from datetime import datetime
-        st.session_state.messages.append({
-            "role": "user", 
-            "content": preset_message,
-            "timestamp": datetime.now().isoformat(),
-            "session_id": session_id
-        })
+        if session_data["action"] == "new":
+            # Create new session
+            session_id = storage.create_session(session_data["lesson_key"], session_data["assignment"])
+            st.session_state.current_session_id = session_id
+            st.session_state.prompt_layout = build_prompt_layout(session_data["lesson_key"], session_data["assignment"])
+            st.session_state.messages = []
         
-        # Get AI response
-        with st.spinner("Starting practice..."):
-            bot_reply = get_ai_response_history(st.session_state.messages)
+            # Add preset message
+            preset_message = opening_prefetch.opening_message(session_data['assignment'])
+            from datetime import datetime
             st.session_state.messages.append({
-                "role": "assistant", 
-                "content": bot_reply,
+                "role": "user", 
+                "content": preset_message,
                 "timestamp": datetime.now().isoformat(),
                 "session_id": session_id
             })
         
-        # Save to chat history
-        chat_history = storage.load_chat_history()
-        chat_history.extend(st.session_state.messages)
-        storage.save_chat_history(chat_history)
+            # Get AI response, prefetched from the lesson plan page when possible
+            bot_reply = opening_prefetch.take_opening(
+                storage.load_lesson_plan(),
+                session_data["lesson_key"],
+                session_data["assignment"],
+                st.session_state.prompt_layout,
+                ttl_minutes=config.get('opening_prefetch_ttl_minutes', opening_prefetch.DEFAULT_TTL_MINUTES)
+            )
+            with st.spinner("Starting practice..."):
+                if bot_reply is None:
+                    bot_reply = get_ai_response_history(st.session_state.messages)
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": bot_reply,
+                    "timestamp": datetime.now().isoformat(),
+                    "session_id": session_id
+                })
+                vocab_harvester.harvest_message(st.session_state.messages[-1])
+        
+            # Save to chat history
+            storage.append_messages(st.session_state.messages)
         
-    elif session_data["action"] == "continue":
-        # Load existing session
-        st.session_state.current_session_id = session_data["session_id"]
-        # Load last 20 messages from this session
-        st.session_state.messages = storage.get_recent_messages(session_data["session_id"], limit=20)
+        elif session_data["action"] == "continue":
+            # Load existing session
+            st.session_state.current_session_id = session_data["session_id"]
+            continued_session = storage.get_session(session_data["session_id"])
+            if continued_session:
+                st.session_state.prompt_layout = build_prompt_layout(
+                    continued_session["lesson_key"], continued_session["assignment"]
+                )
+            # Load last 20 messages from this session
+            st.session_state.messages = storage.get_recent_messages(session_data["session_id"], limit=20)
     
     # Clear the session data
     st.session_state.start_session_data = None
-    st.rerun()
+    profiler.rerun()
 
 # --- 📖 Vocabulary Panel ---
 render_sidebar()
@@ -140,8 +153,9 @@ if st.session_state.current_session_id:
 # --- Session Browser ---
 st.sidebar.markdown("### 📖 All Sessions")
 
-in_progress_sessions = storage.get_in_progress_sessions()
-completed_sessions = storage.get_completed_sessions()
+with profiler.section("session list"):
+    in_progress_sessions = storage.get_in_progress_sessions()
+    completed_sessions = storage.get_completed_sessions()
 
 if in_progress_sessions:
     with st.sidebar.expander(f"🟢 In Progress ({len(in_progress_sessions)})", expanded=False):
@@ -156,7 +170,7 @@ if in_progress_sessions:
                         "action": "continue",
                         "session_id": session["session_id"]
                     }
-                    st.rerun()
+                    profiler.rerun()
 
 if completed_sessions:
     with st.sidebar.expander(f"✅ Completed ({len(completed_sessions)})", expanded=False):
@@ -164,7 +178,7 @@ if completed_sessions:
             st.markdown(f"**{session['assignment']}**")
             st.caption(session['lesson_key'])
             if st.button("👁️ View", key=f"view_{session['session_id']}", help="View in History"):
-                st.switch_page("pages/history.py")
+                profiler.switch_page("pages/history.py")
 
 st.sidebar.markdown("---")
 
@@ -175,7 +189,7 @@ if st.sidebar.button("📄 Generate PDF Summary", use_container_width=True):
         st.sidebar.error("No messages to summarize!")
     else:
         with st.sidebar:
-            with st.spinner("Generating PDF..."):
+            with st.spinner("Generating PDF..."), profiler.section("pdf export"):
                 try:
                     from utils import pdf_generator
                     
@@ -183,13 +197,12 @@ if st.sidebar.button("📄 Generate PDF Summary", use_container_width=True):
                     if st.session_state.current_session_id:
                         # Session PDF
                         messages = storage.get_messages_by_session(st.session_state.current_session_id)
+                        # Also saves the PDF path to the session
                         pdf_path = pdf_generator.generate_session_pdf(
                             st.session_state.current_session_id,
                             messages,
                             LANGUAGE
                         )
-                        # Update session with PDF path
-                        storage.update_session(st.session_state.current_session_id, {"pdf_path": pdf_path})
                     else:
                         # Free chat PDF
                         pdf_path = pdf_generator.generate_free_chat_pdf(
@@ -216,26 +229,14 @@ if st.sidebar.button("📄 Generate PDF Summary", use_container_width=True):
 st.sidebar.markdown("---")
 
 # Load vocabulary list
-vocab_list = storage.load_vocabulary()
-
-# Ensure all entries are dictionaries with 'word', 'translation', and 'example'
-corrected_vocab_list = []
-for entry in vocab_list:
-    if isinstance(entry, str):
-        corrected_vocab_list.append({
-            "word": entry,
-            "translation": "None.",
-            "example": "None."
-        })
-    elif isinstance(entry, dict):
-        corrected_vocab_list.append({
-            "word": entry.get("word", "Unknown"),
-            "translation": entry.get("translation", "None."),
-            "example": entry.get("example", "None.")
-        })
+with profiler.section("vocabulary"):
+    vocab_list = storage.load_vocabulary()
+
+    # Ensure all entries are dictionaries with 'word', 'translation', and 'example'
+    corrected_vocab_list = storage.normalize_vocabulary(vocab_list)
 
-if corrected_vocab_list != vocab_list:
-    storage.save_vocabulary(corrected_vocab_list)
+    if corrected_vocab_list != vocab_list:
+        storage.save_vocabulary(corrected_vocab_list)
 
 vocab_list = corrected_vocab_list
 
@@ -246,47 +247,17 @@ new_word = st.sidebar.text_input("➕ Add a new word", key="new_vocab_word")
 
 if st.sidebar.button("Add Word"):
     if new_word.strip() and all(w["word"] != new_word.strip() for w in vocab_list):
-        # Generate translation and example using OpenAI
-        client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
-        prompt = f"""
-        You are a {LANGUAGE} language expert. For the word "{new_word}", provide:
-        1. A concise translation to English.
-        2. One example sentence in {LANGUAGE} using the word.
-
-        Format the response as:
-        Translation: <your translation>
-        Example: <your example>
-        """
-
+        # Check the shared dictionary cache before calling OpenAI
         with st.spinner(f"Fetching translation and example for '{new_word}'..."):
-            response = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=TEMPERATURE
+            new_entry = dictionary_cache.get_word_details(
+                new_word, LANGUAGE, OPENAI_MODEL, TEMPERATURE
             )
 
-        # Parse the response
-        content = response.choices[0].message.content
-        translation = ""
-        example = ""
-
-        for line in content.splitlines():
-            if line.startswith("Translation:"):
-                translation = line.replace("Translation:", "").strip()
-            elif line.startswith("Example:"):
-                example = line.replace("Example:", "").strip()
-
-        if translation and example:
+        if new_entry:
             # Add word with translation and example
-            vocab_list.append({
-                "word": new_word.strip(),
-                "translation": translation,
-                "example": example
-            })
-            storage.save_vocabulary(vocab_list)
+            vocab_list = storage.add_vocabulary([new_entry])
             st.success(f"Added '{new_word}' with translation and example.")
-            st.rerun()
+            profiler.rerun()
         else:
             st.error("Failed to fetch translation and example. Try again.")
 if vocab_list:
@@ -295,21 +266,54 @@ if vocab_list:
 else:
     st.sidebar.write("No words in your vocabulary.")
 
+# --- 🌱 Words harvested from the tutor's corrections and suggestions ---
+vocab_candidates = storage.load_vocab_candidates()
+if vocab_candidates:
+    with st.sidebar.expander(f"🌱 Suggested words ({len(vocab_candidates)})", expanded=False):
+        st.caption(", ".join(c["word"] for c in vocab_candidates))
+        if st.button("➕ Add suggested words", key="add_harvested_words"):
+            with st.spinner("Fetching translations and examples..."):
+                harvested = vocab_harvester.enrich_candidates(
+                    LANGUAGE, OPENAI_MODEL, TEMPERATURE,
+                    batch_size=config.get('harvest_batch_size', 10)
+                )
+            vocab_list = storage.add_vocabulary(harvested)
+            profiler.rerun()
+        if st.button("🗑️ Dismiss all", key="dismiss_harvested_words"):
+            try:
+                vocab_harvester.dismiss_candidates()
+            except storage.ConflictError as e:
+                st.error(f"Could not dismiss the suggested words ({e}). Try again.")
+            else:
+                profiler.rerun()
+
 # --- 📋 Quiz Button ---
+QUIZ_WORDS = config.get('quiz_words', 5)
+
+# Keep the quiz pool topped up in the background
+quiz_pool.refill_in_background(
+    vocab_list, LANGUAGE, OPENAI_MODEL, TEMPERATURE,
+    target_size=config.get('quiz_pool_size', 5),
+    threshold=config.get('quiz_pool_refill_threshold', 2),
+    words_per_quiz=QUIZ_WORDS
+)
+
 if st.sidebar.button("📝 Quiz!"):
     if len(vocab_list) < 1:
         st.sidebar.warning("Add at least one word to start a quiz.")
     else:
-        quiz_words = random.sample(vocab_list, min(10, len(vocab_list)))
-        quiz_word_list = [w["word"] for w in quiz_words]
-
-        quiz_prompt = f"""
-        You are a {LANGUAGE} language tutor. Create an engaging exercise using these words: {', '.join(quiz_word_list)}.
-        Format it as a quiz that the user can answer.
-        """
-
-        with st.spinner("Generating quiz..."):
-            quiz_response = get_ai_response_history(st.session_state.messages + [{"role": "user", "content": quiz_prompt}])
+        # Served instantly from the pre-generated pool, generated on demand only if it is empty
+        with profiler.section("quiz"):
+            quiz = quiz_pool.take_quiz(vocab_list)
+            if quiz:
+                quiz_response = quiz["content"]
+            else:
+                quiz_word_list = quiz_pool.get_due_words(vocab_list, QUIZ_WORDS)
+                with st.spinner("Generating quiz..."):
+                    quiz_response = quiz_pool.generate_quiz(
+                        quiz_word_list, LANGUAGE, OPENAI_MODEL, TEMPERATURE
+                    )
+                quiz_pool.record_quiz(quiz_word_list)
 
         from datetime import datetime
         st.session_state.messages.append({
@@ -320,9 +324,7 @@ if st.sidebar.button("📝 Quiz!"):
         })
         
         # Save to chat history
-        chat_history = storage.load_chat_history()
-        chat_history.append(st.session_state.messages[-1])
-        storage.save_chat_history(chat_history)
+        storage.append_messages([st.session_state.messages[-1]])
 
 # --- End Session Button ---
 if st.session_state.current_session_id:
@@ -330,12 +332,13 @@ if st.session_state.current_session_id:
     with col1:
         if st.button("✓ End Session", type="primary"):
             st.session_state.show_end_session_dialog = True
-            st.rerun()
+            profiler.rerun()
     with col2:
         if st.button("🔄 New Free Chat"):
             st.session_state.current_session_id = None
+            st.session_state.prompt_layout = build_prompt_layout()
             st.session_state.messages = []
-            st.rerun()
+            profiler.rerun()
 
 # --- End Session Dialog ---
 if st.session_state.get("show_end_session_dialog", False):
@@ -343,52 +346,20 @@ if st.session_state.get("show_end_session_dialog", False):
         st.subheader("End Session")
         st.write("Generating session summary...")
         
-        # Generate summary using AI
-        session = storage.get_session(st.session_state.current_session_id)
+        # Usually already computed by the speculative analysis started when the end was suggested
         session_messages = storage.get_messages_by_session(st.session_state.current_session_id)
-        
-        # Create summary prompt
-        conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in session_messages])
-        
-        summary_prompt = f"""
-        Analyze this {LANGUAGE} language learning session and provide a detailed summary in JSON format.
-        
-        Assignment: {session['assignment']}
-        Conversation:
-        {conversation_text[:4000]}  
-        
-        Provide your analysis as valid JSON with these exact fields:
-        {{
-            "summary": "2-3 sentence overview of what was practiced",
-            "what_worked": "What the student did well",
-            "understood": "Concepts/grammar/vocabulary the student understood",
-            "difficulties": "Areas where the student struggled",
-            "common_mistakes": ["mistake 1", "mistake 2"]
-        }}
-        
-        Return ONLY valid JSON, no other text.
-        """
-        
-        with st.spinner("Analyzing session..."):
-            client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-            response = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[{"role": "user", "content": summary_prompt}],
-                temperature=0.3
-            )
-            
-            import re
-            json_match = re.search(r'\{.*\}', response.choices[0].message.content, re.DOTALL)
-            if json_match:
-                summary_data = json.loads(json_match.group())
-            else:
-                summary_data = {
-                    "summary": "Session completed",
-                    "what_worked": "N/A",
-                    "understood": "N/A",
-                    "difficulties": "N/A",
-                    "common_mistakes": []
+        end_summary = st.session_state.get("end_session_summary")
+        if not end_summary or end_summary["session_id"] != st.session_state.current_session_id:
+            with st.spinner("Analyzing session..."), metrics.END_SESSION_SECONDS.time(step="summary"), \
+                    profiler.section("end session: summary"):
+                end_summary = {
+                    "session_id": st.session_state.current_session_id,
+                    # The version the summary is based on, checked when the session is completed
+                    "session": storage.get_session(st.session_state.current_session_id),
+                    "data": session_analysis.get_summary(st.session_state.current_session_id, LANGUAGE, OPENAI_MODEL)
                 }
+            st.session_state.end_session_summary = end_summary
+        summary_data = end_summary["data"]
         
         # Display summary
         st.markdown(f"**Summary:** {summary_data['summary']}")
@@ -401,20 +372,21 @@ if st.session_state.get("show_end_session_dialog", False):
         
         if confirm:
             # Save summary and complete session
-            storage.complete_session(st.session_state.current_session_id, summary_data)
-            storage.update_session(st.session_state.current_session_id, {"message_count": len(session_messages)})
+            with metrics.END_SESSION_SECONDS.time(step="save"), profiler.section("end session: save"):
+                storage.complete_session(st.session_state.current_session_id, summary_data, session=end_summary["session"])
+                storage.update_session(st.session_state.current_session_id, {"message_count": len(session_messages)})
             
             # Generate PDF automatically
-            with st.spinner("Generating PDF summary..."):
+            with st.spinner("Generating PDF summary..."), metrics.END_SESSION_SECONDS.time(step="pdf"), \
+                    profiler.section("end session: pdf"):
                 try:
                     from utils import pdf_generator
-                    pdf_path = pdf_generator.generate_session_pdf(
+                    # Also saves the PDF path to the session
+                    pdf_generator.generate_session_pdf(
                         st.session_state.current_session_id,
                         session_messages,
                         LANGUAGE
                     )
-                    # Save PDF path to session
-                    storage.update_session(st.session_state.current_session_id, {"pdf_path": pdf_path})
                     st.success("PDF summary generated!")
                 except Exception as e:
                     st.warning(f"Session saved, but PDF generation failed: {str(e)}")
@@ -423,17 +395,20 @@ if st.session_state.get("show_end_session_dialog", False):
             st.session_state.current_session_id = None
             st.session_state.messages = []
             st.session_state.show_end_session_dialog = False
+            st.session_state.end_session_summary = None
             st.success("Session ended and summary saved!")
-            st.rerun()
+            profiler.rerun()
         
         if cancel:
             st.session_state.show_end_session_dialog = False
-            st.rerun()
+            st.session_state.end_session_summary = None
+            profiler.rerun()
 
 # Display chat history
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.write(message["content"])
+with profiler.section("chat history"):
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
 
 # Chat interface
 user_input = st.chat_input("Type your message...")
@@ -452,11 +427,21 @@ if user_input:
     with st.chat_message("user"):
         st.write(user_input)
 
-    with st.spinner("Thinking..."):
-        bot_reply = get_ai_response_history(st.session_state.messages)
-
-    with st.chat_message("assistant"):
-        st.write(bot_reply)
+    # A rerun (e.g. another message sent meanwhile) interrupts this script and the task is cancelled
+    task = start_ai_response_task(st.session_state.messages)
+    try:
+        with st.chat_message("assistant"), profiler.timed("llm", "chat turn"):
+            bot_reply = st.write_stream(task.deltas())
+    except openai.OpenAIError as e:
+        # Keep the turn out of the history so it can simply be sent again
+        st.session_state.messages.pop()
+        st.error(f"The tutor could not answer right now ({e}). Please send your message again.")
+        profiler.stop()
+    finally:
+        chat_tasks.finish(st.session_state.browser_session_id, task)
+    metrics.CHAT_TURN_SECONDS.observe(time.perf_counter() - task.started_at)
+    if task.first_token_at is not None:
+        metrics.TIME_TO_FIRST_TOKEN_SECONDS.observe(task.first_token_at - task.started_at)
 
     # Add assistant message with metadata
     assistant_msg = {
@@ -466,15 +451,22 @@ if user_input:
         "session_id": st.session_state.current_session_id
     }
     st.session_state.messages.append(assistant_msg)
-    
-    # Save both messages to chat history
-    chat_history = storage.load_chat_history()
-    chat_history.extend([user_msg, assistant_msg])
-    storage.save_chat_history(chat_history)
+    with profiler.section("save turn"):
+        vocab_harvester.harvest_message(assistant_msg, [w["word"] for w in vocab_list])
+
+        # Save both messages to chat history
+        storage.append_messages([user_msg, assistant_msg])
     
     # Check if AI suggests ending session (only if in a session)
-    if st.session_state.current_session_id and "end this session" in bot_reply.lower():
+    if st.session_state.current_session_id and (
+        session_analysis.suggests_ending(bot_reply) or session_analysis.requests_ending(user_input)
+    ):
+        # Analyze the session now, so ending it does not wait for the summary
+        session_analysis.start_speculative(st.session_state.current_session_id, LANGUAGE, OPENAI_MODEL)
+    if st.session_state.current_session_id and session_analysis.suggests_ending(bot_reply):
         st.info("💡 The AI thinks you've mastered this topic. Consider ending the session!")
         if st.button("End Session Now"):
             st.session_state.show_end_session_dialog = True
-            st.rerun()
+            profiler.rerun()
+
+profiler.render_panel()
@@ -1,20 +1,27 @@
 import streamlit as st
-import json
+import pandas as pd
 from datetime import datetime
 from sidebar import render_sidebar
-from utils import storage
+from utils import storage, profiler, tenancy
 
 st.set_page_config(page_title="Lesson History", page_icon="📜")
+
+# --- Profiling (add ?debug=1 to the URL for the timing panel) ---
+profiler.start_run("history", force=st.query_params.get("debug") == "1")
+
+# --- Current user (logged-in user, or ?user=<id> in the URL) ---
+tenancy.init_user()
+
 st.title("📜 Lesson History")
 st.write("Review your completed sessions and practice history.")
 render_sidebar()
 st.sidebar.header("📜 History of your lessons")
 
 # --- Tabs for different views ---
-tab1, tab2, tab3, tab4 = st.tabs(["📚 Session Summaries", "📄 PDF Session Summaries", "💬 Free Chat History", "📊 All Messages"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["📚 Session Summaries", "📄 PDF Session Summaries", "💬 Free Chat History", "📊 All Messages", "📈 Mistake Trends"])
 
 # --- Tab 1: Session Summaries ---
-with tab1:
+with tab1, profiler.section("session summaries"):
     st.subheader("Session Summaries")
     
     completed_sessions = storage.get_completed_sessions()
@@ -101,7 +108,7 @@ with tab1:
                             st.markdown(f"**{role}:** {msg['content']}")
 
 # --- Tab 2: PDF Session Summaries (HTML Display) ---
-with tab2:
+with tab2, profiler.section("pdf summaries"):
     st.subheader("PDF Session Summaries")
     
     # Get both completed and in-progress sessions that have HTML files
@@ -111,7 +118,7 @@ with tab2:
     # Also scan for free chat HTML files
     import os
     import glob
-    pdf_dir = "assets/pdfs"
+    pdf_dir = tenancy.user_path("pdfs")
     free_chat_files = []
     if os.path.exists(pdf_dir):
         free_chat_pattern = os.path.join(pdf_dir, "free_chat_*.html")
@@ -176,7 +183,7 @@ with tab2:
             st.warning("Summary file not found. Generate it from the chatbot.")
 
 # --- Tab 3: Free Chat History ---
-with tab3:
+with tab3, profiler.section("free chat"):
     st.subheader("Free Chat (No Session)")
     
     # Get messages without session_id
@@ -187,17 +194,7 @@ with tab3:
         st.info("No free chat messages yet.")
     else:
         # Group by date
-        history_by_date = {}
-        for msg in free_chat_messages:
-            try:
-                msg_time = datetime.strptime(msg["timestamp"][:19], "%Y-%m-%dT%H:%M:%S")
-                date_str = msg_time.strftime("%Y-%m-%d")
-                
-                if date_str not in history_by_date:
-                    history_by_date[date_str] = []
-                history_by_date[date_str].append(msg)
-            except (ValueError, KeyError):
-                pass
+        history_by_date = storage.group_messages_by_date(free_chat_messages)
         
         # Display by date
         for date, messages in sorted(history_by_date.items(), reverse=True):
@@ -207,7 +204,7 @@ with tab3:
                     st.markdown(f"**{role}:** {msg['content']}")
 
 # --- Tab 4: All Messages ---
-with tab4:
+with tab4, profiler.section("all messages"):
     st.subheader("All Messages")
     
     chat_history = storage.load_chat_history()
@@ -216,17 +213,7 @@ with tab4:
         st.info("No messages yet.")
     else:
         # Group by date
-        history_by_date = {}
-        for msg in chat_history:
-            try:
-                msg_time = datetime.strptime(msg["timestamp"][:19], "%Y-%m-%dT%H:%M:%S")
-                date_str = msg_time.strftime("%Y-%m-%d")
-                
-                if date_str not in history_by_date:
-                    history_by_date[date_str] = []
-                history_by_date[date_str].append(msg)
-            except (ValueError, KeyError):
-                pass
+        history_by_date = storage.group_messages_by_date(chat_history)
         
         # Display by date
         for date, messages in sorted(history_by_date.items(), reverse=True):
@@ -235,3 +222,39 @@ with tab4:
                     role = "👤 User" if msg["role"] == "user" else "🤖 Assistant"
                     session_info = f" [Session: {msg.get('session_id', 'Free chat')}]" if msg.get('session_id') else " [Free chat]"
                     st.markdown(f"**{role}**{session_info}: {msg['content']}")
+
+# --- Tab 5: Mistake Trends ---
+with tab5, profiler.section("mistake trends"):
+    st.subheader("Recurring Mistakes")
+    
+    # Read from the incremental index, no need to rescan all sessions
+    top_mistakes = storage.get_top_mistakes(k=10)
+    
+    if not top_mistakes:
+        st.info("No mistakes recorded yet. They are collected when you end a session.")
+    else:
+        st.table(pd.DataFrame([
+            {
+                "Mistake": cluster["label"],
+                "Times": cluster["count"],
+                "Sessions": cluster["sessions"],
+                "Last seen": datetime.fromisoformat(cluster["last_seen"]).strftime("%Y-%m-%d")
+            }
+            for cluster in top_mistakes
+        ]))
+        
+        # Weekly occurrences of the most frequent mistakes
+        st.markdown("### 📅 Weekly trend")
+        trends = pd.DataFrame({
+            cluster["label"][:40]: pd.Series(cluster["by_week"])
+            for cluster in top_mistakes[:5]
+        }).fillna(0).sort_index()
+        st.line_chart(trends)
+        
+        for cluster in top_mistakes:
+            if len(cluster["variants"]) > 1:
+                with st.expander(f"🔎 {cluster['label']} ({len(cluster['variants'])} variants)"):
+                    for variant, count in sorted(cluster["variants"].items(), key=lambda v: v[1], reverse=True):
+                        st.markdown(f"- {variant} ({count}x)")
+
+profiler.render_panel()
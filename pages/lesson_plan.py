@@ -1,11 +1,17 @@
 import streamlit as st
-from utils import storage
+from utils import storage, llm, lesson_plan_stream, structured_output, lesson_plan_cache, session_context, opening_prefetch, session_analysis, profiler, tenancy
 from sidebar import render_sidebar 
 import json
-import re
 import openai
 
 st.set_page_config(page_title="Lesson Plan", page_icon="📚", layout="wide")
+
+# --- Profiling (add ?debug=1 to the URL for the timing panel) ---
+profiler.start_run("lesson_plan", force=st.query_params.get("debug") == "1")
+
+# --- Current user (logged-in user, or ?user=<id> in the URL) ---
+tenancy.init_user()
+
 render_sidebar()
 
 # --- Load Configuration from config.json ---
@@ -18,23 +24,31 @@ TEMPERATURE = config.get('temperature', 0.7)
 LANGUAGE = config.get('language', 'English')
 
 # --- 🛠️ Initialize Lesson Plan and User Inputs in Session State ---
-if "lesson_plan" not in st.session_state:
-    st.session_state.lesson_plan = storage.load_lesson_plan()
-
-if "lesson_plan_inputs" not in st.session_state:
-    # Load saved inputs or initialize defaults
-    saved_inputs = storage.load_lesson_plan_inputs()  # Implement this in storage
-    st.session_state.lesson_plan_inputs = saved_inputs or {
-        "user_level": "Beginner",
-        "learning_period": "1 Month",
-        "user_goals": ""
-    }
+with profiler.section("load plan"):
+    if "lesson_plan" not in st.session_state:
+        st.session_state.lesson_plan = storage.load_lesson_plan()
+
+    if "lesson_plan_inputs" not in st.session_state:
+        # Load saved inputs or initialize defaults
+        saved_inputs = storage.load_lesson_plan_inputs()  # Implement this in storage
+        st.session_state.lesson_plan_inputs = saved_inputs or {
+            "user_level": "Beginner",
+            "learning_period": "1 Month",
+            "user_goals": ""
+        }
 
 # --- 📚 Lesson Plan Section ---
 st.title("📚 Lesson Plan")
 st.write("You can edit your plan by removing or adding items. Press 'Practice' to start lesson on the selected topic.")
 st.write("Track your progress by crossing out the topics that you have already learned. Generate a new plan once your goals have changed.")
 
+# Warning left by an incomplete generation on the previous run
+lesson_plan_warning = st.session_state.pop("lesson_plan_warning", None)
+if lesson_plan_warning:
+    st.warning(lesson_plan_warning)
+
+# Lesson plan entries are rendered here while they are being generated
+plan_preview = st.container()
 
 with st.sidebar:
     st.header("📚 Generate a Lesson Plan")
@@ -57,7 +71,15 @@ with st.sidebar:
         value=st.session_state.lesson_plan_inputs["user_goals"]
     )
 
-    if st.button("📜 Generate Lesson Plan"):
+    generate = st.button("📜 Generate Lesson Plan")
+    # Same inputs give the stored plan, regenerating always asks the model for a new one
+    regenerate = st.button("🔄 Regenerate (new plan)")
+
+    cache_stats = lesson_plan_cache.get_stats()
+    if cache_stats["hit_rate"] is not None:
+        st.caption(f"Plan cache: {cache_stats['entries']} plans, {cache_stats['hit_rate']:.0%} hit rate")
+
+    if generate or regenerate:
         # Save user inputs to session state and storage
         st.session_state.lesson_plan_inputs = {
             "user_level": user_level,
@@ -67,8 +89,6 @@ with st.sidebar:
         storage.save_lesson_plan_inputs(st.session_state.lesson_plan_inputs)  # Implement in storage
 
         # OpenAI API Call to Generate Lesson Plan
-        client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
         lesson_prompt = f"""
         You are an AI that generates structured **lesson plans** for learning {LANGUAGE}.
         - The user is at **{user_level}** level.
@@ -80,11 +100,11 @@ with st.sidebar:
         - Use this exact JSON format:
         ```json
         {{
-            "lesson_plan": {{
-                "Week 1 - Meeting new people": ["Introduce yourself, your occupation and hobbies", "Role play: meeting new people", "Describe your day"],
-                "Week 2 - Travel and transport": ["Buying tickets, asking for directions", "Describe your latest journey", "Conversation at a hotel, at a railway station"],
-                "Week 3 - Home, family and friends": ["Describe your apartment", "Describe your friends and family members", "Inviting guests"]
-            }}
+            "lesson_plan": [
+                {{"week_or_day": "Week 1 - Meeting new people", "assignments": ["Introduce yourself, your occupation and hobbies", "Role play: meeting new people", "Describe your day"]}},
+                {{"week_or_day": "Week 2 - Travel and transport", "assignments": ["Buying tickets, asking for directions", "Describe your latest journey", "Conversation at a hotel, at a railway station"]}},
+                {{"week_or_day": "Week 3 - Home, family and friends", "assignments": ["Describe your apartment", "Describe your friends and family members", "Inviting guests"]}}
+            ]
         }}
         ```
         - If **duration is less than 2 weeks**, use `"Day X - Topic"` format.
@@ -93,40 +113,68 @@ with st.sidebar:
         - **Return only valid JSON**.
         """
 
-        with st.spinner("Generating lesson plan..."):
-            response = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You generate structured JSON lesson plans only."},
-                    {"role": "user", "content": lesson_prompt}
-                ],
-                temperature=TEMPERATURE
-            )
-
-        # Extract JSON from response safely
-        json_match = re.search(r'\{.*\}', response.choices[0].message.content, re.DOTALL)
-
-        if json_match:
-            try:
-                lesson_plan_json = json.loads(json_match.group())
-
-                if "lesson_plan" in lesson_plan_json:
-                    # Convert JSON into structured lesson format
-                    formatted_plan = [
-                        {"week_or_day": key, "assignments": [{"title": task, "completed": False} for task in value]}
-                        for key, value in lesson_plan_json["lesson_plan"].items()
-                    ]
-
-                    # Save lesson plan
-                    st.session_state.lesson_plan = formatted_plan
-                    storage.save_lesson_plan(st.session_state.lesson_plan)
-                    st.rerun()
-                else:
-                    st.error("Error: AI response did not include 'lesson_plan' key. Try again.")
-            except json.JSONDecodeError:
-                st.error("Error: AI response was not valid JSON. Try again.")
+        plan_key = lesson_plan_cache.cache_key(LANGUAGE, user_level, learning_period, user_goals, OPENAI_MODEL)
+        cached_entries = None if regenerate else lesson_plan_cache.get_plan(plan_key)
+
+        stream_error = None
+        partial = False
+        if cached_entries:
+            plan_entries = cached_entries
         else:
-            st.error("Error: AI did not return JSON. Please try again.")
+            # Stream the plan and show each week/day as soon as it is complete
+            parser = lesson_plan_stream.LessonPlanStreamParser()
+            with plan_preview:
+                st.subheader("✨ Your new lesson plan")
+                with st.spinner("Generating lesson plan..."), profiler.section("generate plan"):
+                    try:
+                        for delta in llm.stream(
+                            "lesson_plan",
+                            [
+                                {"role": "system", "content": "You generate structured JSON lesson plans only."},
+                                {"role": "user", "content": lesson_prompt}
+                            ],
+                            model=OPENAI_MODEL,
+                            temperature=TEMPERATURE,
+                            **structured_output.structured_kwargs("lesson_plan")
+                        ):
+                            for key, tasks in parser.feed(delta):
+                                st.markdown(f"### 🔹 {key}")
+                                st.markdown("\n".join(f"- {task}" for task in tasks))
+                    except openai.OpenAIError as e:
+                        stream_error = e
+
+            if not stream_error:
+                structured_output.record_outcome(
+                    "lesson_plan",
+                    parse_failed=not parser.entries,
+                    invalid=bool(parser.errors) or not parser.finished
+                )
+            plan_entries = parser.entries
+            partial = bool(stream_error or parser.errors or not parser.finished)
+            if plan_entries and not partial:
+                lesson_plan_cache.put_plan(plan_key, plan_entries)
+
+        if plan_entries:
+            # Convert entries into structured lesson format, keeping everything that parsed cleanly
+            formatted_plan = [
+                {"week_or_day": key, "assignments": [{"title": task, "completed": False} for task in tasks]}
+                for key, tasks in plan_entries
+            ]
+
+            # Save lesson plan
+            st.session_state.lesson_plan = formatted_plan
+            with profiler.section("save plan"):
+                storage.save_lesson_plan(st.session_state.lesson_plan)
+            if partial:
+                st.session_state.lesson_plan_warning = (
+                    f"The lesson plan was only partly generated, {len(plan_entries)} entries were kept. "
+                    "Generate again for a complete plan."
+                )
+            profiler.rerun()
+        elif stream_error:
+            st.error(f"Error: could not generate the lesson plan ({stream_error}). Try again.")
+        else:
+            st.error("Error: AI did not return a valid lesson plan. Please try again.")
 
 # --- Practice Dialog ---
 if st.session_state.get("practice_dialog", {}).get("show", False):
@@ -142,7 +190,7 @@ if st.session_state.get("practice_dialog", {}).get("show", False):
                 "session_id": dialog["existing_session_id"]
             }
             st.session_state.practice_dialog = {"show": False}
-            st.switch_page("pages/chatbot.py")
+            profiler.switch_page("pages/chatbot.py")
     
     with col2:
         if st.button("🔄 Start New Session"):
@@ -152,12 +200,12 @@ if st.session_state.get("practice_dialog", {}).get("show", False):
                 "assignment": dialog["assignment"]
             }
             st.session_state.practice_dialog = {"show": False}
-            st.switch_page("pages/chatbot.py")
+            profiler.switch_page("pages/chatbot.py")
     
     with col3:
         if st.button("❌ Cancel"):
             st.session_state.practice_dialog = {"show": False}
-            st.rerun()
+            profiler.rerun()
     
     st.markdown("---")
 
@@ -193,13 +241,15 @@ else:
                 # Update completion status
                 if completed != assignment["completed"]:
                     st.session_state.lesson_plan[i]["assignments"][j]["completed"] = completed
-                    storage.save_lesson_plan(st.session_state.lesson_plan)
+                    # Applied to the stored plan, so changes made in another tab are kept
+                    storage.set_assignment_completed(lesson["week_or_day"], assignment["title"], completed)
                     
                     # If marking as completed, check if there's an active session to end
                     if completed:
                         session = storage.get_session_by_assignment(lesson["week_or_day"], assignment["title"])
                         if session and session["status"] == "in_progress":
                             # Auto-trigger session end (user will need to confirm in chatbot)
+                            session_analysis.start_speculative(session["session_id"], LANGUAGE, OPENAI_MODEL)
                             st.info(f"💡 Assignment completed! Remember to end the session in the chatbot.")
 
             # Play button to practice this item
@@ -219,7 +269,7 @@ else:
                             "assignment": assignment["title"],
                             "existing_session_id": existing_session["session_id"]
                         }
-                        st.rerun()
+                        profiler.rerun()
                     else:
                         # No existing session, create new one
                         st.session_state.start_session_data = {
@@ -227,19 +277,30 @@ else:
                             "lesson_key": lesson["week_or_day"],
                             "assignment": assignment["title"]
                         }
-                        st.switch_page("pages/chatbot.py")
+                        profiler.switch_page("pages/chatbot.py")
 
             # Delete button to remove task
             with col3:
                 if st.button("❌", key=f"delete_{i}_{j}"):
-                    del st.session_state.lesson_plan[i]["assignments"][j]
-                    storage.save_lesson_plan(st.session_state.lesson_plan)
-                    st.rerun()
+                    st.session_state.lesson_plan = storage.remove_assignment(lesson["week_or_day"], assignment["title"])
+                    profiler.rerun()
 
         # Add a new assignment under each week/day
         new_task = st.text_input(f"➕ Add task for {lesson['week_or_day']}", key=f"new_task_{i}")
         if st.button(f"Add to {lesson['week_or_day']}", key=f"add_task_{i}"):
             if new_task.strip():
-                st.session_state.lesson_plan[i]["assignments"].append({"title": new_task.strip(), "completed": False})
-                storage.save_lesson_plan(st.session_state.lesson_plan)
-                st.rerun()
+                st.session_state.lesson_plan = storage.add_assignment(lesson["week_or_day"], new_task.strip())
+                profiler.rerun()
+
+    # Prepare the opening tutor turn of the next assignments, so practice starts immediately
+    with profiler.section("opening prefetch"):
+        opening_prefetch.prefetch_in_background(
+            st.session_state.lesson_plan,
+            lambda lesson_key, assignment: session_context.build_chat_layout(config, lesson_key, assignment),
+            OPENAI_MODEL,
+            TEMPERATURE,
+            count=config.get('opening_prefetch_count', opening_prefetch.DEFAULT_PREFETCH_COUNT),
+            ttl_minutes=config.get('opening_prefetch_ttl_minutes', opening_prefetch.DEFAULT_TTL_MINUTES)
+        )
+
+profiler.render_panel()
@@ -1,11 +1,17 @@
 import streamlit as st
-from utils import storage
+from utils import storage, dictionary_cache, profiler, tenancy
 from sidebar import render_sidebar
 import pandas as pd
-import openai
 import json
 
 st.set_page_config(page_title="Vocabulary", page_icon="📚", layout="wide")
+
+# --- Profiling (add ?debug=1 to the URL for the timing panel) ---
+profiler.start_run("vocab", force=st.query_params.get("debug") == "1")
+
+# --- Current user (logged-in user, or ?user=<id> in the URL) ---
+tenancy.init_user()
+
 render_sidebar()
 
 # --- Load Configuration from config.json ---
@@ -18,26 +24,14 @@ TEMPERATURE = config.get('temperature', 0.7)
 LANGUAGE = config.get('language', 'English')
 
 # --- Load Vocabulary ---
-vocab_list = storage.load_vocabulary()
-
-# Ensure all entries are dictionaries with 'word', 'translation', and 'example'
-corrected_vocab_list = []
-for entry in vocab_list:
-    if isinstance(entry, str):
-        corrected_vocab_list.append({
-            "word": entry,
-            "translation": "None.",
-            "example": "None."
-        })
-    elif isinstance(entry, dict):
-        corrected_vocab_list.append({
-            "word": entry.get("word", "Unknown"),
-            "translation": entry.get("translation", "None."),
-            "example": entry.get("example", "None.")
-        })
-
-if corrected_vocab_list != vocab_list:
-    storage.save_vocabulary(corrected_vocab_list)
+with profiler.section("load vocabulary"):
+    vocab_list = storage.load_vocabulary()
+
+    # Ensure all entries are dictionaries with 'word', 'translation', and 'example'
+    corrected_vocab_list = storage.normalize_vocabulary(vocab_list)
+
+    if corrected_vocab_list != vocab_list:
+        storage.save_vocabulary(corrected_vocab_list)
 
 vocab_list = corrected_vocab_list
 
@@ -54,9 +48,8 @@ if vocab_list:
         col1, col2 = st.sidebar.columns([0.7, 0.3])  # Adjust for better alignment
         col1.markdown(f"**{word_entry['word']}**")  # Display word
         if col2.button("❌", key=f"delete_{i}"):  # Inline delete button
-            vocab_list.pop(i)
-            storage.save_vocabulary(vocab_list)
-            st.rerun()  # Refresh UI after deletion
+            storage.remove_vocabulary_word(word_entry["word"])
+            profiler.rerun()  # Refresh UI after deletion
 else:
     st.sidebar.write("No words in your vocabulary.")
 
@@ -82,51 +75,19 @@ new_word = st.sidebar.text_input("New word", key="new_vocab_word")
 
 if st.sidebar.button("Add Word"):
     if new_word.strip() and all(w["word"] != new_word.strip() for w in vocab_list):
-        # Generate explanation and example using OpenAI
-        client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
-        prompt = f"""
-        You are a {LANGUAGE} language expert. For the word "{new_word}", provide:
-        1. A concise translation to English.
-        2. One example sentence in {LANGUAGE} using the word.
-
-        Format the response as:
-        Translation: <your translation>
-        Example: <your example>
-        """
-
-        with st.spinner(f"Fetching translation and example for '{new_word}'..."):
+        with st.spinner(f"Fetching translation and example for '{new_word}'..."), profiler.section("add word"):
             try:
-                response = client.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    messages=[{"role": "system", "content": "You provide translation and examples in {LANGUAGE}."},
-                              {"role": "user", "content": prompt}],
-                    temperature=TEMPERATURE
+                # Checks the shared dictionary cache before calling OpenAI
+                new_entry = dictionary_cache.get_word_details(
+                    new_word, LANGUAGE, OPENAI_MODEL, TEMPERATURE
                 )
 
-                # Parse the response
-                content = response.choices[0].message.content.strip()
-                translation, example = "", ""
-
-                for line in content.splitlines():
-                    if line.startswith("Translation:"):
-                        translation = line.replace("Translation:", "").strip()
-                    elif line.startswith("Example:"):
-                        example = line.replace("Example:", "").strip()
-
-                if translation and example:
-                    new_entry = {
-                        "word": new_word.strip(),
-                        "translation": translation,
-                        "example": example
-                    }
-                    
+                if new_entry:
                     # Save immediately after generation
-                    vocab_list.append(new_entry)
-                    storage.save_vocabulary(vocab_list)
+                    storage.add_vocabulary([new_entry])
                     
                     st.success(f"Added '{new_word}' with translation and example.")
-                    st.rerun()
+                    profiler.rerun()
                 else:
                     st.error("Failed to parse translation and example. Please try again.")
 
@@ -134,3 +95,5 @@ if st.sidebar.button("Add Word"):
                 st.error(f"Error fetching data from OpenAI API: {e}")
     else:
         st.warning("Please enter a unique word.")
+
+profiler.render_panel()
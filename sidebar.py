@@ -1,4 +1,5 @@
 import streamlit as st
+from utils import profiler, tenancy
 
 def render_sidebar():
     # --- Hide Default Sidebar Navigation ---
@@ -41,22 +42,26 @@ def render_sidebar():
 
     # Main Page Icon 🪐
     if col1.button("🪐", key="icon_app", help="Home"):
-        st.switch_page("app.py")
+        profiler.switch_page("app.py")
 
     # Chatbot Icon 💬
     if col2.button("💬", key="icon_chatbot", help="Let's Talk"):
-        st.switch_page("pages/chatbot.py")
+        profiler.switch_page("pages/chatbot.py")
 
     # Vocabulary Icon 📖
     if col3.button("📖", key="icon_vocab", help="Vocabulary"):
-        st.switch_page("pages/vocab.py")
+        profiler.switch_page("pages/vocab.py")
 
     # Lesson Plan Icon 📚
     if col4.button("📚", key="icon_lesson_plan", help="Lesson Plan"):
-        st.switch_page("pages/lesson_plan.py")
+        profiler.switch_page("pages/lesson_plan.py")
 
     # History Icon 📜
     if col5.button("📜", key="icon_history", help="History"):
-        st.switch_page("pages/history.py")
+        profiler.switch_page("pages/history.py")
 
     st.sidebar.markdown('</div>', unsafe_allow_html=True)
+
+    # Show whose data this is when several learners share the server
+    if tenancy.current_user_id() != tenancy.DEFAULT_USER_ID:
+        st.sidebar.caption(f"👤 {tenancy.current_user_id()}")
@@ -0,0 +1,176 @@
+import logging
+import queue
+import threading
+import time
+
+import openai
+
+from utils import llm, llm_scheduler, metrics, tenancy
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_tasks = {}  # owner (browser session) -> its current ChatTask
+_stats = {
+    "started": 0,
+    "completed": 0,
+    "cancelled": 0,
+    "failed": 0,
+    "wasted_prompt_tokens": 0,
+    "wasted_completion_tokens": 0
+}
+
+_DONE = object()
+
+
+class ChatTask:
+    """
+    A streamed chat completion running in a background thread. The browser
+    session's script reads the deltas; cancel() stops the stream at once,
+    also before its first token, and closes the upstream response.
+    """
+
+    def __init__(self, call_type, messages, on_usage=None, **kwargs):
+        self.text = ""
+        self.usage = None
+        self.error = None
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self._on_usage = on_usage
+        self._messages = messages
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(
+            target=tenancy.bind(self._run), args=(call_type, messages, kwargs), name="chat-task", daemon=True
+        )
+        self._thread.start()
+
+    def _set_usage(self, usage):
+        self.usage = usage
+        if self._on_usage:
+            self._on_usage(usage)
+
+    def _run(self, call_type, messages, kwargs):
+        completed = False
+        deltas = None
+        try:
+            deltas = llm.stream(call_type, messages, on_usage=self._set_usage, cancel=self._cancelled, **kwargs)
+            for delta in deltas:
+                if self._cancelled.is_set():
+                    break
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                self.text += delta
+                self._queue.put(delta)
+            else:
+                completed = not self._cancelled.is_set()
+        except openai.OpenAIError as e:
+            self.error = e
+        except Exception as e:
+            # Reported like an API error, so the turn is not saved with an empty reply
+            logger.exception("Chat generation failed")
+            self.error = openai.OpenAIError(f"{type(e).__name__}: {e}")
+            self.error.__cause__ = e
+        finally:
+            if deltas is not None:
+                # Closes the upstream response if it is still open, and gives back the
+                # scheduler slot and circuit breaker trial held by the stream
+                deltas.close()
+            self._finished.set()
+            self._queue.put(_DONE)
+            _record(self, completed)
+
+    def cancel(self):
+        """Abort the generation (no effect once it has finished)"""
+        if not self._finished.is_set():
+            self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def deltas(self):
+        """
+        Yield content deltas as they arrive
+
+        Raises:
+            openai.OpenAIError: If the generation failed
+        """
+        while True:
+            delta = self._queue.get()
+            if delta is _DONE:
+                break
+            yield delta
+        if self.error is not None:
+            raise self.error
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+
+def _record(task, completed):
+    with _lock:
+        if completed:
+            result = "completed"
+        elif task.error is not None:
+            result = "failed"
+        else:
+            # Everything this request consumed was thrown away
+            result = "cancelled"
+            prompt_tokens = llm_scheduler.estimate_prompt_tokens(task._messages)
+            completion_tokens = len(task.text) // 4
+            _stats["wasted_prompt_tokens"] += prompt_tokens
+            _stats["wasted_completion_tokens"] += completion_tokens
+            metrics.CHAT_WASTED_TOKENS.inc(prompt_tokens, direction="in")
+            metrics.CHAT_WASTED_TOKENS.inc(completion_tokens, direction="out")
+            logger.info("Chat generation cancelled after %d characters", len(task.text))
+        _stats[result] += 1
+    metrics.CHAT_GENERATIONS.inc(result=result)
+
+
+def start(owner, call_type, messages, **kwargs):
+    """
+    Start a chat generation for a browser session, cancelling the one it
+    still has running (its result would be discarded by the rerun anyway)
+
+    Args:
+        owner: Id of the browser session
+        call_type: llm call type
+        messages: Full message list
+        **kwargs: Passed to llm.stream (model, temperature, on_usage...)
+
+    Returns:
+        ChatTask: The new task
+    """
+    with _lock:
+        previous = _tasks.get(owner)
+    if previous is not None:
+        previous.cancel()
+    task = ChatTask(call_type, messages, **kwargs)
+    with _lock:
+        _tasks[owner] = task
+        _stats["started"] += 1
+    metrics.CHAT_GENERATIONS.inc(result="started")
+    return task
+
+
+def finish(owner, task):
+    """Cancel the task if it is still running and forget it"""
+    task.cancel()
+    with _lock:
+        if _tasks.get(owner) is task:
+            del _tasks[owner]
+
+
+def get_stats():
+    """
+    Returns:
+        dict: started, completed, cancelled and failed generations, estimated wasted tokens
+              and the number of generations running right now
+    """
+    with _lock:
+        return dict(_stats, running=sum(not t._finished.is_set() for t in _tasks.values()))
+
+
+metrics.CHAT_GENERATIONS_RUNNING.set_function(lambda: get_stats()["running"])
@@ -0,0 +1,277 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import openai
+
+from utils import llm, structured_output, metrics, safe_files
+
+DICTIONARY_CACHE_FILE = "assets/dictionary_cache.json"
+DEFAULT_MAX_ENTRIES = 5000
+
+# One in-process copy shared by every browser session on the server. Recency is
+# tracked here and written out, merged with the file, when an entry is added.
+_cache = None
+_lock = threading.Lock()
+_max_entries_setting = None
+
+
+def _load_config():
+    with open('utils/config.json', 'r') as f:
+        return json.load(f)
+
+
+def _max_entries():
+    """Size cap from config, read once per process"""
+    global _max_entries_setting
+    if _max_entries_setting is None:
+        _max_entries_setting = _load_config().get('dictionary_cache_size', DEFAULT_MAX_ENTRIES)
+    return _max_entries_setting
+
+
+def _normalize(word):
+    """Normalize a word so 'Haus', ' haus ' and 'HAUS' share one entry"""
+    return " ".join(word.strip().split()).casefold()
+
+
+def _key(language, word):
+    return f"{language.casefold()}:{_normalize(word)}"
+
+
+def _read_file():
+    try:
+        with open(DICTIONARY_CACHE_FILE, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        entries = []
+    return OrderedDict((_key(e["language"], e["word"]), e) for e in entries)
+
+
+def _load_cache():
+    """Load the cache from disk (once per process), oldest entries first"""
+    global _cache
+    if _cache is None:
+        _cache = _read_file()
+    return _cache
+
+
+def _save_cache():
+    """
+    Merge the in-process cache into the file, keeping entries other processes
+    added meanwhile and the most recent use of each entry, and reload it
+    """
+    global _cache
+    os.makedirs(os.path.dirname(DICTIONARY_CACHE_FILE), exist_ok=True)
+    with safe_files.locked(DICTIONARY_CACHE_FILE):
+        merged = _read_file()
+        for key, entry in _cache.items():
+            if key not in merged or entry.get("last_used", "") >= merged[key].get("last_used", ""):
+                merged[key] = entry
+        _cache = OrderedDict(sorted(merged.items(), key=lambda item: item[1].get("last_used", "")))
+        _evict(_max_entries())
+        safe_files.atomic_write(DICTIONARY_CACHE_FILE, json.dumps(list(_cache.values()), ensure_ascii=False))
+
+
+def _evict(max_entries):
+    """Drop least recently used entries until the cache fits its size cap"""
+    while len(_cache) > max_entries:
+        _cache.popitem(last=False)
+
+
+def get_entry(word, language):
+    """Return the cached translation/example for a word, or None"""
+    with _lock:
+        cache = _load_cache()
+        key = _key(language, word)
+        entry = cache.get(key)
+        metrics.CACHE_REQUESTS.inc(cache="dictionary", result="miss" if entry is None else "hit")
+        if entry is None:
+            return None
+        # Only in memory, the file gets it with the next put_entry
+        cache.move_to_end(key)
+        entry["last_used"] = datetime.now().isoformat()
+        return {"word": word.strip(), "translation": entry["translation"], "example": entry["example"]}
+
+
+def put_entry(word, language, translation, example):
+    """Store a translation/example for a word, evicting old entries if needed"""
+    with _lock:
+        cache = _load_cache()
+        key = _key(language, word)
+        cache[key] = {
+            "language": language,
+            "word": word.strip(),
+            "translation": translation,
+            "example": example,
+            "last_used": datetime.now().isoformat()
+        }
+        cache.move_to_end(key)
+        _save_cache()
+
+
+def fetch_word_details(word, language, model, temperature, api_key=None):
+    """
+    Ask the model for a translation and an example sentence
+
+    Returns:
+        tuple: (translation, example), empty strings if parsing failed
+    """
+    prompt = f"""
+    You are a {language} language expert. For the word "{word}", provide:
+    1. A concise translation to English.
+    2. One example sentence in {language} using the word.
+
+    Format the response as:
+    Translation: <your translation>
+    Example: <your example>
+    """
+
+    content = llm.complete_text(
+        "vocab",
+        [{"role": "system", "content": f"You provide translation and examples in {language}."},
+         {"role": "user", "content": prompt}],
+        model=model,
+        temperature=temperature,
+        api_key=api_key
+    ).strip()
+    translation, example = "", ""
+    for line in content.splitlines():
+        if line.startswith("Translation:"):
+            translation = line.replace("Translation:", "").strip()
+        elif line.startswith("Example:"):
+            example = line.replace("Example:", "").strip()
+    return translation, example
+
+
+def get_word_details(word, language, model, temperature, api_key=None):
+    """
+    Get translation and example for a word, from the cache when possible
+
+    Returns:
+        dict: {"word", "translation", "example"} or None if the model answer could not be parsed
+    """
+    cached = get_entry(word, language)
+    if cached:
+        return cached
+
+    translation, example = fetch_word_details(word.strip(), language, model, temperature, api_key)
+    if not (translation and example):
+        return None
+
+    put_entry(word, language, translation, example)
+    return {"word": word.strip(), "translation": translation, "example": example}
+
+
+def fetch_words_details(words, language, model, temperature, api_key=None):
+    """
+    Ask the model for translations and examples of several words in one call
+
+    Returns:
+        dict: word -> (translation, example) for every word the model answered
+    """
+    prompt = f"""
+    You are a {language} language expert. For each of these words or phrases: {json.dumps(words, ensure_ascii=False)}
+    provide a concise translation to English and one example sentence in {language} using it.
+
+    Return ONLY valid JSON, no other text:
+    {{"words": [{{"word": "<word as given>", "translation": "<translation>", "example": "<example>"}}]}}
+    """
+
+    data = structured_output.request_structured(
+        "word_details",
+        [{"role": "system", "content": f"You provide translation and examples in {language}."},
+         {"role": "user", "content": prompt}],
+        call_type="vocab",
+        model=model,
+        temperature=temperature,
+        api_key=api_key
+    )
+    items = data["words"]
+
+    requested = {_normalize(w): w for w in words}
+    details = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        word = requested.get(_normalize(str(item.get("word", ""))))
+        if word and item.get("translation") and item.get("example"):
+            details[word] = (item["translation"], item["example"])
+    return details
+
+
+def get_words_details(words, language, model, temperature, api_key=None):
+    """
+    Batched version of get_word_details: cached words are served from the cache,
+    the rest are enriched with a single model call
+
+    Returns:
+        list: {"word", "translation", "example"} entries for the words that could be enriched
+    """
+    words = [w.strip() for w in words if w.strip()]
+    entries = {}
+    missing = []
+    for word in words:
+        cached = get_entry(word, language)
+        if cached:
+            entries[word] = cached
+        else:
+            missing.append(word)
+
+    if missing:
+        for word, (translation, example) in fetch_words_details(missing, language, model, temperature, api_key).items():
+            put_entry(word, language, translation, example)
+            entries[word] = {"word": word, "translation": translation, "example": example}
+
+    return [entries[w] for w in words if w in entries]
+
+
+def warm_up(words, language, model, temperature, api_key=None):
+    """
+    Pre-populate the cache from a word list, skipping words already cached
+
+    Returns:
+        tuple: (number of words fetched, number of words that failed)
+    """
+    fetched, failed = 0, 0
+    for word in words:
+        if not word.strip() or get_entry(word, language):
+            continue
+        try:
+            translation, example = fetch_word_details(word.strip(), language, model, temperature, api_key)
+        except openai.OpenAIError as e:
+            print(f"  ! {word}: {e}")
+            failed += 1
+            continue
+        if translation and example:
+            put_entry(word, language, translation, example)
+            fetched += 1
+            print(f"  + {word}")
+        else:
+            failed += 1
+            print(f"  ! {word}: could not parse response")
+    return fetched, failed
+
+
+if __name__ == "__main__":
+    # Usage: python -m utils.dictionary_cache words.txt [language]
+    if len(sys.argv) < 2:
+        print("Usage: python -m utils.dictionary_cache <word_list.txt> [language]")
+        sys.exit(1)
+
+    config = _load_config()
+    language = sys.argv[2] if len(sys.argv) > 2 else config.get('language', 'English')
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        words = [line.strip() for line in f if line.strip()]
+
+    print(f"Warming up {language} dictionary cache with {len(words)} words...")
+    fetched, failed = warm_up(
+        words,
+        language,
+        config.get('openai_model_name', 'gpt-4o'),
+        config.get('temperature', 0.7),
+        api_key=None
+    )
+    print(f"Done: {fetched} fetched, {failed} failed.")
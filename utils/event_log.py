@@ -0,0 +1,237 @@
+# Append-only event logs for JSON documents that change a little at a time.
+#
+# A document (e.g. session_summaries.json) is kept as:
+#   <path>                  the document as it was before it had a log (optional, never rewritten)
+#   <path>.events.jsonl     one line per change: {"seq", "time", "op", "args"}
+#   <path>.snapshot.json    the document after event "seq", and where that event ends in the log
+#
+# Writing a change appends one small line. Loading starts from the latest snapshot
+# and applies the events after it; the state is cached per process, so later loads
+# only read the lines appended since. The log is never truncated, so the document
+# can be rebuilt as it was at any time (replay) and every change can be listed (events).
+#
+# What an event does is up to the caller: apply(data, op, args) changes data in place.
+#
+#   python -m utils.event_log events session_summaries.json --user alice
+#   python -m utils.event_log replay lesson_plan.json --user alice --until 2026-03-01T12:00
+import argparse
+import copy
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from utils import metrics, safe_files
+
+# A snapshot is written after this many events since the previous one
+SNAPSHOT_EVERY = 200
+
+_states = {}  # absolute path -> {"data", "text", "seq", "offset", "snapshot_seq", "log_inode", "base_version"}
+_state_locks = {}
+_state_locks_guard = threading.Lock()
+
+
+def log_path(path):
+    return f"{path}.events.jsonl"
+
+
+def snapshot_path(path):
+    return f"{path}.snapshot.json"
+
+
+def _state_lock(path):
+    """Guards the cached state of one document"""
+    with _state_locks_guard:
+        return _state_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _read_base(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return copy.deepcopy(default)
+
+
+def _initial_state(path, default, log_inode):
+    """State from the latest snapshot, or from the document the log started from"""
+    try:
+        with open(snapshot_path(path), "r") as f:
+            snapshot = json.load(f)
+        data, seq, offset = snapshot["data"], snapshot["seq"], snapshot["offset"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        data, seq, offset = _read_base(path, default), 0, 0
+    return {
+        "data": data, "text": None, "seq": seq, "offset": offset, "snapshot_seq": seq,
+        "log_inode": log_inode, "base_version": safe_files.file_version(path)
+    }
+
+
+def _catch_up(path, state, apply):
+    """Apply the complete lines appended to the log since state was last brought up to date"""
+    with open(log_path(path), "rb") as f:
+        f.seek(state["offset"])
+        tail = f.read()
+    end = tail.rfind(b"\n") + 1  # a line still being written is left for the next load
+    for line in tail[:end].splitlines():
+        event = json.loads(line)
+        if event["seq"] > state["seq"]:
+            apply(state["data"], event["op"], event["args"])
+            state["seq"] = event["seq"]
+            state["text"] = None
+    state["offset"] += end
+
+
+def _state(path, default, apply):
+    """The cached state of path, up to date with its log (callers hold _state_lock(path))"""
+    key = os.path.abspath(path)
+    log_version = safe_files.file_version(log_path(path))
+    state = _states.get(key)
+    log_inode = log_version[0] if log_version else None
+    if (state is None or state["log_inode"] != log_inode or (log_version and log_version[1] < state["offset"])
+            or state["base_version"] != safe_files.file_version(path)):
+        state = _initial_state(path, default, log_inode)
+        _states[key] = state
+    if log_version is not None:
+        try:
+            _catch_up(path, state, apply)
+        except Exception:
+            _states.pop(key, None)
+            raise
+    return state
+
+
+def load(path, default, apply):
+    """
+    Current document of path
+
+    Args:
+        default: Document before any event, if path has no snapshot or base file
+        apply: apply(data, op, args), changes data in place by one event
+
+    Returns:
+        A copy of the document the caller may change
+    """
+    with _state_lock(path):
+        state = _state(path, default, apply)
+        # Parsing the serialized document is faster than copying it
+        if state["text"] is None:
+            state["text"] = json.dumps(state["data"])
+        text = state["text"]
+    return json.loads(text)
+
+
+def append(path, op, args, default, apply):
+    """
+    Apply an event to the document of path and append it to its log
+
+    Args:
+        args: JSON-serializable arguments of the event, passed to apply as they are
+
+    Returns:
+        The return value of apply(data, op, args)
+    """
+    start = time.perf_counter()
+    with safe_files.locked(path), _state_lock(path):
+        state = _state(path, default, apply)
+        key = os.path.abspath(path)
+        event = {"seq": state["seq"] + 1, "time": datetime.now().isoformat(), "op": op, "args": args}
+        line = (json.dumps(event) + "\n").encode("utf-8")
+        try:
+            result = apply(state["data"], op, copy.deepcopy(args))
+            with open(log_path(path), "ab") as f:
+                # A line left unfinished by a writer that crashed is dropped
+                if f.tell() > state["offset"]:
+                    f.truncate(state["offset"])
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            _states.pop(key, None)
+            raise
+        state["seq"] += 1
+        state["offset"] += len(line)
+        state["text"] = None
+        if state["log_inode"] is None:
+            state["log_inode"] = safe_files.file_version(log_path(path))[0]
+        if state["seq"] - state["snapshot_seq"] >= SNAPSHOT_EVERY:
+            _write_snapshot(path, state)
+    name = os.path.basename(path)
+    metrics.STORAGE_BYTES.inc(len(line), file=name, operation="append")
+    metrics.STORAGE_SECONDS.observe(time.perf_counter() - start, file=name, operation="append")
+    return result
+
+
+def _write_snapshot(path, state):
+    text = json.dumps({
+        "seq": state["seq"], "offset": state["offset"], "time": datetime.now().isoformat(), "data": state["data"]
+    })
+    safe_files.atomic_write(snapshot_path(path), text)
+    state["snapshot_seq"] = state["seq"]
+    metrics.STORAGE_BYTES.inc(len(text), file=os.path.basename(path), operation="snapshot")
+
+
+def compact(path, default, apply):
+    """Write a snapshot of the current document now, so the next process start reads no log"""
+    with safe_files.locked(path), _state_lock(path):
+        _write_snapshot(path, _state(path, default, apply))
+
+
+def events(path, since=None, until=None):
+    """
+    The events of path, oldest first
+
+    Args:
+        since, until: Only events at or after / at or before this time (datetime or ISO string)
+    """
+    since = since.isoformat() if isinstance(since, datetime) else since
+    until = until.isoformat() if isinstance(until, datetime) else until
+    try:
+        with open(log_path(path), "rb") as f:
+            lines = f.read()
+    except FileNotFoundError:
+        return []
+    result = []
+    for line in lines[:lines.rfind(b"\n") + 1].splitlines():
+        event = json.loads(line)
+        if (since is None or event["time"] >= since) and (until is None or event["time"] <= until):
+            result.append(event)
+    return result
+
+
+def replay(path, default, apply, until=None):
+    """
+    Rebuild the document of path from the start of its log
+
+    Args:
+        until: Stop after the last event at or before this time (datetime or ISO string), None for all
+
+    Returns:
+        The document as it was at that time
+    """
+    data = _read_base(path, default)
+    for event in events(path, until=until):
+        apply(data, event["op"], event["args"])
+    return data
+
+
+if __name__ == "__main__":
+    from utils import storage, tenancy
+
+    parser = argparse.ArgumentParser(description="Inspect the event log of a learner's document")
+    parser.add_argument("command", choices=["events", "replay", "compact"])
+    parser.add_argument("file", choices=sorted(storage.EVENT_SOURCED_FILES))
+    parser.add_argument("--user", default=tenancy.DEFAULT_USER_ID)
+    parser.add_argument("--since", help="ISO time, events only")
+    parser.add_argument("--until", help="ISO time")
+    args = parser.parse_args()
+
+    with tenancy.user_scope(args.user):
+        if args.command == "events":
+            for event in storage.get_events(args.file, args.since, args.until):
+                print(json.dumps(event))
+        elif args.command == "replay":
+            print(json.dumps(storage.replay_file(args.file, args.until), indent=2))
+        else:
+            storage.compact_file(args.file)
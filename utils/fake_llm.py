@@ -0,0 +1,310 @@
+# Deterministic local stand-in for the OpenAI chat completions API, used for
+# offline development, tests and load tests.
+#
+# In process:  set "llm_provider": "fake" in utils/config.json (or LLM_PROVIDER=fake)
+# As a server: python -m utils.fake_llm --port 8900, then point the OpenAI client
+#              at it with "llm_base_url": "http://localhost:8900/v1"
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+FAKE_MODEL = "fake-tutor"
+
+SUMMARY_JSON = {
+    "summary": "The student practiced the assignment in a short conversation and answered the tutor's questions.",
+    "what_worked": "Clear answers and good use of everyday vocabulary.",
+    "understood": "Word order in main clauses, basic Perfekt forms.",
+    "difficulties": "Cases after prepositions and verb position in subordinate clauses.",
+    "common_mistakes": ["der instead of dem after mit", "verb not at the end of a weil clause"]
+}
+
+PDF_JSON = {
+    "objectives": "Practice a realistic conversation and review the grammar that came up.",
+    "learnings": {
+        "grammar_points": ["Dative after mit, bei, nach, zu", "Verb at the end of subordinate clauses"],
+        "vocabulary": ["die Besprechung: meeting", "verschieben: to postpone"],
+        "structures": ["weil + verb at the end", "Ich würde gern ..."],
+        "key_concepts": ["Formal vs informal address"]
+    },
+    "improvements": {
+        "areas_to_focus": ["Cases", "Subordinate clauses"],
+        "common_mistakes": ["mit der Kollege -> mit dem Kollegen (dative)"],
+        "recommendations": ["Repeat the dialogue with new topics", "Review dative prepositions"]
+    }
+}
+
+LESSON_TOPICS = [
+    ("Meeting new people", ["Introduce yourself, your occupation and hobbies", "Role play: meeting new people"]),
+    ("Travel and transport", ["Buying tickets, asking for directions", "Describe your latest journey"]),
+    ("Home, family and friends", ["Describe your apartment", "Describe your friends and family members"]),
+    ("Work and meetings", ["Schedule a meeting and postpone it", "Give structured opinions in a meeting"]),
+    ("Health and daily routines", ["At the doctor's", "Narrate your daily routine with time markers"]),
+    ("Culture and media", ["Talk about a film or a book", "Compare traditions"])
+]
+
+CHAT_REPLIES = [
+    "Sehr gut! Erzähl mir mehr darüber. Was hast du gestern gemacht?",
+    "Fast richtig: ich ~~habe~~ **bin** gegangen. Bewegungsverben bilden das Perfekt mit *sein*. Versuch es noch einmal!",
+    "Gute Idee! Neue Wörter für dich:\n- die Besprechung – meeting\n- verschieben – to postpone\nKannst du einen Satz mit *verschieben* bilden?",
+    "Prima, das war fehlerfrei. Welche Situation möchtest du als Nächstes üben?"
+]
+
+
+def _seed(*parts):
+    return int(hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _lesson_plan(prompt, rng):
+    daily = "1 Week" in prompt
+    count = 5 if daily else (12 if "3 Months" in prompt else 4)
+    label = "Day" if daily else "Week"
+    plan = []
+    for i in range(count):
+        topic, tasks = LESSON_TOPICS[(i + rng.randrange(len(LESSON_TOPICS))) % len(LESSON_TOPICS)]
+        plan.append({"week_or_day": f"{label} {i + 1} - {topic}", "assignments": tasks})
+    return {"lesson_plan": plan}
+
+
+def _word_details(prompt):
+    words = re.search(r'words or phrases: (\[.*?\])', prompt, re.DOTALL)
+    words = json.loads(words.group(1)) if words else []
+    return {"words": [
+        {"word": w, "translation": f"{w} (translated)", "example": f"Ich benutze „{w}“ in einem Satz."}
+        for w in words
+    ]}
+
+
+def _structured_content(response_format, prompt, rng):
+    """JSON for a json_schema response format, limited to the fields the schema asks for"""
+    json_schema = response_format.get("json_schema", {})
+    name = re.sub(r"_repair$", "", json_schema.get("name", ""))
+    canned = {
+        "lesson_plan": lambda: _lesson_plan(prompt, rng),
+        "session_summary": lambda: SUMMARY_JSON,
+        "pdf_review": lambda: PDF_JSON,
+        "word_details": lambda: _word_details(prompt)
+    }.get(name)
+    if canned is None:
+        return None
+    data = canned()
+    fields = json_schema.get("schema", {}).get("properties", data)
+    return json.dumps({k: v for k, v in data.items() if k in fields}, ensure_ascii=False)
+
+
+def generate_content(messages, rng, response_format=None):
+    """Canned, deterministic answer for the kind of prompt the app sends"""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    last = str(messages[-1].get("content", "")) if messages else ""
+
+    if response_format and response_format.get("type") == "json_schema":
+        content = _structured_content(response_format, prompt, rng)
+        if content is not None:
+            return content
+    if '"lesson_plan"' in last:
+        return json.dumps(_lesson_plan(last, rng), ensure_ascii=False)
+    if '"what_worked"' in last and '"common_mistakes"' in last:
+        return json.dumps(SUMMARY_JSON, ensure_ascii=False)
+    if '"objectives"' in last and '"learnings"' in last:
+        return json.dumps(PDF_JSON, ensure_ascii=False)
+    if "Translation: <" in last:
+        word = re.search(r'For the word "([^"]+)"', last)
+        word = word.group(1) if word else "Wort"
+        return f"Translation: {word} (translated)\nExample: Ich benutze das Wort „{word}“ in einem Satz."
+    if '"translation"' in last and '"example"' in last:
+        return json.dumps(_word_details(last), ensure_ascii=False)
+    if "quiz" in last.lower():
+        return "Quiz:\n1. Übersetze: to postpone\n2. Bilde einen Satz mit „die Besprechung“.\n3. Ergänze: Ich ___ gestern nach Hause gegangen."
+    return CHAT_REPLIES[_seed(prompt) % len(CHAT_REPLIES)]
+
+
+class FakeLLM:
+    """
+    Deterministic chat completion generator with configurable behavior
+
+    Args:
+        latency: Seconds before the first token
+        tokens_per_second: Streaming speed (0 = instant)
+        error_rate: Probability that a request fails
+        seed: Seed for error injection and canned content choice
+    """
+
+    def __init__(self, latency=0.2, tokens_per_second=100, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _next_request(self, messages):
+        with self._lock:
+            self.requests += 1
+            n = self.requests
+        rng = random.Random(_seed(str(self.seed), json.dumps(messages, sort_keys=True, ensure_ascii=False)))
+        fail = random.Random(_seed(str(self.seed), str(n))).random() < self.error_rate
+        return rng, fail
+
+    def _pieces(self, content):
+        # Roughly one token per word, keeping whitespace attached
+        return re.findall(r"\S+\s*|\s+", content)
+
+    def _sleep_tokens(self, count):
+        if self.tokens_per_second:
+            time.sleep(count / self.tokens_per_second)
+
+    def respond(self, messages, model=FAKE_MODEL, response_format=None):
+        """
+        Returns:
+            tuple: (content, usage dict), or raises an injected error
+        """
+        rng, fail = self._next_request(messages)
+        time.sleep(self.latency)
+        if fail:
+            raise openai.APITimeoutError(request=None)
+        content = generate_content(messages, rng, response_format)
+        prompt_tokens = sum(_count_tokens(str(m.get("content", ""))) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": _count_tokens(content),
+            "total_tokens": prompt_tokens + _count_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+        return content, usage
+
+    def completion(self, messages, model=FAKE_MODEL, response_format=None):
+        content, usage = self.respond(messages, model, response_format)
+        self._sleep_tokens(usage["completion_tokens"])
+        return {
+            "id": f"fakecmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage
+        }
+
+    def chunks(self, messages, model=FAKE_MODEL, include_usage=False, response_format=None):
+        content, usage = self.respond(messages, model, response_format)
+        base = {"id": f"fakecmpl-{self.requests}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        for piece in self._pieces(content):
+            self._sleep_tokens(1)
+            yield dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if include_usage:
+            yield dict(base, choices=[], usage=usage)
+
+
+class _Stream:
+    """Iterable of ChatCompletionChunk objects with the close() of an SDK stream"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    def close(self):
+        self._chunks.close()
+
+
+class _Completions:
+    def __init__(self, llm):
+        self._llm = llm
+
+    def create(self, messages, model=FAKE_MODEL, stream=False, stream_options=None, timeout=None,
+               response_format=None, **kwargs):
+        if stream:
+            include_usage = bool(stream_options and stream_options.get("include_usage"))
+            return _Stream(self._llm.chunks(messages, model, include_usage, response_format))
+        return ChatCompletion.model_validate(self._llm.completion(messages, model, response_format))
+
+
+class _Chat:
+    def __init__(self, llm):
+        self.completions = _Completions(llm)
+
+
+class FakeClient:
+    """In-process drop-in for openai.OpenAI (only chat.completions.create)"""
+
+    def __init__(self, llm=None, **options):
+        self.llm = llm or FakeLLM(**options)
+        self.chat = _Chat(self.llm)
+
+
+def make_handler(llm):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            messages = body.get("messages", [])
+            model = body.get("model", FAKE_MODEL)
+            response_format = body.get("response_format")
+            try:
+                if body.get("stream"):
+                    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                    chunks = llm.chunks(messages, model, include_usage, response_format)
+                    first = next(chunks)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for chunk in [first, *chunks]:
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                else:
+                    self._send_json(200, llm.completion(messages, model, response_format))
+            except openai.APITimeoutError:
+                self._send_json(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8900, **options):
+    """Run an OpenAI-compatible fake server (blocking)"""
+    server = ThreadingHTTPServer((host, port), make_handler(FakeLLM(**options)))
+    print(f"Fake LLM listening on http://{host}:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100, help="Streaming speed, 0 for instant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 500 error")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    serve(args.host, args.port, latency=args.latency, tokens_per_second=args.tokens_per_second,
+          error_rate=args.error_rate, seed=args.seed)
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from utils import metrics, safe_files
+
+LESSON_PLAN_CACHE_FILE = "assets/lesson_plan_cache.json"
+DEFAULT_MAX_ENTRIES = 50
+DEFAULT_TTL_DAYS = 30
+
+def _load_config():
+    with open('utils/config.json', 'r') as f:
+        return json.load(f)
+
+
+def normalize_goals(goals):
+    """Normalize free-text goals so 'Business German!' and ' business  german' share one entry"""
+    return " ".join(re.sub(r"[^\w\s]", " ", goals.casefold()).split())
+
+
+def cache_key(language, user_level, learning_period, user_goals, model):
+    raw = json.dumps(
+        [language.casefold(), user_level, learning_period, normalize_goals(user_goals), model],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _load():
+    try:
+        with open(LESSON_PLAN_CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"entries": {}, "hits": 0, "misses": 0}
+
+
+def _save(cache):
+    safe_files.atomic_write(LESSON_PLAN_CACHE_FILE, json.dumps(cache, ensure_ascii=False, indent=2))
+
+
+def _locked():
+    """Lock for a read-modify-write of the cache file, shared with other processes"""
+    os.makedirs(os.path.dirname(LESSON_PLAN_CACHE_FILE), exist_ok=True)
+    return safe_files.locked(LESSON_PLAN_CACHE_FILE)
+
+
+def _expired(entry, ttl_days):
+    return datetime.now() - datetime.fromisoformat(entry["created"]) > timedelta(days=ttl_days)
+
+
+def get_plan(key):
+    """
+    Look up a generated plan and count the hit or miss
+
+    Returns:
+        list: (week_or_day, tasks) entries, or None if missing or expired
+    """
+    ttl_days = _load_config().get('lesson_plan_cache_ttl_days', DEFAULT_TTL_DAYS)
+    with _locked():
+        cache = _load()
+        entry = cache["entries"].get(key)
+        if entry is not None and _expired(entry, ttl_days):
+            del cache["entries"][key]
+            entry = None
+        metrics.CACHE_REQUESTS.inc(cache="lesson_plan", result="miss" if entry is None else "hit")
+        if entry is None:
+            cache["misses"] += 1
+            _save(cache)
+            return None
+        cache["hits"] += 1
+        entry["last_used"] = datetime.now().isoformat()
+        _save(cache)
+        return [(week_or_day, tasks) for week_or_day, tasks in entry["plan"]]
+
+
+def put_plan(key, entries):
+    """Store a complete generated plan, evicting expired and least recently used plans"""
+    config = _load_config()
+    ttl_days = config.get('lesson_plan_cache_ttl_days', DEFAULT_TTL_DAYS)
+    max_entries = config.get('lesson_plan_cache_size', DEFAULT_MAX_ENTRIES)
+    now = datetime.now().isoformat()
+    with _locked():
+        cache = _load()
+        cache["entries"][key] = {"plan": [list(e) for e in entries], "created": now, "last_used": now}
+        cache["entries"] = {k: e for k, e in cache["entries"].items() if not _expired(e, ttl_days)}
+        while len(cache["entries"]) > max_entries:
+            oldest = min(cache["entries"], key=lambda k: cache["entries"][k]["last_used"])
+            del cache["entries"][oldest]
+        _save(cache)
+
+
+def get_stats():
+    """
+    Returns:
+        dict: entries, hits, misses and hit_rate (None before the first lookup)
+    """
+    cache = _load()
+    lookups = cache["hits"] + cache["misses"]
+    return {
+        "entries": len(cache["entries"]),
+        "hits": cache["hits"],
+        "misses": cache["misses"],
+        "hit_rate": cache["hits"] / lookups if lookups else None
+    }
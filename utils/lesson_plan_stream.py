@@ -0,0 +1,106 @@
+import json
+import re
+
+PLAN_START = re.compile(r'"lesson_plan"\s*:\s*([\{\[])')
+
+
+class LessonPlanStreamParser:
+    """
+    Incremental parser for a streamed lesson plan response, either in the structured
+    output form {"lesson_plan": [{"week_or_day": "Week 1 - ...", "assignments": [...]}, ...]}
+    or the older {"lesson_plan": {"Week 1 - ...": [...], ...}} form.
+
+    Text is fed as it arrives and every week/day entry is returned as soon as it is
+    complete, so it can be rendered right away. An entry that is not valid JSON is
+    skipped without losing the entries parsed before or after it.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.entries = []
+        self.errors = 0
+        self.finished = False
+        self._pos = None        # next character to scan, None until the plan object starts
+        self._depth = 0         # nesting depth, 1 = directly inside the lesson_plan object
+        self._in_string = False
+        self._escape = False
+        self._entry_start = None
+        self._array = False     # True for the structured output (list of objects) form
+
+    def feed(self, text):
+        """
+        Add streamed text
+
+        Returns:
+            list: (week_or_day, tasks) entries completed by this text
+        """
+        self.buffer += text
+        if self.finished:
+            return []
+        if self._pos is None:
+            match = PLAN_START.search(self.buffer)
+            if not match:
+                return []
+            self._pos = match.end()
+            self._depth = 1
+            self._array = match.group(1) == "["
+
+        new_entries = []
+        buffer = self.buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._entry_start is None and not self._array:
+                    self._entry_start = i
+            elif char in "[{":
+                if self._depth == 1 and self._entry_start is None and self._array:
+                    self._entry_start = i
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._entry_start is not None:
+                    entry = self._parse_entry(buffer[self._entry_start:i + 1])
+                    if entry:
+                        new_entries.append(entry)
+                    self._entry_start = None
+                elif self._depth <= 0:
+                    self.finished = True
+                    i += 1
+                    break
+            elif char == "," and self._depth == 1:
+                # A scalar value ended without a closing bracket, not a valid entry
+                if self._entry_start is not None:
+                    self.errors += 1
+                    self._entry_start = None
+            i += 1
+        self._pos = i
+        self.entries.extend(new_entries)
+        return new_entries
+
+    def _parse_entry(self, text):
+        try:
+            entry = json.loads(text if self._array else "{" + text + "}")
+        except json.JSONDecodeError:
+            self.errors += 1
+            return None
+        if self._array:
+            if not isinstance(entry, dict) or not isinstance(entry.get("week_or_day"), str):
+                self.errors += 1
+                return None
+            key, tasks = entry["week_or_day"], entry.get("assignments")
+        else:
+            key, tasks = next(iter(entry.items()))
+        if not isinstance(tasks, list):
+            self.errors += 1
+            return None
+        tasks = [str(task) for task in tasks if str(task).strip()]
+        return (key, tasks) if tasks else None
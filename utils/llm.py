@@ -0,0 +1,703 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import openai
+
+from utils import llm_scheduler, profiler, metrics, tenancy
+
+logger = logging.getLogger(__name__)
+
+# Per call type deadline (seconds) for the whole call, retries included
+DEFAULT_TIMEOUTS = {
+    "chat": 45,
+    "vocab": 20,
+    "quiz": 45,
+    "summary": 60,
+    "lesson_plan": 120,
+    "pdf": 90,
+    "opening": 45
+}
+DEFAULT_TIMEOUT = 60
+DEFAULT_MAX_RETRIES = 3
+# Call types that fire a second, hedged request if the first one is slow (seconds)
+DEFAULT_HEDGE_AFTER = {"chat": 8}
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 30.0
+
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+# Singleflight: identical requests in flight at the same time share one upstream call
+_inflight = {}
+_inflight_lock = threading.Lock()
+_inflight_streams = {}
+_coalescing_stats = {"requests": 0, "upstream": 0, "coalesced": 0}
+# How often a stream waiting for its next delta checks its cancel event (seconds)
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class CircuitOpenError(openai.OpenAIError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class _InflightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class _CircuitBreaker:
+    """Opens after consecutive failures, lets one trial request through after a cooldown"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = None  # ticket of the trial request, if one is running
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns:
+            A ticket to pass to release() when the request ends, or None if the breaker is open
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown and not self.trial_in_flight:
+                self.trial_in_flight = object()
+                return self.trial_in_flight
+            return None
+
+    def release(self, ticket):
+        """End a request; a trial that recorded no outcome (e.g. never reached upstream) counts as neither"""
+        with self.lock:
+            if self.trial_in_flight is ticket:
+                self.trial_in_flight = None
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = None
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("LLM circuit breaker opened after %d consecutive failures", self.failures)
+                self.opened_at = time.monotonic()
+
+
+_breaker = _CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN)
+
+
+def _load_config():
+    with open('utils/config.json', 'r') as f:
+        return json.load(f)
+
+
+def _api_key():
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        import streamlit as st
+        api_key = st.secrets["OPENAI_API_KEY"]
+    return api_key
+
+
+def _openai_client(config, api_key):
+    return openai.OpenAI(
+        api_key=api_key or _api_key(),
+        base_url=config.get('llm_base_url') or None,
+        max_retries=0
+    )
+
+
+def _fake_client(config, api_key):
+    from utils.fake_llm import FakeClient
+    return FakeClient(**config.get('fake_llm', {}))
+
+
+# Provider name -> factory(config, api_key) returning an object with chat.completions.create
+_providers = {
+    "openai": _openai_client,
+    "fake": _fake_client
+}
+
+
+def register_provider(name, factory):
+    """Register an LLM provider (e.g. another OpenAI-compatible backend)"""
+    _providers[name] = factory
+
+
+def get_provider_name(config=None):
+    """Configured provider, LLM_PROVIDER in the environment takes precedence"""
+    config = config or _load_config()
+    return os.environ.get("LLM_PROVIDER") or config.get('llm_provider', 'openai')
+
+
+def get_client(api_key=None):
+    """Shared client for the configured provider (retries are handled here, not by the SDK)"""
+    config = _load_config()
+    provider = get_provider_name(config)
+    with _clients_lock:
+        key = (provider, api_key)
+        if key not in _clients:
+            if provider not in _providers:
+                raise ValueError(f"Unknown LLM provider: {provider}")
+            _clients[key] = _providers[provider](config, api_key)
+        return _clients[key]
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _record_token_metrics(call_type, usage):
+    metrics.LLM_TOKENS.inc(usage.prompt_tokens or 0, call_type=call_type, direction="in")
+    metrics.LLM_TOKENS.inc(usage.completion_tokens or 0, call_type=call_type, direction="out")
+
+
+def _attempt(client, job, attempt, timeout, request):
+    """One upstream request, admitted by the process-wide scheduler"""
+    call_type = job["call_type"]
+    queued = time.monotonic()
+    reservation = job["scheduler"].acquire(job["priority"], job["tokens"], timeout=timeout)
+    start = time.monotonic()
+    usage = None
+    try:
+        response = client.chat.completions.create(timeout=max(timeout - (start - queued), 1), **request)
+        usage = getattr(response, "usage", None)
+    except Exception as e:
+        logger.warning("LLM %s attempt %d failed after %.2fs (queued %.2fs): %s: %s",
+                       call_type, attempt, time.monotonic() - start, start - queued, type(e).__name__, e)
+        raise
+    finally:
+        job["scheduler"].release(reservation, usage.total_tokens if usage else None)
+    if usage:
+        llm_scheduler.record_user_tokens(job["user_id"], usage.total_tokens)
+        _record_token_metrics(call_type, usage)
+    logger.info("LLM %s attempt %d succeeded in %.2fs (queued %.2fs)",
+                call_type, attempt, time.monotonic() - start, start - queued)
+    return response
+
+
+def _hedged(client, job, attempt, timeout, request, hedge_after):
+    """Send the request, and a second identical one if the first is still running after hedge_after"""
+    call_type = job["call_type"]
+    primary = _hedge_pool.submit(_attempt, client, job, attempt, timeout, request)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    logger.info("LLM %s attempt %d slower than %.1fs, sending hedged request", call_type, attempt, hedge_after)
+    hedge = _hedge_pool.submit(_attempt, client, job, attempt, max(timeout - hedge_after, 1), request)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def request_key(request):
+    """Hash of a request with whitespace-normalized message contents"""
+    normalized = dict(request, messages=[
+        {"role": m.get("role"), "content": " ".join(str(m.get("content", "")).split())}
+        for m in request["messages"]
+    ])
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _singleflight(key, call_type, fn):
+    """Run fn once for all concurrent callers with the same key and share its outcome"""
+    with _inflight_lock:
+        _coalescing_stats["requests"] += 1
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _InflightCall()
+            _coalescing_stats["upstream"] += 1
+        else:
+            _coalescing_stats["coalesced"] += 1
+    metrics.LLM_COALESCING.inc(call_type=call_type, result="upstream" if leader else "coalesced")
+
+    if leader:
+        try:
+            call.response = fn()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with _inflight_lock:
+                del _inflight[key]
+            call.done.set()
+    else:
+        logger.info("LLM %s request coalesced with an identical in-flight request", call_type)
+        call.done.wait()
+
+    if call.error is not None:
+        raise call.error
+    return call.response
+
+
+def get_coalescing_stats():
+    """
+    Returns:
+        dict: {"requests", "upstream", "coalesced", "in_flight"} since the process started
+    """
+    with _inflight_lock:
+        return dict(_coalescing_stats, in_flight=len(_inflight) + len(_inflight_streams))
+
+
+metrics.LLM_IN_FLIGHT.set_function(lambda: get_coalescing_stats()["in_flight"])
+
+
+@profiler.profiled("llm")
+def complete(call_type, messages, model=None, temperature=None, api_key=None, hedge=None, coalesce=True,
+             user_id=None, **kwargs):
+    """
+    Create a chat completion with a per call type deadline, jittered exponential
+    backoff on transient errors, optional hedging and a circuit breaker
+
+    Args:
+        call_type: Kind of request ("chat", "vocab", "quiz", "summary", "lesson_plan", "pdf")
+        messages: Chat messages
+        model: Model name (defaults to the configured model)
+        temperature: Sampling temperature (defaults to the configured temperature)
+        api_key: OpenAI API key (defaults to OPENAI_API_KEY from the environment or Streamlit secrets,
+            not needed for the fake provider)
+        hedge: Force hedging on/off (defaults to the configured call types)
+        coalesce: Share the upstream call with identical concurrent requests
+        user_id: User the tokens are charged to, for the daily budget (default: the current user)
+        **kwargs: Extra arguments for chat.completions.create
+
+    Returns:
+        The OpenAI chat completion response
+
+    Raises:
+        CircuitOpenError: If upstream has been failing and the breaker is open
+        llm_scheduler.BudgetExceededError: If the user's daily token budget is used up
+        llm_scheduler.QueueTimeoutError: If the request could not be scheduled before its deadline
+        openai.OpenAIError: The last error once retries or the deadline are exhausted
+    """
+    config = _load_config()
+    deadline = config.get('llm_timeouts', {}).get(call_type, DEFAULT_TIMEOUTS.get(call_type, DEFAULT_TIMEOUT))
+    max_retries = config.get('llm_max_retries', DEFAULT_MAX_RETRIES)
+    hedge_after = config.get('llm_hedge_after', DEFAULT_HEDGE_AFTER).get(call_type)
+    if hedge is False:
+        hedge_after = None
+
+    request = dict(
+        model=model or config.get('openai_model_name', 'gpt-4o'),
+        messages=messages,
+        temperature=config.get('temperature', 0.7) if temperature is None else temperature,
+        **kwargs
+    )
+    client = get_client(api_key)
+
+    user_id = user_id or tenancy.current_user_id()
+    llm_scheduler.check_budget(user_id, config.get('llm_daily_user_tokens', llm_scheduler.DEFAULT_DAILY_USER_TOKENS))
+    job = {
+        "call_type": call_type,
+        "user_id": user_id,
+        "scheduler": llm_scheduler.get_scheduler(config),
+        "priority": llm_scheduler.get_priority(config, call_type),
+        "tokens": llm_scheduler.estimate_prompt_tokens(messages) + llm_scheduler.EXPECTED_COMPLETION_TOKENS
+    }
+
+    def call():
+        return _complete_with_retries(client, job, request, deadline, max_retries, hedge_after)
+
+    if not coalesce:
+        return call()
+    return _singleflight(request_key(request), call_type, call)
+
+
+def _complete_with_retries(client, job, request, deadline, max_retries, hedge_after):
+    call_type = job["call_type"]
+    end = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        ticket = _breaker.allow()
+        if not ticket:
+            logger.warning("LLM %s rejected: circuit breaker open", call_type)
+            raise CircuitOpenError("The language model is temporarily unavailable. Please try again shortly.")
+
+        remaining = end - time.monotonic()
+        try:
+            if hedge_after and remaining > hedge_after:
+                response = _hedged(client, job, attempt, remaining, request, hedge_after)
+            else:
+                response = _attempt(client, job, attempt, remaining, request)
+        except RETRYABLE_ERRORS:
+            _breaker.record_failure()
+            delay = _backoff(attempt)
+            attempt += 1
+            if attempt > max_retries or time.monotonic() + delay >= end:
+                raise
+            time.sleep(delay)
+            continue
+        except llm_scheduler.QueueTimeoutError:
+            # Deadline spent waiting for a slot, upstream was never called
+            raise
+        except openai.OpenAIError:
+            # Not transient (bad request, auth...): retrying won't help, and upstream is up
+            _breaker.record_success()
+            raise
+        finally:
+            _breaker.release(ticket)
+
+        _breaker.record_success()
+        return response
+
+
+# --- Streaming: one thread reads the upstream stream (hedged if the first token is
+# slow) and publishes the deltas to every caller of the same request ---
+
+class _StreamCall:
+    """A streamed completion, shared by the identical requests that join it while it runs"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.deltas = []
+        self.usage = None
+        self.error = None
+        self.done = False
+        self.aborted = False
+        self.subscribers = 1
+        self.events = queue.Queue()  # (attempt, kind, value) from the reading threads
+
+    def publish(self, delta):
+        with self.cond:
+            self.deltas.append(delta)
+            self.cond.notify_all()
+
+    def finish(self, usage=None, error=None):
+        with self.cond:
+            self.usage = usage
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def abort(self):
+        """Stop the call when no caller is left to read it"""
+        with self.cond:
+            self.aborted = True
+        self.events.put((None, "abort", None))
+
+
+class _StreamAttempt:
+    """One upstream streamed request, read by its own thread into the call's events"""
+
+    def __init__(self, client, job, request, timeout, events):
+        self._scheduler = job["scheduler"]
+        self._reservation = None
+        self._response = None
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, args=(client, job, request, timeout, events), name="llm-stream", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, client, job, request, timeout, events):
+        queued = time.monotonic()
+        usage = None
+        try:
+            reservation = self._scheduler.acquire(job["priority"], job["tokens"], timeout=timeout)
+            with self._lock:
+                self._reservation = reservation
+            response = client.chat.completions.create(timeout=max(timeout - (time.monotonic() - queued), 1), **request)
+            with self._lock:
+                self._response = response
+                stopped = self._stopped
+            if stopped:
+                _close_stream(response)
+                return
+            for chunk in response:
+                if self._stopped:
+                    return
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    events.put((self, "delta", chunk.choices[0].delta.content))
+            events.put((self, "end", usage))
+        except Exception as e:
+            if not self._stopped:
+                events.put((self, "error", e))
+        finally:
+            with self._lock:
+                response, self._response = self._response, None
+            if response is not None:
+                _close_stream(response)
+            self._release_slot(usage.total_tokens if usage else None)
+            if usage:
+                llm_scheduler.record_user_tokens(job["user_id"], usage.total_tokens)
+                _record_token_metrics(job["call_type"], usage)
+
+    def _release_slot(self, tokens=None):
+        with self._lock:
+            reservation, self._reservation = self._reservation, None
+        if reservation is not None:
+            self._scheduler.release(reservation, tokens)
+
+    def stop(self):
+        """
+        Close the upstream response and give back the scheduler slot, also while
+        the reading thread is still blocked on the response
+        """
+        with self._lock:
+            self._stopped = True
+            response = self._response
+        if response is not None:
+            _close_stream(response)
+        self._release_slot()
+
+
+def _close_stream(response):
+    # Closing an SDK stream does not wake up a thread blocked reading it, shutting its socket down does
+    http_response = getattr(response, "response", None)
+    network_stream = http_response.extensions.get("network_stream") if http_response is not None else None
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    try:
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # already closed
+    try:
+        response.close()
+    except Exception as e:
+        # e.g. a generator based stream closed while its thread is reading it
+        logger.debug("Could not close LLM stream: %s: %s", type(e).__name__, e)
+
+
+def _read_attempt(call, client, job, request, attempt, end, hedge_after):
+    """
+    Read one attempt into call, sending a hedged request if no token arrived after hedge_after
+
+    Returns:
+        The usage reported by the stream that finished (None if it reported none or the call was aborted)
+    """
+    call_type = job["call_type"]
+    start = time.monotonic()
+    running = [_StreamAttempt(client, job, request, end - start, call.events)]
+    hedge_at = start + hedge_after if hedge_after and end - start > hedge_after else None
+    winner = None
+    try:
+        while True:
+            if call.aborted:
+                return None
+            now = time.monotonic()
+            if now >= end:
+                raise openai.APITimeoutError(request=None)
+            try:
+                source, kind, value = call.events.get(timeout=max(min(end, hedge_at or end) - now, 0))
+            except queue.Empty:
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    logger.info("LLM %s stream attempt %d has no token after %.1fs, sending hedged request",
+                                call_type, attempt, hedge_after)
+                    running.append(_StreamAttempt(client, job, request, end - time.monotonic(), call.events))
+                    hedge_at = None
+                continue
+            if source not in running or (winner is not None and source is not winner):
+                continue  # a stopped or losing attempt, or an earlier abort
+            if kind == "delta":
+                if winner is None:
+                    # The first attempt to produce a token is kept, the other one is closed
+                    winner, hedge_at = source, None
+                    for other in running:
+                        if other is not source:
+                            other.stop()
+                    logger.info("LLM %s stream attempt %d first token after %.2fs",
+                                call_type, attempt, time.monotonic() - start)
+                call.publish(value)
+            elif kind == "end":
+                logger.info("LLM %s stream attempt %d finished in %.2fs", call_type, attempt, time.monotonic() - start)
+                return value
+            else:
+                running.remove(source)
+                if source is winner or not running:
+                    logger.warning("LLM %s stream attempt %d failed after %.2fs: %s: %s",
+                                   call_type, attempt, time.monotonic() - start, type(value).__name__, value)
+                    raise value
+    finally:
+        for other in running:
+            other.stop()
+
+
+def _drive_stream(key, call, client, job, request, deadline, max_retries, hedge_after):
+    """Run a streamed call with retries (only before its first token) and the circuit breaker"""
+    call_type = job["call_type"]
+    end = time.monotonic() + deadline
+    attempt = 0
+    usage, error = None, None
+    try:
+        while not call.aborted:
+            ticket = _breaker.allow()
+            if not ticket:
+                logger.warning("LLM %s stream rejected: circuit breaker open", call_type)
+                raise CircuitOpenError("The language model is temporarily unavailable. Please try again shortly.")
+            try:
+                usage = _read_attempt(call, client, job, request, attempt, end, hedge_after)
+            except RETRYABLE_ERRORS:
+                _breaker.record_failure()
+                delay = _backoff(attempt)
+                attempt += 1
+                if call.deltas or attempt > max_retries or time.monotonic() + delay >= end:
+                    raise
+                time.sleep(delay)
+                continue
+            except llm_scheduler.QueueTimeoutError:
+                raise
+            except openai.OpenAIError:
+                _breaker.record_success()
+                raise
+            finally:
+                _breaker.release(ticket)
+            if not call.aborted:
+                _breaker.record_success()
+            return
+    except Exception as e:
+        error = e
+    finally:
+        with _inflight_lock:
+            if _inflight_streams.get(key) is call:
+                del _inflight_streams[key]
+        call.finish(usage, error)
+
+
+def _join_stream(key, call_type, coalesce):
+    """The running call for key to read, and whether the caller has to start it"""
+    with _inflight_lock:
+        _coalescing_stats["requests"] += 1
+        call = _inflight_streams.get(key) if coalesce else None
+        leader = call is None or call.aborted
+        if leader:
+            call = _StreamCall()
+            if coalesce:
+                _inflight_streams[key] = call
+            _coalescing_stats["upstream"] += 1
+        else:
+            call.subscribers += 1
+            _coalescing_stats["coalesced"] += 1
+    metrics.LLM_COALESCING.inc(call_type=call_type, result="upstream" if leader else "coalesced")
+    return call, leader
+
+
+def _leave_stream(key, call):
+    with _inflight_lock:
+        call.subscribers -= 1
+        last = call.subscribers == 0
+        if last and _inflight_streams.get(key) is call:
+            del _inflight_streams[key]
+    if last and not call.done:
+        call.abort()
+
+
+@profiler.profiled("llm")
+def stream(call_type, messages, model=None, temperature=None, api_key=None, hedge=None, coalesce=True,
+           user_id=None, on_usage=None, cancel=None, **kwargs):
+    """
+    Stream a chat completion, yielding content deltas as they arrive.
+
+    Same deadline, scheduler, budget, hedging, coalescing and circuit breaker as
+    complete; the deadline also applies to a stream that stalls. A hedged request
+    is sent if no token arrived after the hedge delay, and the first one to
+    produce a token is kept. Transient errors are retried only before the first
+    token; once output has started the error is raised so the caller can keep
+    what it already received. Closing the generator, or setting cancel, stops
+    reading at once; the upstream stream is closed when no caller is left.
+
+    Args:
+        on_usage: Called with the usage of a stream that ran to the end
+        cancel: threading.Event that ends the generator early when set
+    """
+    config = _load_config()
+    deadline = config.get('llm_timeouts', {}).get(call_type, DEFAULT_TIMEOUTS.get(call_type, DEFAULT_TIMEOUT))
+    max_retries = config.get('llm_max_retries', DEFAULT_MAX_RETRIES)
+    hedge_after = config.get('llm_hedge_after', DEFAULT_HEDGE_AFTER).get(call_type)
+    if hedge is False:
+        hedge_after = None
+    request = dict(
+        model=model or config.get('openai_model_name', 'gpt-4o'),
+        messages=messages,
+        temperature=config.get('temperature', 0.7) if temperature is None else temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs
+    )
+    client = get_client(api_key)
+    user_id = user_id or tenancy.current_user_id()
+    llm_scheduler.check_budget(user_id, config.get('llm_daily_user_tokens', llm_scheduler.DEFAULT_DAILY_USER_TOKENS))
+    job = {
+        "call_type": call_type,
+        "user_id": user_id,
+        "scheduler": llm_scheduler.get_scheduler(config),
+        "priority": llm_scheduler.get_priority(config, call_type),
+        "tokens": llm_scheduler.estimate_prompt_tokens(messages) + llm_scheduler.EXPECTED_COMPLETION_TOKENS
+    }
+
+    key = request_key(request)
+    call, leader = _join_stream(key, call_type, coalesce)
+    if leader:
+        threading.Thread(
+            target=_drive_stream, args=(key, call, client, job, request, deadline, max_retries, hedge_after),
+            name="llm-stream-driver", daemon=True
+        ).start()
+    else:
+        logger.info("LLM %s stream coalesced with an identical in-flight request", call_type)
+    try:
+        read = 0
+        while True:
+            with call.cond:
+                while read == len(call.deltas) and not call.done and not (cancel and cancel.is_set()):
+                    call.cond.wait(CANCEL_POLL_INTERVAL if cancel is not None else None)
+                if cancel is not None and cancel.is_set():
+                    return
+                new = call.deltas[read:]
+                done = call.done
+            for delta in new:
+                yield delta
+            read += len(new)
+            if done and read == len(call.deltas):
+                break
+        if call.error is not None:
+            raise call.error
+        if on_usage and call.usage:
+            on_usage(call.usage)
+    finally:
+        # Also runs when the caller closes the generator
+        _leave_stream(key, call)
+
+
+def complete_text(call_type, messages, **kwargs):
+    """Same as complete, returning only the message content"""
+    return complete(call_type, messages, **kwargs).choices[0].message.content
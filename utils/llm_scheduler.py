@@ -0,0 +1,220 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import date
+
+import openai
+
+from utils import metrics, safe_files
+
+TOKEN_USAGE_FILE = "assets/token_usage.json"
+
+# Lower value = served first. Interactive chat turns go before everything else
+DEFAULT_PRIORITIES = {
+    "chat": 0,
+    "vocab": 1,
+    "lesson_plan": 1,
+    "quiz": 2,
+    "summary": 3,
+    "pdf": 3,
+    "opening": 3
+}
+BACKGROUND_PRIORITY = 3
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_TOKENS_PER_MINUTE = 200000
+DEFAULT_DAILY_USER_TOKENS = 500000
+# Completion tokens assumed when reserving rate-limit capacity, corrected after the response
+EXPECTED_COMPLETION_TOKENS = 600
+
+
+class BudgetExceededError(openai.OpenAIError):
+    """Raised when a user has used up their daily token budget"""
+
+
+class QueueTimeoutError(openai.OpenAIError):
+    """Raised when a request could not be scheduled before its deadline"""
+
+
+def estimate_prompt_tokens(messages):
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+
+
+class Scheduler:
+    """
+    Process-wide admission control for LLM requests: caps concurrent requests and
+    tokens per minute, serving waiting requests by priority (then arrival order)
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.max_concurrent = max_concurrent
+        self.tokens_per_minute = tokens_per_minute
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._window = deque()  # [timestamp, tokens] of requests started in the last minute
+        self._stats = {}
+
+    def _window_tokens(self, now):
+        while self._window and now - self._window[0][0] >= 60:
+            self._window.popleft()
+        return sum(tokens for _, tokens in self._window)
+
+    def _tpm_wait(self, tokens, now):
+        """Seconds until the request fits in the per-minute budget (0 if it fits now)"""
+        used = self._window_tokens(now)
+        if not self._window or used + tokens <= self.tokens_per_minute:
+            return 0
+        freed = used + tokens - self.tokens_per_minute
+        for started, window_tokens in self._window:
+            freed -= window_tokens
+            if freed <= 0:
+                return max(60 - (now - started), 0.01)
+        return 60
+
+    def acquire(self, priority, tokens, timeout=None):
+        """
+        Wait for a slot
+
+        Returns:
+            list: Reservation [timestamp, tokens], to pass to release()
+
+        Raises:
+            QueueTimeoutError: If no slot was granted within timeout seconds
+        """
+        entry = (priority, next(self._sequence))
+        queued_at = time.monotonic()
+        deadline = queued_at + timeout if timeout is not None else None
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] == entry and self._active < self.max_concurrent:
+                        wait = self._tpm_wait(tokens, now)
+                        if wait == 0:
+                            break
+                    if deadline is not None:
+                        if now >= deadline:
+                            metrics.LLM_SCHEDULER_REJECTIONS.inc(reason="queue_timeout")
+                            raise QueueTimeoutError(f"LLM request waited more than {timeout:.1f}s for a slot")
+                        wait = min(wait, deadline - now) if wait is not None else deadline - now
+                    self._cond.wait(wait)
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self._active += 1
+            reservation = [now, tokens]
+            self._window.append(reservation)
+            self._record_wait(priority, now - queued_at)
+            self._cond.notify_all()
+            return reservation
+
+    def release(self, reservation, actual_tokens=None):
+        """Free the slot, correcting the reserved tokens with the actual usage if known"""
+        with self._cond:
+            self._active -= 1
+            if actual_tokens is not None:
+                reservation[1] = actual_tokens
+            self._cond.notify_all()
+
+    def _record_wait(self, priority, waited):
+        stats = self._stats.setdefault(priority, {"requests": 0, "total_wait": 0.0, "max_wait": 0.0})
+        stats["requests"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+        metrics.LLM_SCHEDULER_WAIT_SECONDS.observe(waited, priority=priority)
+
+    def stats(self):
+        """
+        Returns:
+            dict: queue depth, active requests, tokens in the last minute and wait times per priority
+        """
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue),
+                "active": self._active,
+                "tokens_last_minute": self._window_tokens(time.monotonic()),
+                "wait_by_priority": {
+                    priority: dict(s, avg_wait=s["total_wait"] / s["requests"])
+                    for priority, s in self._stats.items()
+                }
+            }
+
+
+# --- Per-user daily token budgets ---
+
+def _load_usage():
+    try:
+        with open(TOKEN_USAGE_FILE, "r") as f:
+            usage = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        usage = {}
+    # Only today's counters are kept
+    today = date.today().isoformat()
+    return usage if usage.get("date") == today else {"date": today, "users": {}}
+
+
+def get_user_tokens_today(user_id):
+    # Writes replace the file atomically, so it can be read without the lock
+    return _load_usage()["users"].get(user_id, 0)
+
+
+def check_budget(user_id, daily_budget):
+    """Raise BudgetExceededError if the user has no budget left today"""
+    if daily_budget and get_user_tokens_today(user_id) >= daily_budget:
+        metrics.LLM_SCHEDULER_REJECTIONS.inc(reason="budget")
+        raise BudgetExceededError(
+            f"Daily token budget of {daily_budget} tokens used up. It resets tomorrow."
+        )
+
+
+def record_user_tokens(user_id, tokens):
+    os.makedirs(os.path.dirname(TOKEN_USAGE_FILE), exist_ok=True)
+    # The file lock also serializes the threads of this process, and other processes
+    with safe_files.locked(TOKEN_USAGE_FILE):
+        usage = _load_usage()
+        usage["users"][user_id] = usage["users"].get(user_id, 0) + tokens
+        safe_files.atomic_write(TOKEN_USAGE_FILE, json.dumps(usage))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(config):
+    """The process-wide scheduler, created from config on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                config.get('llm_max_concurrent', DEFAULT_MAX_CONCURRENT),
+                config.get('llm_tokens_per_minute', DEFAULT_TOKENS_PER_MINUTE)
+            )
+        return _scheduler
+
+
+def get_priority(config, call_type):
+    return config.get('llm_priorities', DEFAULT_PRIORITIES).get(call_type, BACKGROUND_PRIORITY)
+
+
+def get_scheduler_stats():
+    """Queue depth and wait-time metrics of the process-wide scheduler (None before first use)"""
+    return _scheduler.stats() if _scheduler else None
+
+
+def _scheduler_gauge(field):
+    return lambda: _scheduler.stats()[field] if _scheduler else 0
+
+
+metrics.LLM_SCHEDULER_QUEUE_DEPTH.set_function(_scheduler_gauge("queue_depth"))
+metrics.LLM_SCHEDULER_ACTIVE.set_function(_scheduler_gauge("active"))
+metrics.LLM_SCHEDULER_TOKENS_LAST_MINUTE.set_function(_scheduler_gauge("tokens_last_minute"))
@@ -0,0 +1,357 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_FILE = "assets/metrics.prom"
+DEFAULT_FILE_INTERVAL = 15
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Metrics are off unless "metrics": {"enabled": true} is set in config or TUTOR_METRICS=1.
+# Disabled, every inc()/observe() returns after one check of this flag.
+_enabled = None
+_registry = {}
+_registry_lock = threading.Lock()
+_exporter_started = False
+
+
+def _load_settings():
+    try:
+        with open('utils/config.json', 'r') as f:
+            settings = json.load(f).get('metrics', {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        settings = {}
+    if os.environ.get("TUTOR_METRICS") == "1":
+        settings = dict(settings, enabled=True)
+    return settings
+
+
+def enabled():
+    global _enabled
+    if _enabled is None:
+        settings = _load_settings()
+        _enabled = bool(settings.get("enabled", False))
+        if _enabled:
+            start_exporter(settings)
+    return _enabled
+
+
+def _label_key(label_names, labels):
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+
+def _format_labels(label_names, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, key)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not enabled():
+            return
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, optionally split by labels"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not enabled():
+            return
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block in seconds"""
+        if not enabled():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    le = (("le", _format_value(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+                inf = (("le", "+Inf"),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, inf)} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(state[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value that goes up and down, set directly or read from a function when the metrics are rendered"""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        if not enabled():
+            return
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """
+        Read the values from function() at render time instead
+
+        Args:
+            function: Returns a number, or for a gauge with labels a dict of
+                      label value tuples (in label order) to numbers
+        """
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception:
+                logger.exception("Could not read gauge %s", self.name)
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+            values = {tuple(str(v) for v in key): value for key, value in values.items()}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+def _register(metric):
+    with _registry_lock:
+        if metric.name in _registry:
+            return _registry[metric.name]
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name, documentation, labels=()):
+    return _register(Counter(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, documentation, labels, buckets))
+
+
+def gauge(name, documentation, labels=()):
+    return _register(Gauge(name, documentation, labels))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# --- Exporter: HTTP endpoint and/or a file for the scraper ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def write_file(path=DEFAULT_METRICS_FILE):
+    """Write the metrics to a file, replacing it atomically so a scraper never reads half of it"""
+    # Imported here because safe_files records its lock waits in these metrics
+    from utils import safe_files
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # The temporary file name is unique per process, so several app processes can share the file
+    safe_files.atomic_write(path, render().encode("utf-8"))
+
+
+def _write_file_periodically(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_file(path)
+        except OSError as e:
+            logger.warning("Could not write metrics to %s: %s", path, e)
+
+
+def start_exporter(settings):
+    """
+    Start the exporters configured in settings, once per process:
+    "port" serves /metrics over HTTP, "file" is rewritten every "file_interval" seconds
+    """
+    global _exporter_started
+    with _registry_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    port = settings.get("port")
+    if port:
+        try:
+            server = ThreadingHTTPServer((settings.get("host", "127.0.0.1"), port), _MetricsHandler)
+        except OSError as e:
+            # Another process of the app already serves this port
+            logger.warning("Metrics endpoint not started on port %s: %s", port, e)
+        else:
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    path = settings.get("file", DEFAULT_METRICS_FILE)
+    if path:
+        threading.Thread(
+            target=_write_file_periodically,
+            args=(path, settings.get("file_interval", DEFAULT_FILE_INTERVAL)),
+            name="metrics-file",
+            daemon=True
+        ).start()
+
+
+# --- Application metrics ---
+
+CHAT_TURN_SECONDS = histogram(
+    "tutor_chat_turn_seconds", "Time from sending a chat message to the complete tutor reply"
+)
+TIME_TO_FIRST_TOKEN_SECONDS = histogram(
+    "tutor_chat_time_to_first_token_seconds", "Time from sending a chat message to the first streamed token"
+)
+LLM_TOKENS = counter(
+    "tutor_llm_tokens_total", "Tokens sent to (in) and received from (out) the model", ("call_type", "direction")
+)
+STORAGE_BYTES = counter(
+    "tutor_storage_bytes_total", "Bytes read from and written to the JSON asset files", ("file", "operation")
+)
+STORAGE_SECONDS = histogram(
+    "tutor_storage_operation_seconds", "Duration of JSON asset file reads and writes", ("file", "operation")
+)
+STORAGE_LOCK_WAIT_SECONDS = histogram(
+    "tutor_storage_lock_wait_seconds", "Time spent waiting for the lock of a JSON asset file", ("file",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+STORAGE_WRITE_RETRIES = counter(
+    "tutor_storage_write_retries_total", "Updates of a JSON asset file retried because it changed meanwhile", ("file",)
+)
+STORAGE_WRITE_BEHIND = counter(
+    "tutor_storage_write_behind_total",
+    "Background writes of JSON asset files by result (queued, coalesced, flushed, failed, dropped)", ("file", "result")
+)
+CACHE_REQUESTS = counter(
+    "tutor_cache_requests_total", "Cache lookups by cache and result (hit or miss)", ("cache", "result")
+)
+END_SESSION_SECONDS = histogram(
+    "tutor_end_session_seconds", "Duration of the end-of-session pipeline steps", ("step",)
+)
+PDF_SECONDS = histogram(
+    "tutor_pdf_step_seconds", "Duration of the PDF summary generation steps", ("step",)
+)
+CHAT_GENERATIONS = counter(
+    "tutor_chat_generations_total",
+    "Streamed chat replies by result (started, completed, cancelled, failed)", ("result",)
+)
+CHAT_WASTED_TOKENS = counter(
+    "tutor_chat_wasted_tokens_total",
+    "Estimated tokens sent (in) and generated (out) for chat replies that were cancelled", ("direction",)
+)
+CHAT_GENERATIONS_RUNNING = gauge(
+    "tutor_chat_generations_running", "Streamed chat replies being generated right now"
+)
+LLM_COALESCING = counter(
+    "tutor_llm_coalescing_requests_total",
+    "LLM requests that went upstream or were coalesced with an identical in-flight request", ("call_type", "result")
+)
+LLM_IN_FLIGHT = gauge(
+    "tutor_llm_requests_in_flight", "Distinct LLM requests (after coalescing) in flight right now"
+)
+LLM_SCHEDULER_QUEUE_DEPTH = gauge(
+    "tutor_llm_scheduler_queue_depth", "LLM requests waiting for a scheduler slot"
+)
+LLM_SCHEDULER_ACTIVE = gauge(
+    "tutor_llm_scheduler_active_requests", "LLM requests holding a scheduler slot"
+)
+LLM_SCHEDULER_TOKENS_LAST_MINUTE = gauge(
+    "tutor_llm_scheduler_tokens_last_minute", "Tokens of the LLM requests started in the last minute (tokens-per-minute usage)"
+)
+LLM_SCHEDULER_WAIT_SECONDS = histogram(
+    "tutor_llm_scheduler_wait_seconds", "Time LLM requests waited for a scheduler slot", ("priority",)
+)
+LLM_SCHEDULER_REJECTIONS = counter(
+    "tutor_llm_scheduler_rejections_total",
+    "LLM requests rejected before reaching upstream (budget: daily user budget used up, queue_timeout)", ("reason",)
+)
@@ -0,0 +1,125 @@
+import json
+import re
+from difflib import SequenceMatcher
+from datetime import datetime
+
+from utils import tenancy, safe_files
+
+MISTAKE_INDEX_FILE = "mistake_index.json"
+
+# Two mistakes belong to the same cluster above either similarity
+TOKEN_SIMILARITY = 0.6
+TEXT_SIMILARITY = 0.85
+# Variants compared per cluster, to keep updates cheap as clusters grow
+MAX_COMPARED_VARIANTS = 5
+
+
+def normalize_mistake(text):
+    """Lower-case, drop punctuation/quotes and collapse whitespace"""
+    text = re.sub(r"[^\w\s/]", " ", text.casefold())
+    return " ".join(text.split())
+
+
+def _similar(a, b):
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    if tokens_a and tokens_b:
+        if len(tokens_a & tokens_b) / len(tokens_a | tokens_b) >= TOKEN_SIMILARITY:
+            return True
+    return SequenceMatcher(None, a, b).ratio() >= TEXT_SIMILARITY
+
+
+def _find_cluster(index, normalized):
+    for cluster in index["clusters"]:
+        variants = sorted(cluster["variants"], key=cluster["variants"].get, reverse=True)
+        if any(_similar(normalized, normalize_mistake(v)) for v in variants[:MAX_COMPARED_VARIANTS]):
+            return cluster
+    return None
+
+
+def _week(timestamp):
+    year, week, _ = datetime.fromisoformat(timestamp).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def empty_index():
+    return {"indexed_sessions": [], "clusters": []}
+
+
+def load_index():
+    """Load the index, or None if it has never been built"""
+    try:
+        with open(tenancy.user_path(MISTAKE_INDEX_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_index(index):
+    safe_files.atomic_write(tenancy.user_path(MISTAKE_INDEX_FILE), json.dumps(index, ensure_ascii=False))
+
+
+def locked():
+    """Lock for a load_index/save_index update, shared with other processes"""
+    return safe_files.locked(tenancy.user_path(MISTAKE_INDEX_FILE))
+
+
+def add_session(index, session_id, mistakes, timestamp):
+    """
+    Add one session's mistakes to the index in place. Sessions already indexed are skipped.
+
+    Args:
+        index: Mistake index dict
+        session_id: Session ID
+        mistakes: List of mistake strings from the session summary
+        timestamp: ISO timestamp of the session end
+
+    Returns:
+        bool: True if the index changed
+    """
+    if session_id in index["indexed_sessions"]:
+        return False
+    index["indexed_sessions"].append(session_id)
+
+    week = _week(timestamp)
+    for mistake in mistakes or []:
+        normalized = normalize_mistake(mistake)
+        if not normalized:
+            continue
+        cluster = _find_cluster(index, normalized)
+        if cluster is None:
+            cluster = {
+                "label": mistake.strip(),
+                "variants": {},
+                "count": 0,
+                "sessions": 0,
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+                "by_week": {},
+                "last_session": None
+            }
+            index["clusters"].append(cluster)
+        cluster["variants"][mistake.strip()] = cluster["variants"].get(mistake.strip(), 0) + 1
+        cluster["count"] += 1
+        if cluster["last_session"] != session_id:
+            cluster["sessions"] += 1
+            cluster["last_session"] = session_id
+        cluster["first_seen"] = min(cluster["first_seen"], timestamp)
+        cluster["last_seen"] = max(cluster["last_seen"], timestamp)
+        cluster["by_week"][week] = cluster["by_week"].get(week, 0) + 1
+        # The most frequent wording represents the cluster
+        cluster["label"] = max(cluster["variants"], key=cluster["variants"].get)
+    return True
+
+
+def build_index(sessions):
+    """Build the index from scratch from completed sessions"""
+    index = empty_index()
+    for session in sorted(sessions, key=lambda s: s.get("end_time") or ""):
+        add_session(index, session["session_id"], session.get("common_mistakes"),
+                    session.get("end_time") or session["start_time"])
+    return index
+
+
+def top_mistakes(index, k=10):
+    """Most frequent mistake clusters, most recent first on ties"""
+    return sorted(index["clusters"], key=lambda c: (c["count"], c["last_seen"]), reverse=True)[:k]
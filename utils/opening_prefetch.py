@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import openai
+
+from utils import storage, prompts, llm, metrics, tenancy, safe_files
+
+logger = logging.getLogger(__name__)
+
+OPENINGS_FILE = "prefetched_openings.json"
+DEFAULT_PREFETCH_COUNT = 3
+DEFAULT_TTL_MINUTES = 24 * 60
+
+_lock = threading.Lock()
+_workers = {}  # user id -> prefetch thread
+
+
+def opening_message(assignment):
+    """The preset learner message that starts a practice session"""
+    return f"Let's practice {assignment}"
+
+
+def _fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def plan_fingerprint(lesson_plan):
+    """Fingerprint of the plan's lessons and assignments (ignoring completion)"""
+    return _fingerprint([
+        [lesson["week_or_day"], [a["title"] for a in lesson["assignments"]]]
+        for lesson in lesson_plan
+    ])
+
+
+def _key(lesson_key, assignment):
+    return f"{lesson_key}\x1f{assignment}"
+
+
+def _empty():
+    return {"plan": None, "openings": {}, "hits": 0, "misses": 0}
+
+
+def _load():
+    try:
+        with open(tenancy.user_path(OPENINGS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _empty()
+
+
+def _save(data):
+    safe_files.atomic_write(tenancy.user_path(OPENINGS_FILE), json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def _file_locked():
+    """Lock for a read-modify-write of the openings file, shared with other processes"""
+    return safe_files.locked(tenancy.user_path(OPENINGS_FILE))
+
+
+def _fresh(opening, ttl_minutes):
+    return datetime.now() - datetime.fromisoformat(opening["created"]) <= timedelta(minutes=ttl_minutes)
+
+
+def upcoming_assignments(lesson_plan, count):
+    """
+    The next incomplete assignments without a session yet
+
+    Returns:
+        list: (lesson_key, assignment) tuples in plan order
+    """
+    upcoming = []
+    for lesson in lesson_plan:
+        for assignment in lesson["assignments"]:
+            if len(upcoming) >= count:
+                return upcoming
+            if assignment["completed"]:
+                continue
+            if storage.get_session_by_assignment(lesson["week_or_day"], assignment["title"]):
+                continue
+            upcoming.append((lesson["week_or_day"], assignment["title"]))
+    return upcoming
+
+
+def take_opening(lesson_plan, lesson_key, assignment, layout, ttl_minutes=DEFAULT_TTL_MINUTES):
+    """
+    Take the prefetched tutor reply to opening_message(assignment), if one is
+    still valid for this plan and prompt layout. Each opening is used only once.
+
+    Returns:
+        str: The tutor's opening message, or None on a miss
+    """
+    with _file_locked():
+        data = _load()
+        opening = data["openings"].pop(_key(lesson_key, assignment), None)
+        hit = (
+            opening is not None
+            and data["plan"] == plan_fingerprint(lesson_plan)
+            and opening["layout"] == _fingerprint(layout)
+            and _fresh(opening, ttl_minutes)
+        )
+        data["hits" if hit else "misses"] += 1
+        _save(data)
+    metrics.CACHE_REQUESTS.inc(cache="opening_prefetch", result="hit" if hit else "miss")
+    return opening["content"] if hit else None
+
+
+def _prefetch(fingerprint, build_layout, targets, model, temperature, api_key):
+    for lesson_key, assignment in targets:
+        layout = build_layout(lesson_key, assignment)
+        messages = prompts.assemble_messages(layout, [{"role": "user", "content": opening_message(assignment)}])
+        try:
+            response = llm.complete("opening", messages, model=model, temperature=temperature, api_key=api_key)
+        except openai.OpenAIError as e:
+            logger.warning("Prefetching the opening of %r failed: %s", assignment, e)
+            return
+        prompts.record_usage("opening", response.usage)
+
+        with _file_locked():
+            data = _load()
+            if data["plan"] != fingerprint:
+                # The plan changed while this was generated
+                return
+            data["openings"][_key(lesson_key, assignment)] = {
+                "content": response.choices[0].message.content,
+                "layout": _fingerprint(layout),
+                "created": datetime.now().isoformat()
+            }
+            _save(data)
+
+
+def prefetch_in_background(lesson_plan, build_layout, model, temperature, api_key=None,
+                           count=DEFAULT_PREFETCH_COUNT, ttl_minutes=DEFAULT_TTL_MINUTES):
+    """
+    Pre-generate the opening tutor turn for the next few incomplete assignments
+    in a background thread. Openings of a previous version of the plan are
+    dropped, fresh ones are kept. Does nothing if a worker is already running
+    for the current user.
+
+    Args:
+        lesson_plan: Current lesson plan
+        build_layout: Callable (lesson_key, assignment) -> prompt layout for the chat
+        count: Number of upcoming assignments to prepare
+
+    Returns:
+        bool: True if a worker was started
+    """
+    user_id = tenancy.current_user_id()
+    with _lock, _file_locked():
+        worker = _workers.get(user_id)
+        if worker is not None and worker.is_alive():
+            return False
+        data = _load()
+        fingerprint = plan_fingerprint(lesson_plan)
+        changed = data["plan"] != fingerprint
+        if changed:
+            data = dict(_empty(), hits=data["hits"], misses=data["misses"], plan=fingerprint)
+        fresh = {k: o for k, o in data["openings"].items() if _fresh(o, ttl_minutes)}
+        changed = changed or len(fresh) < len(data["openings"])
+        data["openings"] = fresh
+        # Every lesson plan rerun gets here, so the file is only rewritten when something was dropped
+        if changed:
+            _save(data)
+        targets = [
+            (lesson_key, assignment) for lesson_key, assignment in upcoming_assignments(lesson_plan, count)
+            if _key(lesson_key, assignment) not in data["openings"]
+        ]
+        if not targets:
+            return False
+        worker = _workers[user_id] = threading.Thread(
+            target=tenancy.bind(_prefetch),
+            args=(fingerprint, build_layout, targets, model, temperature, api_key),
+            name="opening-prefetch",
+            daemon=True
+        )
+        worker.start()
+    return True
+
+
+def get_stats():
+    """
+    Returns:
+        dict: prefetched openings, hits, misses and hit_rate (None before the first lookup)
+    """
+    data = _load()
+    lookups = data["hits"] + data["misses"]
+    return {
+        "openings": len(data["openings"]),
+        "hits": data["hits"],
+        "misses": data["misses"],
+        "hit_rate": data["hits"] / lookups if lookups else None
+    }
@@ -1,8 +1,6 @@
 import json
-import openai
-import streamlit as st
 from datetime import datetime
-from utils import storage
+from utils import storage, structured_output, profiler, metrics, tenancy
 import os
 
 
@@ -20,7 +18,7 @@ def escape_html(text):
 
 def save_pdf_json(pdf_data, session_id=None, message_count=0):
     """Save PDF JSON to file for reuse with metadata"""
-    json_dir = "assets/pdf_jsons"
+    json_dir = tenancy.user_path("pdf_jsons")
     os.makedirs(json_dir, exist_ok=True)
     
     # Add metadata to track when to regenerate
@@ -47,7 +45,7 @@ def load_pdf_json(session_id=None, current_message_count=0):
     Load PDF JSON if it exists and is still valid
     Returns None if needs regeneration
     """
-    json_dir = "assets/pdf_jsons"
+    json_dir = tenancy.user_path("pdf_jsons")
     
     if session_id:
         filename = f"pdf_data_{session_id}.json"
@@ -73,6 +71,7 @@ def load_pdf_json(session_id=None, current_message_count=0):
     return None
 
 
+@profiler.profiled("pdf")
 def generate_pdf_json(messages, language, session=None):
     """
     Generate detailed JSON structure for PDF using AI
@@ -142,36 +141,15 @@ def generate_pdf_json(messages, language, session=None):
     with open('utils/config.json', 'r') as f:
         config = json.load(f)
     
-    client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-    response = client.chat.completions.create(
+    # Missing or malformed fields are re-requested, then filled with empty values
+    pdf_data = structured_output.request_structured(
+        "pdf_review",
+        [{"role": "user", "content": prompt}],
+        call_type="pdf",
         model=config.get('openai_model_name', 'gpt-4o'),
-        messages=[{"role": "user", "content": prompt}],
         temperature=0.3
     )
     
-    # Extract JSON
-    import re
-    json_match = re.search(r'\{.*\}', response.choices[0].message.content, re.DOTALL)
-    
-    if json_match:
-        pdf_data = json.loads(json_match.group())
-    else:
-        # Fallback structure
-        pdf_data = {
-            "objectives": "Practice conversation completed",
-            "learnings": {
-                "grammar_points": [],
-                "vocabulary": [],
-                "structures": [],
-                "key_concepts": []
-            },
-            "improvements": {
-                "areas_to_focus": [],
-                "common_mistakes": [],
-                "recommendations": []
-            }
-        }
-    
     # Save JSON for reuse with message count
     if session:
         save_pdf_json(pdf_data, session['session_id'], message_count)
@@ -181,6 +159,7 @@ def generate_pdf_json(messages, language, session=None):
     return pdf_data
 
 
+@profiler.profiled("pdf")
 def create_html_summary(pdf_data, session=None, language="English"):
     """
     Create beautiful HTML summary that can be printed as PDF
@@ -359,6 +338,7 @@ def create_html_summary(pdf_data, session=None, language="English"):
     return html
 
 
+@profiler.profiled("pdf")
 def create_html_from_json(pdf_data, session=None, is_free_chat=False):
     """
     Create HTML summary file (can be printed as PDF)
@@ -386,7 +366,7 @@ def create_html_from_json(pdf_data, session=None, is_free_chat=False):
         filename = f"free_chat_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
     
     # Create PDFs directory if it doesn't exist
-    pdf_dir = "assets/pdfs"
+    pdf_dir = tenancy.user_path("pdfs")
     os.makedirs(pdf_dir, exist_ok=True)
     html_path = os.path.join(pdf_dir, filename)
     
@@ -400,6 +380,7 @@ def create_html_from_json(pdf_data, session=None, is_free_chat=False):
     return html_path
 
 
+@profiler.profiled("pdf")
 def generate_session_pdf(session_id, messages, language):
     """
     Generate HTML summary for a session (can be printed as PDF)
@@ -413,15 +394,18 @@ def generate_session_pdf(session_id, messages, language):
         str: Path to generated HTML file
     """
     session = storage.get_session(session_id)
-    pdf_data = generate_pdf_json(messages, language, session)
-    html_path = create_html_from_json(pdf_data, session)
+    with metrics.PDF_SECONDS.time(step="review_data"):
+        pdf_data = generate_pdf_json(messages, language, session)
+    with metrics.PDF_SECONDS.time(step="html"):
+        html_path = create_html_from_json(pdf_data, session)
     
-    # Update session with pdf_path
-    storage.update_session(session_id, {"pdf_path": html_path})
+    # Update session with pdf_path, keeping changes made to it while the PDF was generated
+    storage.modify_session(session_id, lambda current: {"pdf_path": html_path}, session)
     
     return html_path
 
 
+@profiler.profiled("pdf")
 def generate_free_chat_pdf(messages, language):
     """
     Generate HTML summary for free chat (can be printed as PDF)
@@ -433,7 +417,9 @@ def generate_free_chat_pdf(messages, language):
     Returns:
         str: Path to generated HTML file
     """
-    pdf_data = generate_pdf_json(messages, language, session=None)
-    html_path = create_html_from_json(pdf_data, is_free_chat=True)
+    with metrics.PDF_SECONDS.time(step="review_data"):
+        pdf_data = generate_pdf_json(messages, language, session=None)
+    with metrics.PDF_SECONDS.time(step="html"):
+        html_path = create_html_from_json(pdf_data, is_free_chat=True)
     return html_path
 
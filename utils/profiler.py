@@ -0,0 +1,224 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_LOG_FILE = "assets/profile_runs.jsonl"
+
+# The run being profiled in this thread (each Streamlit rerun has its own script thread).
+# Code running without a profiled run, e.g. background workers, is not timed at all.
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def _profiling_configured():
+    if os.environ.get("TUTOR_PROFILE") == "1":
+        return True
+    try:
+        with open('utils/config.json', 'r') as f:
+            return json.load(f).get('profiling', False)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+
+def start_run(page, force=False):
+    """
+    Start profiling a script run of a page, if force is set, "profiling" is
+    enabled in config or TUTOR_PROFILE=1
+
+    Returns:
+        bool: True if the run is profiled
+    """
+    enabled = force or _profiling_configured()
+    _local.run = {
+        "page": page,
+        "started": time.perf_counter(),
+        "timestamp": datetime.now().isoformat(),
+        "timings": [],
+        "stack": []
+    } if enabled else None
+    return bool(enabled)
+
+
+def is_active():
+    return getattr(_local, "run", None) is not None
+
+
+@contextmanager
+def timed(category, name=None):
+    """
+    Time a block as part of the current run. Blocks nested in a block of the
+    same category are recorded but not added twice to the category total.
+    """
+    run = getattr(_local, "run", None)
+    if run is None:
+        yield
+        return
+    block = {"category": category, "name": name or category, "start": time.perf_counter(),
+             "nested": any(b["category"] == category for b in run["stack"])}
+    run["stack"].append(block)
+    try:
+        yield
+    finally:
+        # Already recorded if the run was finished inside the block (rerun/stop);
+        # a generator's block may not be the innermost one
+        for i in range(len(run["stack"]) - 1, -1, -1):
+            if run["stack"][i] is block:
+                del run["stack"][i]
+                _record_block(run, block, time.perf_counter())
+                break
+
+
+def _record_block(run, block, end):
+    run["timings"].append({
+        "category": block["category"],
+        "name": block["name"],
+        "start": round(block["start"] - run["started"], 6),
+        "duration": round(end - block["start"], 6),
+        "nested": block["nested"]
+    })
+
+
+def section(name):
+    """Time a part of the page script (widget building, data preparation...)"""
+    return timed("page", name)
+
+
+def profiled(category):
+    """Decorator timing every call of a function (or a generator's whole iteration)"""
+    def decorator(func):
+        name = f"{func.__module__.split('.')[-1]}.{func.__name__}"
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if getattr(_local, "run", None) is None:
+                    return (yield from func(*args, **kwargs))
+                with timed(category, name):
+                    return (yield from func(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "run", None) is None:
+                return func(*args, **kwargs)
+            with timed(category, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summarize(run):
+    """
+    Aggregate a run's timings
+
+    Returns:
+        dict: total, seconds per category and per function, and the time not
+              covered by any instrumented call ("other": Streamlit, widgets, page logic)
+    """
+    total = time.perf_counter() - run["started"]
+    by_category = {}
+    by_name = {}
+    for t in run["timings"]:
+        if t["category"] != "page" and not t["nested"]:
+            by_category[t["category"]] = by_category.get(t["category"], 0.0) + t["duration"]
+        entry = by_name.setdefault((t["category"], t["name"]), {"calls": 0, "duration": 0.0})
+        entry["calls"] += 1
+        entry["duration"] += t["duration"]
+    # Instrumented calls inside other instrumented calls (e.g. storage inside pdf) are counted once
+    top_level = sum(
+        t["duration"] for t in run["timings"]
+        if t["category"] != "page" and not t["nested"] and not _inside_other(t, run["timings"])
+    )
+    return {
+        "total": total,
+        "by_category": by_category,
+        "by_name": [
+            {"category": category, "name": name, **entry}
+            for (category, name), entry in sorted(by_name.items(), key=lambda item: -item[1]["duration"])
+        ],
+        "other": max(total - top_level, 0.0)
+    }
+
+
+def _inside_other(timing, timings):
+    end = timing["start"] + timing["duration"]
+    return any(
+        t is not timing and t["category"] not in ("page", timing["category"])
+        and t["start"] <= timing["start"] and end <= t["start"] + t["duration"]
+        for t in timings
+    )
+
+
+def finish_run():
+    """
+    End the current run and append its record to PROFILE_LOG_FILE
+
+    Returns:
+        dict: summarize() result, or None if the run was not profiled
+    """
+    run = getattr(_local, "run", None)
+    if run is None:
+        return None
+    _local.run = None
+    # Blocks the run ends in (a rerun or stop inside a section) end now
+    end = time.perf_counter()
+    while run["stack"]:
+        _record_block(run, run["stack"].pop(), end)
+    summary = summarize(run)
+    record = {
+        "timestamp": run["timestamp"],
+        "page": run["page"],
+        "total": round(summary["total"], 6),
+        "by_category": {k: round(v, 6) for k, v in summary["by_category"].items()},
+        "other": round(summary["other"], 6),
+        "timings": run["timings"]
+    }
+    with _write_lock:
+        os.makedirs(os.path.dirname(PROFILE_LOG_FILE), exist_ok=True)
+        with open(PROFILE_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    return summary
+
+
+def rerun():
+    """Finish the run, then st.rerun() (which ends the script before render_panel)"""
+    import streamlit as st
+    finish_run()
+    st.rerun()
+
+
+def stop():
+    """Finish the run, then st.stop()"""
+    import streamlit as st
+    finish_run()
+    st.stop()
+
+
+def switch_page(page):
+    """Finish the run, then st.switch_page(page)"""
+    import streamlit as st
+    finish_run()
+    st.switch_page(page)
+
+
+def render_panel():
+    """Finish the run and show its breakdown in a collapsed debug panel (only for profiled runs)"""
+    summary = finish_run()
+    if summary is None:
+        return
+    import streamlit as st
+    with st.expander(f"🛠️ Profiler: {summary['total'] * 1000:.0f} ms this run", expanded=False):
+        rows = [{"part": category, "ms": round(seconds * 1000, 1)} for category, seconds in summary["by_category"].items()]
+        rows.append({"part": "other (Streamlit, widgets, page code)", "ms": round(summary["other"] * 1000, 1)})
+        st.table(rows)
+        st.dataframe(
+            [
+                {"category": e["category"], "name": e["name"], "calls": e["calls"], "ms": round(e["duration"] * 1000, 1)}
+                for e in summary["by_name"]
+            ],
+            hide_index=True
+        )
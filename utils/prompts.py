@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+PROMPT_USAGE_LOG_FILE = "assets/prompt_cache_usage.jsonl"
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+# The chat prompt is laid out from most to least stable, so consecutive requests
+# share the longest possible prefix and the provider's prompt cache applies:
+#   1. static prefix   - role instructions, only depend on the configured language
+#   2. profile block   - level, goals, previous sessions and recurring mistakes
+#   3. conversation    - append-only history of the current chat
+#   4. dynamic tail    - the assignment being practiced right now
+
+
+def tutor_instructions(language):
+    """Static role instructions for the tutor"""
+    return f"""
+        You are a friendly personal {language} language tutor, helping to improve speaking skills.
+
+        **Your role:**
+        - Speak only in {language}, but provide translations if requested.
+        - Plan lesson topics covering everyday situations, professional settings, and cultural aspects of {language} speaking countries.
+        - Provide a list of key words and phrases for each topic, along with examples of usage.
+        - Check user's answers to questions, correct mistakes, and explain grammar and pronunciation nuances. When correcting mistakes, you strike out incorrect words and write the correct ones in bold next to them, so the user can see errors. In the case of grammar mistakes, you remind the user of the relevant rule.
+        - Keep the conversation going, ask guiding questions, engage the user in dialogues, and help them develop fluency.
+        - Suggest more advanced vocabulary based on responses, ask follow-up questions, and encourage the user to use new words in context.
+        - Maintain a vocabulary list of new words and occasionally remind the user to use them in conversation.
+        - Recommend additional materials: movies, books, podcasts, and articles in {language}.
+        - Encourage the user to think in {language} and not be afraid of mistakes, creating a friendly and motivating learning environment.
+        - When practicing a specific assignment, monitor progress and suggest ending the session with a final test when you think the goals have been achieved.
+        """
+
+
+def student_profile(user_level, user_goals, summaries_context):
+    """Slowly changing block: student profile and learning history"""
+    return f"""
+        **Student Profile:**
+        - Current level: {user_level}
+        - Learning goals: {user_goals if user_goals else "General language improvement"}
+
+        {summaries_context}
+        """
+
+
+def current_assignment(lesson_key, assignment):
+    """Dynamic tail: the assignment being practiced, if any"""
+    if not assignment:
+        return None
+    return f"""
+        **Current assignment:** {assignment} ({lesson_key})
+        Keep the conversation focused on this assignment.
+        """
+
+
+def build_prompt_layout(language, user_level, user_goals, summaries_context, lesson_key=None, assignment=None):
+    """
+    Build the system messages of the chat prompt, split by how often they change
+
+    Returns:
+        dict: {"static", "profile", "dynamic"} system messages ("dynamic" may be None)
+    """
+    tail = current_assignment(lesson_key, assignment)
+    return {
+        "static": {"role": "system", "content": tutor_instructions(language)},
+        "profile": {"role": "system", "content": student_profile(user_level, user_goals, summaries_context)},
+        "dynamic": {"role": "system", "content": tail} if tail else None
+    }
+
+
+def assemble_messages(layout, messages):
+    """
+    Assemble the full message list for a chat completion: stable system blocks
+    first, then the conversation, then the dynamic tail. Only role and content
+    are sent, so the same history always serializes to the same prefix.
+    """
+    full_messages = []
+    if layout:
+        full_messages.extend([layout["static"], layout["profile"]])
+    full_messages.extend({"role": m["role"], "content": m["content"]} for m in messages)
+    if layout and layout.get("dynamic"):
+        full_messages.append(layout["dynamic"])
+    return full_messages
+
+
+def record_usage(call_type, usage):
+    """
+    Record prompt/cached/completion token counts from a completion's usage data
+
+    Args:
+        call_type: Kind of request, e.g. "chat" or "summary"
+        usage: response.usage from the OpenAI client (may be None)
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "call_type": call_type,
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": usage.completion_tokens or 0
+    }
+
+    with _stats_lock:
+        stats = _stats.setdefault(call_type, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+        stats["requests"] += 1
+        stats["prompt_tokens"] += record["prompt_tokens"]
+        stats["cached_tokens"] += record["cached_tokens"]
+        stats["completion_tokens"] += record["completion_tokens"]
+
+        os.makedirs(os.path.dirname(PROMPT_USAGE_LOG_FILE), exist_ok=True)
+        with open(PROMPT_USAGE_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def get_cache_stats():
+    """
+    Token usage per call type since the process started
+
+    Returns:
+        dict: call_type -> {"requests", "prompt_tokens", "cached_tokens", "completion_tokens", "cached_ratio"}
+    """
+    with _stats_lock:
+        return {
+            call_type: dict(stats, cached_ratio=(stats["cached_tokens"] / stats["prompt_tokens"]) if stats["prompt_tokens"] else 0.0)
+            for call_type, stats in _stats.items()
+        }
@@ -0,0 +1,165 @@
+import json
+import random
+import threading
+from datetime import datetime
+
+import openai
+
+from utils import llm, metrics, tenancy, safe_files
+
+QUIZ_POOL_FILE = "quiz_pool.json"
+
+_lock = threading.Lock()
+_workers = {}  # user id -> refill thread
+
+
+def _load_pool():
+    try:
+        with open(tenancy.user_path(QUIZ_POOL_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"quizzes": [], "last_quizzed": {}}
+
+
+def _save_pool(pool):
+    safe_files.atomic_write(tenancy.user_path(QUIZ_POOL_FILE), json.dumps(pool, ensure_ascii=False))
+
+
+def _pool_locked():
+    """Lock for a read-modify-write of the pool, shared with other processes"""
+    return safe_files.locked(tenancy.user_path(QUIZ_POOL_FILE))
+
+
+def get_due_words(vocab_list, count):
+    """Words most due for practice, based on the quiz history kept with the pool"""
+    last_quizzed = _load_pool()["last_quizzed"]
+    return select_due_words(vocab_list, last_quizzed, count)
+
+
+def select_due_words(vocab_list, last_quizzed, count, exclude=()):
+    """
+    Pick the words that are most due for practice: never quizzed words first
+    (in random order), then the ones quizzed longest ago
+
+    Args:
+        vocab_list: Vocabulary entries
+        last_quizzed: word -> ISO timestamp of the last quiz that used it
+        count: Maximum number of words
+        exclude: Words to skip (e.g. already waiting in the pool)
+
+    Returns:
+        list: Selected words
+    """
+    words = [w["word"] for w in vocab_list if w["word"] not in exclude]
+    random.shuffle(words)
+    words.sort(key=lambda w: last_quizzed.get(w, ""))
+    return words[:count]
+
+
+def generate_quiz(words, language, model, temperature, api_key=None):
+    """Generate a short quiz for the given words, without any chat history"""
+    quiz_prompt = f"""
+    You are a {language} language tutor. Create a short, engaging exercise (3-5 questions) using these words: {', '.join(words)}.
+    Format it as a quiz that the user can answer.
+    """
+    return llm.complete_text(
+        "quiz",
+        [{"role": "user", "content": quiz_prompt}],
+        model=model,
+        temperature=temperature,
+        api_key=api_key
+    )
+
+
+def take_quiz(vocab_list):
+    """
+    Serve a ready quiz from the pool. Quizzes that use words removed from the
+    vocabulary since they were generated are discarded.
+
+    Returns:
+        dict: {"words", "content", "created_at"} or None if the pool is empty
+    """
+    current_words = {w["word"] for w in vocab_list}
+    with _pool_locked():
+        pool = _load_pool()
+        quiz = None
+        while pool["quizzes"]:
+            candidate = pool["quizzes"].pop(0)
+            if set(candidate["words"]) <= current_words:
+                quiz = candidate
+                break
+        if quiz:
+            _mark_quizzed(pool, quiz["words"])
+        _save_pool(pool)
+    metrics.CACHE_REQUESTS.inc(cache="quiz_pool", result="hit" if quiz else "miss")
+    return quiz
+
+
+def _mark_quizzed(pool, words):
+    now = datetime.now().isoformat()
+    for word in words:
+        pool["last_quizzed"][word] = now
+
+
+def record_quiz(words):
+    """Record words quizzed outside the pool (e.g. a quiz generated on demand)"""
+    with _pool_locked():
+        pool = _load_pool()
+        _mark_quizzed(pool, words)
+        _save_pool(pool)
+
+
+def _fill(vocab_list, language, model, temperature, api_key, target_size, words_per_quiz):
+    while True:
+        with _pool_locked():
+            pool = _load_pool()
+            if len(pool["quizzes"]) >= target_size:
+                return
+            pooled = {w for q in pool["quizzes"] for w in q["words"]}
+            words = select_due_words(vocab_list, pool["last_quizzed"], words_per_quiz, exclude=pooled)
+            if not words:
+                # Every word is already waiting in a pooled quiz, allow overlap
+                words = select_due_words(vocab_list, pool["last_quizzed"], words_per_quiz)
+
+        try:
+            content = generate_quiz(words, language, model, temperature, api_key)
+        except openai.OpenAIError:
+            return
+
+        with _pool_locked():
+            pool = _load_pool()
+            pool["quizzes"].append({
+                "words": words,
+                "content": content,
+                "created_at": datetime.now().isoformat()
+            })
+            _save_pool(pool)
+
+
+def refill_in_background(vocab_list, language, model, temperature, api_key=None,
+                         target_size=5, threshold=2, words_per_quiz=5):
+    """
+    Start a background worker that tops the pool up to target_size when it has
+    dropped below threshold. Does nothing if a worker is already running
+    for the current user.
+
+    Returns:
+        bool: True if a worker was started
+    """
+    if not vocab_list:
+        return False
+    user_id = tenancy.current_user_id()
+    with _lock:
+        worker = _workers.get(user_id)
+        if worker is not None and worker.is_alive():
+            return False
+        if len(_load_pool()["quizzes"]) >= threshold:
+            return False
+        worker = _workers[user_id] = threading.Thread(
+            target=tenancy.bind(_fill),
+            args=(list(vocab_list), language, model, temperature, api_key, target_size, words_per_quiz),
+            name="quiz-pool-refill",
+            daemon=True
+        )
+        worker.start()
+    return True
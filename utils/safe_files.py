@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from utils import metrics
+
+DEFAULT_LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.005
+
+# Advisory file locks are per process (fcntl) or per handle (msvcrt), so threads
+# of one process also take a lock of their own for the same path
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+class LockTimeoutError(TimeoutError):
+    """Raised when a file lock could not be acquired in time"""
+
+
+def _thread_lock(path):
+    key = os.path.abspath(path)
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(key, threading.Lock())
+
+
+def _try_lock(handle):
+    try:
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(handle):
+    if fcntl:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def locked(path, timeout=DEFAULT_LOCK_TIMEOUT):
+    """
+    Hold an exclusive advisory lock for path (on the side file path.lock), shared by
+    the threads of this process and by other processes on the same storage
+
+    Raises:
+        LockTimeoutError: If the lock was not acquired within timeout seconds
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    thread_lock = _thread_lock(path)
+    if not thread_lock.acquire(timeout=timeout):
+        raise LockTimeoutError(f"Timed out waiting for the lock on {path}")
+    try:
+        with open(f"{path}.lock", "a+") as handle:
+            while not _try_lock(handle):
+                if time.perf_counter() >= deadline:
+                    raise LockTimeoutError(f"Timed out waiting for the lock on {path}")
+                time.sleep(LOCK_POLL_INTERVAL)
+            metrics.STORAGE_LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, file=os.path.basename(path))
+            try:
+                yield
+            finally:
+                _unlock(handle)
+    finally:
+        thread_lock.release()
+
+
+def atomic_write(path, text):
+    """Write text (str or bytes) to a temporary file and rename it over path, so readers see the old or the new file, never a mix"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb" if isinstance(text, bytes) else "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_version(path):
+    """
+    Token that changes whenever path is replaced or written
+
+    Returns:
+        tuple: (inode, size, mtime in ns), or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,143 @@
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import storage, structured_output, pdf_generator, metrics, tenancy
+
+logger = logging.getLogger(__name__)
+
+# The learner asking to wrap up, e.g. "can we end the session?"
+END_REQUEST_PATTERN = re.compile(r"\b(end|finish|stop|close)\b.{0,20}\bsession\b", re.IGNORECASE)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session-analysis")
+_lock = threading.Lock()
+_jobs = {}  # session_id -> {"message_count", "future", "started"}
+_stats = {"speculative_jobs": 0, "hits": 0, "waits": 0, "misses": 0, "time_saved": 0.0}
+
+
+def suggests_ending(text):
+    """True if the tutor suggests ending the session"""
+    return "end this session" in text.lower()
+
+
+def requests_ending(text):
+    """True if the learner asks to end the session"""
+    return bool(END_REQUEST_PATTERN.search(text))
+
+
+def summarize_session(session, session_messages, language, model):
+    """
+    Ask the model for the end-of-session summary
+
+    Returns:
+        dict: summary, what_worked, understood, difficulties, common_mistakes
+    """
+    conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in session_messages])
+
+    summary_prompt = f"""
+    Analyze this {language} language learning session and provide a detailed summary in JSON format.
+
+    Assignment: {session['assignment']}
+    Conversation:
+    {conversation_text[:4000]}
+
+    Provide your analysis as valid JSON with these exact fields:
+    {{
+        "summary": "2-3 sentence overview of what was practiced",
+        "what_worked": "What the student did well",
+        "understood": "Concepts/grammar/vocabulary the student understood",
+        "difficulties": "Areas where the student struggled",
+        "common_mistakes": ["mistake 1", "mistake 2"]
+    }}
+
+    Return ONLY valid JSON, no other text.
+    """
+
+    return structured_output.request_structured(
+        "session_summary",
+        [{"role": "user", "content": summary_prompt}],
+        call_type="summary",
+        model=model,
+        temperature=0.3
+    )
+
+
+def _analyze(session, session_messages, language, model):
+    """Session summary plus the PDF review data, which pdf_generator caches by message count"""
+    started = time.monotonic()
+    summary = summarize_session(session, session_messages, language, model)
+    try:
+        pdf_generator.generate_pdf_json(session_messages, language, session)
+    except Exception as e:
+        # The review data is regenerated when the PDF is created
+        logger.warning("Speculative PDF review data for session %s failed: %s", session["session_id"], e)
+    return summary, time.monotonic() - started
+
+
+def start_speculative(session_id, language, model):
+    """
+    Start analyzing a session in the background, expecting the learner to end it soon.
+    Does nothing if the current state of the session is already being analyzed.
+
+    Returns:
+        bool: True if a job was started
+    """
+    session = storage.get_session(session_id)
+    if not session or session["status"] != "in_progress":
+        return False
+    session_messages = storage.get_messages_by_session(session_id)
+    with _lock:
+        job = _jobs.get(session_id)
+        if job and job["message_count"] == len(session_messages):
+            return False
+        _jobs[session_id] = {
+            "message_count": len(session_messages),
+            "future": _executor.submit(tenancy.bind(_analyze), session, session_messages, language, model),
+            "started": time.monotonic()
+        }
+        _stats["speculative_jobs"] += 1
+    return True
+
+
+def get_summary(session_id, language, model):
+    """
+    Summary for ending a session: taken from the speculative job if it covers
+    the current messages (waiting for it if still running), computed otherwise
+
+    Returns:
+        dict: The session summary
+    """
+    session = storage.get_session(session_id)
+    session_messages = storage.get_messages_by_session(session_id)
+    with _lock:
+        job = _jobs.pop(session_id, None)
+    if job and job["message_count"] == len(session_messages):
+        waited_from = time.monotonic()
+        done = job["future"].done()
+        try:
+            summary, duration = job["future"].result()
+        except Exception as e:
+            logger.warning("Speculative analysis of session %s failed: %s", session_id, e)
+        else:
+            with _lock:
+                _stats["hits" if done else "waits"] += 1
+                _stats["time_saved"] += max(duration - (time.monotonic() - waited_from), 0.0)
+            metrics.CACHE_REQUESTS.inc(cache="session_analysis", result="hit" if done else "wait")
+            return summary
+    with _lock:
+        _stats["misses"] += 1
+    metrics.CACHE_REQUESTS.inc(cache="session_analysis", result="miss")
+    return summarize_session(session, session_messages, language, model)
+
+
+def get_stats():
+    """
+    Returns:
+        dict: speculative jobs started, hits (ready), waits (still running), misses,
+              hit_rate and total seconds saved
+    """
+    with _lock:
+        lookups = _stats["hits"] + _stats["waits"] + _stats["misses"]
+        return dict(_stats, hit_rate=(_stats["hits"] + _stats["waits"]) / lookups if lookups else None)
@@ -0,0 +1,191 @@
+import math
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+from utils import storage, prompts, tenancy
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Share of the score given to recency (the rest is relevance)
+RECENCY_WEIGHT = 0.3
+RECENCY_HALF_LIFE_DAYS = 14
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]{3,}")
+
+# Per user: {"fingerprint", "index", "blocks"}
+_cache = {}
+_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), good enough for budgeting"""
+    return len(text) // 4 + 1
+
+
+def _tokenize(text):
+    return [t.casefold() for t in TOKEN_PATTERN.findall(text or "")]
+
+
+def _session_text(session):
+    return " ".join([
+        session.get("lesson_key") or "",
+        session.get("assignment") or "",
+        session.get("summary") or "",
+        session.get("difficulties") or "",
+        " ".join(session.get("common_mistakes") or [])
+    ])
+
+
+def _build_index(sessions):
+    """Build a BM25 index over the completed sessions"""
+    docs = [Counter(_tokenize(_session_text(s))) for s in sessions]
+    lengths = [sum(d.values()) for d in docs]
+    avg_length = (sum(lengths) / len(lengths)) if lengths else 0
+    doc_freq = Counter(term for d in docs for term in d)
+    n = len(docs)
+    idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+    return {"sessions": sessions, "docs": docs, "lengths": lengths, "avg_length": avg_length, "idf": idf}
+
+
+def _bm25(index, query_terms, i):
+    doc = index["docs"][i]
+    length_norm = K1 * (1 - B + B * index["lengths"][i] / (index["avg_length"] or 1))
+    score = 0.0
+    for term in query_terms:
+        tf = doc.get(term, 0)
+        if tf:
+            score += index["idf"][term] * tf * (K1 + 1) / (tf + length_norm)
+    return score
+
+
+def _recency(session, now):
+    try:
+        ended = datetime.fromisoformat(session.get("end_time") or session["start_time"])
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+    age_days = max((now - ended).total_seconds() / 86400, 0)
+    return 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+
+def rank_sessions(index, query):
+    """
+    Rank completed sessions by relevance to the query blended with recency
+
+    Returns:
+        list: Sessions, most relevant first
+    """
+    sessions = index["sessions"]
+    if not sessions:
+        return []
+    query_terms = set(_tokenize(query))
+    relevance = [_bm25(index, query_terms, i) for i in range(len(sessions))]
+    top = max(relevance) or 1
+    now = datetime.now()
+    scores = [
+        (1 - RECENCY_WEIGHT) * (relevance[i] / top) + RECENCY_WEIGHT * _recency(s, now)
+        for i, s in enumerate(sessions)
+    ]
+    order = sorted(range(len(sessions)), key=lambda i: scores[i], reverse=True)
+    return [sessions[i] for i in order]
+
+
+def _render_session(session):
+    text = f"\n**Session: {session['assignment']}** ({session['lesson_key']})\n"
+    text += f"Summary: {session['summary']}\n"
+    if session['difficulties']:
+        text += f"Difficulties: {session['difficulties']}\n"
+    # Mistakes are summarized across sessions by get_mistakes_context
+    return text
+
+
+def render_context(ranked, total, token_budget):
+    """Render the top ranked sessions that fit in the token budget"""
+    if not ranked:
+        return ""
+    header = "\n\n=== Previous Session Summaries ===\n"
+    entries = []
+    used = estimate_tokens(header)
+    for session in ranked:
+        entry = _render_session(session)
+        cost = estimate_tokens(entry)
+        if used + cost > token_budget:
+            continue
+        entries.append(entry)
+        used += cost
+    if not entries:
+        return ""
+    if len(entries) < total:
+        header += f"(The {len(entries)} most relevant of {total} previous sessions)\n"
+    return header + "".join(entries)
+
+
+def get_summaries_context(lesson_key=None, assignment=None, extra_query="", token_budget=800):
+    """
+    Get the previous session summaries most relevant to the current lesson,
+    bounded by a token budget. The rendered block is cached per user until a session completes.
+
+    Args:
+        lesson_key: Current lesson (week/day), if any
+        assignment: Current assignment, if any
+        extra_query: Additional query text, e.g. the learner's goals
+        token_budget: Maximum estimated tokens for the block
+
+    Returns:
+        str: Formatted block for the system prompt ("" if there are no completed sessions)
+    """
+    completed = storage.get_completed_sessions()
+    fingerprint = tuple((s["session_id"], s.get("end_time")) for s in completed)
+    query = " ".join(filter(None, [lesson_key, assignment, extra_query]))
+    key = (query, token_budget)
+
+    with _lock:
+        cache = _cache.get(tenancy.current_user_id())
+        if cache is None or cache["fingerprint"] != fingerprint:
+            cache = _cache[tenancy.current_user_id()] = {
+                "fingerprint": fingerprint,
+                "index": _build_index(completed),
+                "blocks": {}
+            }
+        if key not in cache["blocks"]:
+            ranked = rank_sessions(cache["index"], query)
+            cache["blocks"][key] = render_context(ranked, len(completed), token_budget)
+        return cache["blocks"][key]
+
+
+def get_mistakes_context(k=10):
+    """
+    Render the K most frequent recurring mistakes across all sessions
+
+    Returns:
+        str: Formatted block for the system prompt ("" if no mistakes were recorded)
+    """
+    top = storage.get_top_mistakes(k)
+    if not top:
+        return ""
+    lines = [f"- {c['label']} (seen {c['count']}x in {c['sessions']} sessions)" for c in top]
+    return "\n\n=== Recurring Mistakes ===\n" + "\n".join(lines) + "\n"
+
+
+def build_chat_layout(config, lesson_key=None, assignment=None):
+    """
+    Build the tutor prompt layout for a lesson (or free chat) from the saved
+    level and goals, relevant previous sessions and recurring mistakes
+
+    Returns:
+        dict: prompts.build_prompt_layout() result
+    """
+    inputs = storage.load_lesson_plan_inputs() or {}
+    user_level = inputs.get("user_level", "Beginner")
+    user_goals = inputs.get("user_goals", "")
+    context = get_summaries_context(
+        lesson_key, assignment,
+        extra_query=user_goals,
+        token_budget=config.get('summary_context_tokens', 800)
+    )
+    context += get_mistakes_context(config.get('top_mistakes', 10))
+    return prompts.build_prompt_layout(
+        config.get('language', 'English'), user_level, user_goals, context, lesson_key, assignment
+    )
@@ -1,97 +1,703 @@
+import atexit
+import copy
+import gzip
 import json
+import logging
+import lzma
+import os
+import random
+import re
+import threading
+import time
 import streamlit as st
 import uuid
 from datetime import datetime
+from utils import mistake_index, profiler, metrics, tenancy, safe_files, event_log
 
-VOCAB_FILE = "assets/user_vocabulary.json"
-LESSON_PLAN_FILE = "assets/lesson_plan.json"
-USER_INPUTS_FILE = "assets/lesson_plan_inputs.json"
-CHAT_HISTORY_FILE = "assets/chat_history.json"
-SESSION_SUMMARIES_FILE = "assets/session_summaries.json"
+logger = logging.getLogger(__name__)
 
+# File names inside the current user's directory (see tenancy.user_path)
+VOCAB_FILE = "user_vocabulary.json"
+LESSON_PLAN_FILE = "lesson_plan.json"
+USER_INPUTS_FILE = "lesson_plan_inputs.json"
+CHAT_HISTORY_FILE = "chat_history.json"  # single-file history of older versions, split into segments on first use
+CHAT_HISTORY_DIR = "chat_history"  # one segment per month, <YYYY-MM>.json, compressed once the month is over
+SESSION_SUMMARIES_FILE = "session_summaries.json"
+VOCAB_CANDIDATES_FILE = "vocab_candidates.json"
+
+# Attempts of a read-modify-write update before ConflictError
+MAX_UPDATE_ATTEMPTS = 8
+
+# Compression of chat history segments of past months (config "chat_history_compression")
+ARCHIVE_FORMATS = {"gzip": (".gz", gzip), "lzma": (".xz", lzma)}
+DEFAULT_ARCHIVE_FORMAT = "gzip"
+# A past month's segment is compressed once it has not been written for this long
+ARCHIVE_AFTER_SECONDS = 3600
+SEGMENT_PATTERN = re.compile(r"(\d{4}-\d{2})\.json(\.gz|\.xz)?")
+
+
+class ConflictError(RuntimeError):
+    """Raised when an update kept conflicting with concurrent writes"""
+
+def _read_versioned(path, name, default):
+    """Read a JSON file together with the version it was read at (a copy of default if missing or corrupt)"""
+    start = time.perf_counter()
+    while True:
+        version = safe_files.file_version(path)
+        if version is None:
+            return copy.deepcopy(default), None
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+        except FileNotFoundError:
+            continue
+        # Writes replace the file, so an unchanged version means text is that version
+        if safe_files.file_version(path) == version:
+            break
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = copy.deepcopy(default)
+    metrics.STORAGE_BYTES.inc(len(text), file=name, operation="read")
+    metrics.STORAGE_SECONDS.observe(time.perf_counter() - start, file=name, operation="read")
+    return data, version
+
+def _read_json(name, default):
+    """Read one of the current user's JSON files, returning default if it is missing or corrupt"""
+    path = tenancy.user_path(name)
+    # Writes still waiting for the background writer are read back first
+    text = _buffered_text(path)
+    if text is not None:
+        return json.loads(text)
+    return _read_versioned(path, name, default)[0]
+
+def _write_unlocked(path, name, text):
+    start = time.perf_counter()
+    safe_files.atomic_write(path, text)
+    metrics.STORAGE_BYTES.inc(len(text), file=name, operation="write")
+    metrics.STORAGE_SECONDS.observe(time.perf_counter() - start, file=name, operation="write")
+
+def _write_json(name, data, indent=None):
+    """Replace one of the current user's JSON files atomically (in the background if write-behind is on)"""
+    path = tenancy.user_path(name)
+    text = json.dumps(data, indent=indent)
+    if _write_behind_delay() is not None:
+        with _path_lock(path):
+            _queue_write(path, name, text, indent, replace=True)
+        return
+    with safe_files.locked(path):
+        _write_unlocked(path, name, text)
+
+def _update_path(path, name, mutate, default, indent=None):
+    """Read-modify-write a JSON file on disk, see _update_json"""
+    for attempt in range(MAX_UPDATE_ATTEMPTS):
+        data, version = _read_versioned(path, name, default)
+        result = mutate(data)
+        text = json.dumps(data, indent=indent)
+        with safe_files.locked(path):
+            if safe_files.file_version(path) == version:
+                _write_unlocked(path, name, text)
+                return result
+        metrics.STORAGE_WRITE_RETRIES.inc(file=name)
+        time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    raise ConflictError(f"{name} kept changing, the update was not saved")
+
+def _update_json(name, mutate, default, indent=None):
+    """
+    Read-modify-write one of the current user's JSON files without losing concurrent updates.
+
+    The file is parsed and mutated without holding the lock; the lock is only held to
+    check that the file is unchanged and to write it. If another writer got there
+    first, the update is retried on the new content. With write-behind the mutation
+    is applied to the buffered content now and again to the file when it is flushed.
+
+    Args:
+        mutate: Callable changing the loaded data in place; may run more than once,
+                so it must only depend on its argument
+        default: Content of a missing file
+
+    Returns:
+        The return value of mutate
+
+    Raises:
+        ConflictError: If the file kept changing for MAX_UPDATE_ATTEMPTS attempts
+    """
+    path = tenancy.user_path(name)
+    if _write_behind_delay() is None:
+        return _update_path(path, name, mutate, default, indent)
+    with _path_lock(path):
+        text = _buffered_text(path)
+        data = json.loads(text) if text is not None else _read_versioned(path, name, default)[0]
+        result = mutate(data)
+        _queue_write(path, name, json.dumps(data, indent=indent), indent, mutate=mutate, default=default)
+    return result
+
+# --- Write-behind: writes land in memory and a background thread persists them ---
+#
+# Each file has at most one pending entry, holding its current content (read back by
+# _read_json, so this process reads its own writes) and how to persist it: the
+# content itself after a full replace, else the queued mutations, re-applied to the
+# file under its lock so updates from other processes are kept. Writes to a file
+# within the delay are coalesced into one.
+
+DEFAULT_WRITE_BEHIND_DELAY = 0.5
+# Failed writes of a file are retried this many times before they are dropped
+MAX_WRITE_BEHIND_ATTEMPTS = 5
+
+_write_behind = None  # {"delay": seconds} or {"delay": None} if disabled, read from config once
+# Keyed by absolute path, so writes are persisted to the right file if the working directory changes
+_pending = {}  # path -> {"name", "text", "indent", "default", "replace", "mutations", "due", "attempts"}
+_flushing = {}  # path -> content being persisted
+_pending_cond = threading.Condition()
+_path_locks = {}
+_writer = None
+_write_behind_stats = {"queued": 0, "coalesced": 0, "flushed": 0, "failed": 0, "dropped": 0}
+
+def _write_behind_delay():
+    """Seconds writes wait before they are persisted, or None if write-behind is disabled"""
+    global _write_behind
+    if _write_behind is None:
+        try:
+            with open('utils/config.json', 'r') as f:
+                settings = json.load(f).get('write_behind', {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            settings = {}
+        enabled = settings.get("enabled", False) and os.environ.get("TUTOR_WRITE_BEHIND") != "0"
+        _write_behind = {"delay": settings.get("delay", DEFAULT_WRITE_BEHIND_DELAY) if enabled else None}
+    return _write_behind["delay"]
+
+def _path_lock(path):
+    """Serializes the in-memory updates of one file"""
+    with _pending_cond:
+        return _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+def _buffered_text(path):
+    path = os.path.abspath(path)
+    with _pending_cond:
+        entry = _pending.get(path)
+        return entry["text"] if entry else _flushing.get(path)
+
+def _queue_write(path, name, text, indent, replace=False, mutate=None, default=None):
+    global _writer
+    path = os.path.abspath(path)
+    with _pending_cond:
+        entry = _pending.get(path)
+        if entry is None:
+            entry = _pending[path] = {
+                "name": name, "indent": indent, "default": default, "replace": False, "mutations": [],
+                "due": time.monotonic() + _write_behind_delay(), "attempts": 0
+            }
+            _write_behind_stats["queued"] += 1
+            metrics.STORAGE_WRITE_BEHIND.inc(file=name, result="queued")
+        else:
+            _write_behind_stats["coalesced"] += 1
+            metrics.STORAGE_WRITE_BEHIND.inc(file=name, result="coalesced")
+        entry["text"] = text
+        if replace:
+            entry["replace"] = True
+            entry["mutations"] = []
+        elif not entry["replace"]:
+            entry["mutations"].append(mutate)
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_behind_loop, name="storage-write-behind", daemon=True)
+            _writer.start()
+        _pending_cond.notify_all()
+
+def _persist(path, entry):
+    if entry["replace"]:
+        with safe_files.locked(path):
+            _write_unlocked(path, entry["name"], entry["text"])
+        return
+
+    def apply_all(data):
+        for mutate in entry["mutations"]:
+            mutate(data)
+    _update_path(path, entry["name"], apply_all, entry["default"], entry["indent"])
+
+def _requeue(path, entry):
+    """Put a failed entry back in front of the writes queued since it was taken"""
+    newer = _pending.get(path)
+    if newer is None:
+        _pending[path] = dict(entry, due=time.monotonic() + _write_behind_delay())
+        return
+    newer["attempts"] = entry["attempts"]
+    if not newer["replace"]:
+        newer["replace"] = entry["replace"]
+        newer["mutations"] = entry["mutations"] + newer["mutations"]
+
+def _write_behind_loop():
+    while True:
+        with _pending_cond:
+            while True:
+                now = time.monotonic()
+                due = [path for path, entry in _pending.items() if entry["due"] <= now]
+                if due:
+                    break
+                next_due = min((entry["due"] for entry in _pending.values()), default=None)
+                _pending_cond.wait(next_due - now if next_due is not None else None)
+            batch = [(path, _pending.pop(path)) for path in due]
+            for path, entry in batch:
+                _flushing[path] = entry["text"]
+        for path, entry in batch:
+            try:
+                _persist(path, entry)
+            except Exception as e:
+                entry["attempts"] += 1
+                with _pending_cond:
+                    _write_behind_stats["failed"] += 1
+                    if entry["attempts"] < MAX_WRITE_BEHIND_ATTEMPTS:
+                        _requeue(path, entry)
+                    else:
+                        _write_behind_stats["dropped"] += 1
+                if entry["attempts"] < MAX_WRITE_BEHIND_ATTEMPTS:
+                    logger.warning("Could not write %s, retrying: %s", path, e)
+                    metrics.STORAGE_WRITE_BEHIND.inc(file=entry["name"], result="failed")
+                else:
+                    logger.error("Could not write %s after %d attempts, the change is lost: %s",
+                                 path, entry["attempts"], e)
+                    metrics.STORAGE_WRITE_BEHIND.inc(file=entry["name"], result="dropped")
+            else:
+                with _pending_cond:
+                    _write_behind_stats["flushed"] += 1
+                metrics.STORAGE_WRITE_BEHIND.inc(file=entry["name"], result="flushed")
+            finally:
+                with _pending_cond:
+                    _flushing.pop(path, None)
+                    _pending_cond.notify_all()
+
+def flush_writes(timeout=10):
+    """
+    Persist all pending writes now and wait for them
+
+    Returns:
+        bool: False if writes were still pending after timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    with _pending_cond:
+        for entry in _pending.values():
+            entry["due"] = 0
+        _pending_cond.notify_all()
+        while _pending or _flushing:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or _writer is None or not _writer.is_alive():
+                return False
+            _pending_cond.wait(remaining)
+    return True
+
+def get_write_behind_stats():
+    """
+    Returns:
+        dict: writes queued, coalesced into a pending write, flushed, failed and dropped after
+              MAX_WRITE_BEHIND_ATTEMPTS failures, and files pending now
+    """
+    with _pending_cond:
+        return dict(_write_behind_stats, pending=len(_pending) + len(_flushing))
+
+# Writes still in memory are persisted when the process exits
+atexit.register(flush_writes)
+
+# --- Event-sourced files: every change is appended to a log (see utils/event_log.py) ---
+#
+# An event is replayed on load, so the functions applying it must only depend on
+# the document and the event's arguments.
+
+def _replace(items, data):
+    items[:] = data
+
+def _add_vocabulary(vocab_list, entries):
+    known = {(w["word"] if isinstance(w, dict) else w).casefold() for w in vocab_list}
+    for entry in entries:
+        if entry["word"].casefold() not in known:
+            vocab_list.append(entry)
+            known.add(entry["word"].casefold())
+
+def _remove_vocabulary_word(vocab_list, word):
+    vocab_list[:] = [w for w in vocab_list if (w["word"] if isinstance(w, dict) else w) != word]
+
+def _find_lesson(plan, lesson_key):
+    for lesson in plan:
+        if isinstance(lesson, dict) and lesson.get("week_or_day") == lesson_key:
+            return lesson
+    return {"assignments": []}
+
+def _set_assignment_completed(plan, lesson_key, title, completed):
+    for assignment in _find_lesson(plan, lesson_key)["assignments"]:
+        if assignment["title"] == title:
+            assignment["completed"] = completed
+
+def _add_assignment(plan, lesson_key, title):
+    _find_lesson(plan, lesson_key)["assignments"].append({"title": title, "completed": False})
+
+def _remove_assignment(plan, lesson_key, title):
+    lesson = _find_lesson(plan, lesson_key)
+    lesson["assignments"] = [a for a in lesson["assignments"] if a["title"] != title]
+
+def _create_session(sessions, session):
+    sessions.append(session)
+
+def _update_session(sessions, session_id, updates, expected_version=None):
+    for session in sessions:
+        if session["session_id"] == session_id:
+            if expected_version is not None and session.get("version", 0) != expected_version:
+                return False
+            session.update(updates)
+            session["version"] = session.get("version", 0) + 1
+            return True
+    return False
+
+# Events of each file, by name
+EVENT_SOURCED_FILES = {
+    LESSON_PLAN_FILE: {
+        "replace": _replace,
+        "set_assignment_completed": _set_assignment_completed,
+        "add_assignment": _add_assignment,
+        "remove_assignment": _remove_assignment
+    },
+    VOCAB_FILE: {
+        "replace": _replace,
+        "add_vocabulary": _add_vocabulary,
+        "remove_vocabulary_word": _remove_vocabulary_word
+    },
+    SESSION_SUMMARIES_FILE: {
+        "replace": _replace,
+        "create_session": _create_session,
+        "update_session": _update_session,
+        "complete_session": _update_session
+    }
+}
+
+def _apply_event(name):
+    operations = EVENT_SOURCED_FILES[name]
+    def apply(data, op, args):
+        return operations[op](data, **args)
+    return apply
+
+def _load_events(name):
+    """Current content of one of the current user's event-sourced files"""
+    return event_log.load(tenancy.user_path(name), [], _apply_event(name))
+
+def _record(name, op, **args):
+    """Append an event to one of the current user's event-sourced files and return what applying it returned"""
+    return event_log.append(tenancy.user_path(name), op, args, [], _apply_event(name))
+
+def get_events(name, since=None, until=None):
+    """
+    Changes of one of the current user's event-sourced files, oldest first
+
+    Args:
+        name: One of EVENT_SOURCED_FILES, e.g. SESSION_SUMMARIES_FILE
+        since, until: Time range (datetime or ISO string), open-ended if None
+
+    Returns:
+        list: Events as {"seq", "time", "op", "args"}
+    """
+    return event_log.events(tenancy.user_path(name), since, until)
+
+def replay_file(name, until=None):
+    """Content of one of the current user's event-sourced files as it was at the given time (now if None)"""
+    return event_log.replay(tenancy.user_path(name), [], _apply_event(name), until)
+
+def compact_file(name):
+    """Snapshot one of the current user's event-sourced files now"""
+    event_log.compact(tenancy.user_path(name), [], _apply_event(name))
+
+@profiler.profiled("storage")
 def save_lesson_plan_inputs(inputs):
-    with open(USER_INPUTS_FILE, "w") as f:
-        json.dump(inputs, f)
+    _write_json(USER_INPUTS_FILE, inputs)
 
+@profiler.profiled("storage")
 def load_lesson_plan_inputs():
-    try:
-        with open(USER_INPUTS_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return None
+    return _read_json(USER_INPUTS_FILE, None)
 
+@profiler.profiled("storage")
 def load_vocabulary():
-    try:
-        with open(VOCAB_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    return _load_events(VOCAB_FILE)
 
+@profiler.profiled("storage")
 def save_vocabulary(vocab_list):
-    with open(VOCAB_FILE, "w") as f:
-        json.dump(vocab_list, f)
+    _record(VOCAB_FILE, "replace", data=vocab_list)
 
+@profiler.profiled("storage")
+def add_vocabulary(entries):
+    """Add the entries whose word is not in the vocabulary yet (case-insensitive) and return the vocabulary"""
+    _record(VOCAB_FILE, "add_vocabulary", entries=entries)
+    return load_vocabulary()
+
+@profiler.profiled("storage")
+def remove_vocabulary_word(word):
+    """Remove a word from the vocabulary and return the vocabulary"""
+    _record(VOCAB_FILE, "remove_vocabulary_word", word=word)
+    return load_vocabulary()
+
+@profiler.profiled("storage")
+def normalize_vocabulary(vocab_list):
+    """Ensure all entries are dictionaries with 'word', 'translation', and 'example'"""
+    corrected_vocab_list = []
+    for entry in vocab_list:
+        if isinstance(entry, str):
+            corrected_vocab_list.append({
+                "word": entry,
+                "translation": "None.",
+                "example": "None."
+            })
+        elif isinstance(entry, dict):
+            corrected_vocab_list.append({
+                "word": entry.get("word", "Unknown"),
+                "translation": entry.get("translation", "None."),
+                "example": entry.get("example", "None.")
+            })
+    return corrected_vocab_list
+
+@profiler.profiled("storage")
+def load_vocab_candidates():
+    """Load words harvested from tutor replies that wait for enrichment"""
+    return _read_json(VOCAB_CANDIDATES_FILE, [])
+
+@profiler.profiled("storage")
+def save_vocab_candidates(candidates):
+    _write_json(VOCAB_CANDIDATES_FILE, candidates)
+
+@profiler.profiled("storage")
+def add_vocab_candidates(candidates):
+    """Queue the candidates that are not queued yet and return them"""
+    candidates = copy.deepcopy(list(candidates))
+    def add(queue):
+        queued = {c["word"].casefold() for c in queue}
+        added = [c for c in candidates if c["word"].casefold() not in queued]
+        queue.extend(added)
+        return added
+    return _update_json(VOCAB_CANDIDATES_FILE, add, [])
+
+@profiler.profiled("storage")
+def remove_vocab_candidates(words=None):
+    """Remove the given words (or all words) from the candidate queue"""
+    drop = None if words is None else {w.casefold() for w in words}
+    def remove(queue):
+        queue[:] = [] if drop is None else [c for c in queue if c["word"].casefold() not in drop]
+    _update_json(VOCAB_CANDIDATES_FILE, remove, [])
+
+@profiler.profiled("storage")
 def load_lesson_plan():
+    return _load_events(LESSON_PLAN_FILE)
+
+@profiler.profiled("storage")
+def save_lesson_plan(plan):
+    _record(LESSON_PLAN_FILE, "replace", data=plan)
+
+@profiler.profiled("storage")
+def set_assignment_completed(lesson_key, title, completed):
+    """Tick or untick an assignment of the stored plan and return the plan"""
+    _record(LESSON_PLAN_FILE, "set_assignment_completed", lesson_key=lesson_key, title=title, completed=completed)
+    return load_lesson_plan()
+
+@profiler.profiled("storage")
+def add_assignment(lesson_key, title):
+    """Append an assignment to a lesson of the stored plan and return the plan"""
+    _record(LESSON_PLAN_FILE, "add_assignment", lesson_key=lesson_key, title=title)
+    return load_lesson_plan()
+
+@profiler.profiled("storage")
+def remove_assignment(lesson_key, title):
+    """Remove an assignment from a lesson of the stored plan and return the plan"""
+    _record(LESSON_PLAN_FILE, "remove_assignment", lesson_key=lesson_key, title=title)
+    return load_lesson_plan()
+
+# --- Chat history: monthly segments, past months compressed ---
+#
+# Messages are appended to the segment of the current month, so chatting only
+# reads and writes that file. Segments of past months are compressed and only
+# read when older messages are asked for (the history page, a session that
+# started in an earlier month).
+
+_archive_format = None
+
+def _chat_archive_format():
+    """(file extension, module) used to compress past months, from config"""
+    global _archive_format
+    if _archive_format is None:
+        try:
+            with open('utils/config.json', 'r') as f:
+                name = json.load(f).get('chat_history_compression', DEFAULT_ARCHIVE_FORMAT)
+        except (FileNotFoundError, json.JSONDecodeError):
+            name = DEFAULT_ARCHIVE_FORMAT
+        _archive_format = ARCHIVE_FORMATS.get(name, ARCHIVE_FORMATS[DEFAULT_ARCHIVE_FORMAT])
+    return _archive_format
+
+def _current_month():
+    return datetime.now().strftime("%Y-%m")
+
+def _segment_name(month, extension=""):
+    os.makedirs(tenancy.user_path(CHAT_HISTORY_DIR), exist_ok=True)
+    return os.path.join(CHAT_HISTORY_DIR, f"{month}.json{extension}")
+
+def _message_month(msg):
+    month = str(msg.get("timestamp") or "")[:7]
+    return month if re.fullmatch(r"\d{4}-\d{2}", month) else None
+
+def _group_by_month(messages):
+    """Messages by the month of their timestamp; messages without one stay with the message before them"""
+    months = {}
+    month = next(filter(None, map(_message_month, messages)), None) or _current_month()
+    for msg in messages:
+        msg.setdefault("session_id", None)
+        month = _message_month(msg) or month
+        months.setdefault(month, []).append(msg)
+    return months
+
+def _read_archive(name):
+    path = tenancy.user_path(name)
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    module = next(module for extension, module in ARCHIVE_FORMATS.values() if name.endswith(extension))
+    messages = json.loads(module.decompress(data))
+    metrics.STORAGE_BYTES.inc(len(data), file=CHAT_HISTORY_DIR, operation="read")
+    metrics.STORAGE_SECONDS.observe(time.perf_counter() - start, file=CHAT_HISTORY_DIR, operation="read")
+    return messages
+
+def _write_archive(month, messages):
+    """Write the compressed segment of a past month and remove its uncompressed file"""
+    extension, module = _chat_archive_format()
+    name = _segment_name(month, extension)
+    plain_path = tenancy.user_path(_segment_name(month))
+    data = module.compress(json.dumps(messages).encode("utf-8"))
+    with safe_files.locked(plain_path):
+        safe_files.atomic_write(tenancy.user_path(name), data)
+        for other, _ in ARCHIVE_FORMATS.values():
+            if other != extension and os.path.exists(f"{plain_path}{other}"):
+                os.remove(f"{plain_path}{other}")
+        if os.path.exists(plain_path):
+            os.remove(plain_path)
+    metrics.STORAGE_BYTES.inc(len(data), file=CHAT_HISTORY_DIR, operation="write")
+    return name
+
+def _archive_segment(month):
+    """Compress the segment of a past month unless it was written recently or has writes pending"""
+    name = _segment_name(month)
+    path = tenancy.user_path(name)
+    with _path_lock(path):
+        try:
+            if _buffered_text(path) is not None or time.time() - os.path.getmtime(path) < ARCHIVE_AFTER_SECONDS:
+                return None
+        except FileNotFoundError:
+            return None
+        # A compressed file next to the plain one is from an interrupted archiving, the plain file is complete
+        return _write_archive(month, _read_json(name, []))
+
+def _split_legacy_chat_history():
+    """Split the single chat_history.json of older versions into monthly segments"""
+    legacy_path = tenancy.user_path(CHAT_HISTORY_FILE)
+    if not os.path.exists(legacy_path):
+        return
+    with safe_files.locked(legacy_path):
+        if not os.path.exists(legacy_path):
+            return
+        messages = _read_versioned(legacy_path, CHAT_HISTORY_FILE, [])[0]
+        _write_segments(messages)
+        os.remove(legacy_path)
+
+def _write_segments(messages):
+    """Replace the whole chat history with messages"""
+    months = _group_by_month(messages)
+    current = _current_month()
+    for month, month_messages in months.items():
+        if month < current:
+            _write_archive(month, month_messages)
+        else:
+            _write_json(_segment_name(month), month_messages)
+    for month, name in _segment_files().items():
+        if month in months:
+            continue
+        if name.endswith(".json"):
+            _write_json(name, [])
+        else:
+            os.remove(tenancy.user_path(name))
+
+def _segment_files(since=None):
+    """{month: file name} of the current user's chat history segments, oldest month first"""
     try:
-        with open(LESSON_PLAN_FILE, "r") as f:
-            return json.load(f)
+        files = os.listdir(tenancy.user_path(CHAT_HISTORY_DIR))
     except FileNotFoundError:
-        return []
+        files = []
+    segments = {}
+    for file in sorted(files):
+        match = SEGMENT_PATTERN.fullmatch(file)
+        if match and (since is None or match.group(1) >= since):
+            # The uncompressed file wins, see _archive_segment
+            if match.group(2) is None or match.group(1) not in segments:
+                segments[match.group(1)] = os.path.join(CHAT_HISTORY_DIR, file)
+    # Writes still waiting for the background writer may be for a month without a file yet
+    month = _current_month()
+    if month not in segments and _buffered_text(tenancy.user_path(_segment_name(month))) is not None:
+        segments[month] = _segment_name(month)
+    return dict(sorted(segments.items()))
 
-def save_lesson_plan(plan):
-    with open(LESSON_PLAN_FILE, "w") as f:
-        json.dump(plan, f)
+def _chat_segments(since=None):
+    """Like _segment_files, after compressing the segments of past months that are not compressed yet"""
+    _split_legacy_chat_history()
+    segments = _segment_files(since)
+    current = _current_month()
+    for month, name in segments.items():
+        if month < current and name.endswith(".json"):
+            segments[month] = _archive_segment(month) or name
+    return segments
+
+def _load_segments(since=None):
+    messages = []
+    for name in _chat_segments(since).values():
+        messages.extend(_read_json(name, []) if name.endswith(".json") else _read_archive(name))
+    return messages
 
 # --- Function to load chat history from file ---
-def load_chat_history():
-    try:
-        with open(CHAT_HISTORY_FILE, "r") as f:
-            messages = json.load(f)
-            
-            # Migrate old messages to include session_id field
-            migrated = False
-            for msg in messages:
-                if "session_id" not in msg:
-                    msg["session_id"] = None
-                    migrated = True
-            
-            # Save migrated messages back
-            if migrated:
-                save_chat_history(messages)
-            
-            return messages
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+@profiler.profiled("storage")
+def load_chat_history(since=None):
+    """
+    Load the chat history, oldest message first
+
+    Args:
+        since: Only the months from this one on ("YYYY-MM"), so older, compressed months are not read
+    """
+    return _load_segments(since)
 
 # --- Function to save chat history to file ---
+@profiler.profiled("storage")
 def save_chat_history(messages):
     try:
-        with open(CHAT_HISTORY_FILE, "w") as f:
-            json.dump(messages, f)
+        _split_legacy_chat_history()
+        _write_segments(messages)
+    except Exception as e:
+        st.error(f"Error saving chat history: {e}")
+
+@profiler.profiled("storage")
+def append_messages(messages):
+    """Append messages to the chat history, keeping messages appended concurrently (e.g. from another tab)"""
+    # Copied: with write-behind the mutation runs again at flush time, after the
+    # caller may have appended to the same list
+    messages = copy.deepcopy(list(messages))
+    try:
+        _split_legacy_chat_history()
+        _update_json(_segment_name(_current_month()), lambda history: history.extend(messages), [])
     except Exception as e:
         st.error(f"Error saving chat history: {e}")
 
 # --- Session Management Functions ---
 
+@profiler.profiled("storage")
 def load_sessions():
     """Load all session summaries"""
-    try:
-        with open(SESSION_SUMMARIES_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    return _load_events(SESSION_SUMMARIES_FILE)
 
+@profiler.profiled("storage")
 def save_sessions(sessions):
     """Save all session summaries"""
     try:
-        with open(SESSION_SUMMARIES_FILE, "w") as f:
-            json.dump(sessions, f, indent=2)
+        _record(SESSION_SUMMARIES_FILE, "replace", data=sessions)
     except Exception as e:
         st.error(f"Error saving sessions: {e}")
 
+@profiler.profiled("storage")
 def create_session(lesson_key, assignment):
     """Create a new session and return its ID"""
-    sessions = load_sessions()
     session_id = str(uuid.uuid4())
     new_session = {
         "session_id": session_id,
@@ -106,12 +712,13 @@ def create_session(lesson_key, assignment):
         "difficulties": None,
         "common_mistakes": [],
         "pdf_path": None,
-        "status": "in_progress"
+        "status": "in_progress",
+        "version": 1
     }
-    sessions.append(new_session)
-    save_sessions(sessions)
+    _record(SESSION_SUMMARIES_FILE, "create_session", session=new_session)
     return session_id
 
+@profiler.profiled("storage")
 def get_session(session_id):
     """Get a specific session by ID"""
     sessions = load_sessions()
@@ -120,16 +727,67 @@ def get_session(session_id):
             return session
     return None
 
-def update_session(session_id, updates):
-    """Update specific fields of a session"""
-    sessions = load_sessions()
-    for i, session in enumerate(sessions):
-        if session["session_id"] == session_id:
-            sessions[i].update(updates)
-            save_sessions(sessions)
-            return True
+def _update_session_event(op, session_id, updates, expected_version):
+    if _record(SESSION_SUMMARIES_FILE, op, session_id=session_id, updates=updates, expected_version=expected_version):
+        return True
+    if expected_version is not None and get_session(session_id) is not None:
+        raise ConflictError(f"Session {session_id} changed since version {expected_version}, the update was not saved")
     return False
 
+def _modify_session(op, session_id, make_updates, session):
+    for attempt in range(MAX_UPDATE_ATTEMPTS):
+        if session is None:
+            session = get_session(session_id)
+            if session is None:
+                return None
+        updates = make_updates(session)
+        if updates is None:
+            return None
+        try:
+            _update_session_event(op, session_id, updates, session.get("version", 0))
+            return updates
+        except ConflictError:
+            metrics.STORAGE_WRITE_RETRIES.inc(file=SESSION_SUMMARIES_FILE)
+            session = None
+    raise ConflictError(f"Session {session_id} kept changing, the update was not saved")
+
+@profiler.profiled("storage")
+def update_session(session_id, updates, expected_version=None):
+    """
+    Update specific fields of a session and increase its version
+
+    Args:
+        expected_version: If given, only update the session if it still has this version
+                          (the "version" of the session dict the caller read)
+
+    Returns:
+        bool: False if the session does not exist
+
+    Raises:
+        ConflictError: If the session no longer has expected_version
+    """
+    return _update_session_event("update_session", session_id, updates, expected_version)
+
+@profiler.profiled("storage")
+def modify_session(session_id, make_updates, session=None):
+    """
+    Update a session based on its content without overwriting concurrent changes:
+    if the session changed before the updates were saved, it is reloaded and
+    make_updates is called again on the new version.
+
+    Args:
+        make_updates: Callable returning the updates for a session dict, or None to leave it unchanged
+        session: The session as the caller loaded it (its version is checked), loaded now if None
+
+    Returns:
+        dict: The updates that were saved, None if the session does not exist or was left unchanged
+
+    Raises:
+        ConflictError: If the session kept changing for MAX_UPDATE_ATTEMPTS attempts
+    """
+    return _modify_session("update_session", session_id, make_updates, session)
+
+@profiler.profiled("storage")
 def get_session_by_assignment(lesson_key, assignment):
     """Find an in-progress session for a specific assignment"""
     sessions = load_sessions()
@@ -140,18 +798,29 @@ def get_session_by_assignment(lesson_key, assignment):
             return session
     return None
 
+@profiler.profiled("storage")
 def get_in_progress_sessions():
     """Get all in-progress sessions"""
     sessions = load_sessions()
     return [s for s in sessions if s["status"] == "in_progress"]
 
+@profiler.profiled("storage")
 def get_completed_sessions():
     """Get all completed sessions"""
     sessions = load_sessions()
     return [s for s in sessions if s["status"] == "completed"]
 
-def complete_session(session_id, summary_data):
-    """Mark session as completed and save summary"""
+@profiler.profiled("storage")
+def complete_session(session_id, summary_data, session=None):
+    """
+    Mark session as completed and save summary, unless it has been completed meanwhile (e.g. in another tab)
+
+    Args:
+        session: The session the summary was made from; changes made to it since are kept
+
+    Returns:
+        bool: True if this call completed the session
+    """
     updates = {
         "status": "completed",
         "end_time": datetime.now().isoformat(),
@@ -161,18 +830,74 @@ def complete_session(session_id, summary_data):
         "difficulties": summary_data.get("difficulties"),
         "common_mistakes": summary_data.get("common_mistakes", [])
     }
-    return update_session(session_id, updates)
+    if not _modify_session(
+        "complete_session", session_id, lambda current: None if current["status"] == "completed" else updates, session
+    ):
+        return False
 
+    # Keep the cross-session mistake frequencies up to date incrementally
+    with mistake_index.locked():
+        index = _load_or_build_mistake_index()
+        if mistake_index.add_session(index, session_id, updates["common_mistakes"], updates["end_time"]):
+            mistake_index.save_index(index)
+    return True
+
+# --- Mistake Frequency Index ---
+
+@profiler.profiled("storage")
+def load_mistake_index():
+    """Load the mistake-frequency index, building it from completed sessions the first time"""
+    index = mistake_index.load_index()
+    if index is None:
+        with mistake_index.locked():
+            index = _load_or_build_mistake_index()
+    return index
+
+def _load_or_build_mistake_index():
+    """load_mistake_index for callers holding mistake_index.locked()"""
+    index = mistake_index.load_index()
+    if index is None:
+        index = mistake_index.build_index(get_completed_sessions())
+        mistake_index.save_index(index)
+    return index
+
+@profiler.profiled("storage")
+def get_top_mistakes(k=10):
+    """Get the K most frequent mistake clusters across all sessions"""
+    return mistake_index.top_mistakes(load_mistake_index(), k)
+
+@profiler.profiled("storage")
 def get_messages_by_session(session_id):
     """Get all messages for a specific session"""
-    chat_history = load_chat_history()
+    # Messages of a session are in the segments from the month it started on
+    session = get_session(session_id)
+    since = session["start_time"][:7] if session and session.get("start_time") else None
+    chat_history = load_chat_history(since)
     return [msg for msg in chat_history if msg.get("session_id") == session_id]
 
+@profiler.profiled("storage")
+def group_messages_by_date(messages):
+    """Group messages by the day of their timestamp (YYYY-MM-DD), skipping messages without a valid one"""
+    history_by_date = {}
+    for msg in messages:
+        try:
+            msg_time = datetime.strptime(msg["timestamp"][:19], "%Y-%m-%dT%H:%M:%S")
+            date_str = msg_time.strftime("%Y-%m-%d")
+
+            if date_str not in history_by_date:
+                history_by_date[date_str] = []
+            history_by_date[date_str].append(msg)
+        except (ValueError, KeyError):
+            pass
+    return history_by_date
+
+@profiler.profiled("storage")
 def get_recent_messages(session_id, limit=20):
     """Get the most recent N messages for a session"""
     messages = get_messages_by_session(session_id)
     return messages[-limit:] if len(messages) > limit else messages
 
+@profiler.profiled("storage")
 def get_all_summaries():
     """Get all completed session summaries as a formatted string for context"""
     completed = get_completed_sessions()
@@ -0,0 +1,257 @@
+import copy
+import json
+import logging
+import os
+import re
+
+import openai
+
+from utils import llm, safe_files
+
+logger = logging.getLogger(__name__)
+
+STRUCTURED_OUTPUT_STATS_FILE = "assets/structured_output_stats.json"
+
+
+def _string(description=""):
+    return {"type": "string", "description": description}
+
+
+def _strings(description=""):
+    return {"type": "array", "items": {"type": "string"}, "description": description}
+
+
+def _object(properties):
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+# JSON schemas of every JSON-producing prompt (strict mode: all fields required, no extras)
+SCHEMAS = {
+    "lesson_plan": _object({
+        "lesson_plan": {
+            "type": "array",
+            "items": _object({
+                "week_or_day": _string('"Week X - Topic" or "Day X - Topic"'),
+                "assignments": _strings("At least 2 tasks")
+            })
+        }
+    }),
+    "session_summary": _object({
+        "summary": _string("2-3 sentence overview of what was practiced"),
+        "what_worked": _string("What the student did well"),
+        "understood": _string("Concepts/grammar/vocabulary the student understood"),
+        "difficulties": _string("Areas where the student struggled"),
+        "common_mistakes": _strings("Mistakes the student made")
+    }),
+    "pdf_review": _object({
+        "objectives": _string("Main goals/topics of the conversation (2-3 sentences)"),
+        "learnings": _object({
+            "grammar_points": _strings(),
+            "vocabulary": _strings('"word: definition"'),
+            "structures": _strings(),
+            "key_concepts": _strings()
+        }),
+        "improvements": _object({
+            "areas_to_focus": _strings(),
+            "common_mistakes": _strings("Mistake with explanation"),
+            "recommendations": _strings()
+        })
+    }),
+    "word_details": _object({
+        "words": {
+            "type": "array",
+            "items": _object({
+                "word": _string("The word as given"),
+                "translation": _string("Concise English translation"),
+                "example": _string("Example sentence using the word")
+            })
+        }
+    })
+}
+
+def response_format(prompt_type, schema=None):
+    """OpenAI json_schema response format for a prompt type"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": prompt_type, "schema": schema or SCHEMAS[prompt_type], "strict": True}
+    }
+
+
+def validate(schema, value, path="$"):
+    """
+    Validate a value against the subset of JSON schema used in SCHEMAS
+
+    Returns:
+        list: Error messages, empty if the value is valid
+    """
+    expected = schema.get("type")
+    if expected == "object":
+        if not isinstance(value, dict):
+            return [f"{path}: expected object"]
+        errors = []
+        for field in schema.get("required", []):
+            if field not in value:
+                errors.append(f"{path}.{field}: missing")
+        for field, field_schema in schema.get("properties", {}).items():
+            if field in value:
+                errors.extend(validate(field_schema, value[field], f"{path}.{field}"))
+        return errors
+    if expected == "array":
+        if not isinstance(value, list):
+            return [f"{path}: expected array"]
+        errors = []
+        for i, item in enumerate(value):
+            errors.extend(validate(schema.get("items", {}), item, f"{path}[{i}]"))
+        return errors
+    if expected == "string" and not isinstance(value, str):
+        return [f"{path}: expected string"]
+    return []
+
+
+def default_value(schema):
+    """Empty value of the schema's shape, used when a field cannot be repaired"""
+    expected = schema.get("type")
+    if expected == "object":
+        return {field: default_value(s) for field, s in schema.get("properties", {}).items()}
+    if expected == "array":
+        return []
+    return ""
+
+
+def parse_json(content):
+    """Parse a JSON object from model output, tolerating text around it"""
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        pass
+    json_match = re.search(r'\{.*\}', content or "", re.DOTALL)
+    if json_match:
+        try:
+            return json.loads(json_match.group())
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def failing_fields(schema, data):
+    """Top-level fields of data that are missing or invalid"""
+    if not isinstance(data, dict):
+        return list(schema["properties"])
+    return [
+        field for field, field_schema in schema["properties"].items()
+        if field not in data or validate(field_schema, data[field])
+    ]
+
+
+def record_outcome(prompt_type, parse_failed=False, invalid=False, repaired=False, repair_failed=False):
+    """Count the outcome of one structured request in the persistent per prompt type stats"""
+    os.makedirs(os.path.dirname(STRUCTURED_OUTPUT_STATS_FILE), exist_ok=True)
+    with safe_files.locked(STRUCTURED_OUTPUT_STATS_FILE):
+        try:
+            with open(STRUCTURED_OUTPUT_STATS_FILE, "r") as f:
+                stats = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            stats = {}
+        entry = stats.setdefault(prompt_type, {
+            "requests": 0, "parse_failures": 0, "validation_failures": 0, "repaired": 0, "repair_failures": 0
+        })
+        entry["requests"] += 1
+        entry["parse_failures"] += int(parse_failed)
+        entry["validation_failures"] += int(invalid)
+        entry["repaired"] += int(repaired)
+        entry["repair_failures"] += int(repair_failed)
+        safe_files.atomic_write(STRUCTURED_OUTPUT_STATS_FILE, json.dumps(stats, indent=2))
+
+
+def get_failure_rates():
+    """
+    Returns:
+        dict: prompt_type -> counters plus "parse_failure_rate" and "validation_failure_rate"
+    """
+    try:
+        with open(STRUCTURED_OUTPUT_STATS_FILE, "r") as f:
+            stats = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {
+        prompt_type: dict(
+            entry,
+            parse_failure_rate=entry["parse_failures"] / entry["requests"],
+            validation_failure_rate=entry["validation_failures"] / entry["requests"]
+        )
+        for prompt_type, entry in stats.items() if entry["requests"]
+    }
+
+
+def structured_kwargs(prompt_type, schema=None):
+    """Extra completion arguments enabling structured outputs, unless disabled in config"""
+    with open('utils/config.json', 'r') as f:
+        config = json.load(f)
+    if config.get('structured_outputs', True):
+        return {"response_format": response_format(prompt_type, schema)}
+    return {}
+
+
+def request_structured(prompt_type, messages, call_type=None, **kwargs):
+    """
+    Request JSON matching SCHEMAS[prompt_type], validate it, and re-request
+    only the fields that are missing or invalid. Fields that still fail are
+    filled with empty values of the right shape.
+
+    Args:
+        prompt_type: Key of SCHEMAS
+        messages: Chat messages (the prompt should describe the expected JSON)
+        call_type: llm call type (defaults to prompt_type)
+        **kwargs: Passed to llm.complete (model, temperature...)
+
+    Returns:
+        dict: Data that validates against the schema
+    """
+    schema = SCHEMAS[prompt_type]
+    call_type = call_type or prompt_type
+
+    content = llm.complete_text(call_type, messages, **structured_kwargs(prompt_type), **kwargs)
+    data = parse_json(content)
+    parse_failed = not isinstance(data, dict)
+    data = data if isinstance(data, dict) else {}
+
+    failing = failing_fields(schema, data)
+    if not failing:
+        record_outcome(prompt_type)
+        return data
+
+    logger.warning("Structured %s output invalid for fields %s, re-requesting them", prompt_type, failing)
+    partial_schema = copy.deepcopy(schema)
+    partial_schema["properties"] = {f: schema["properties"][f] for f in failing}
+    partial_schema["required"] = failing
+    repair_messages = messages + [
+        {"role": "assistant", "content": content or ""},
+        {"role": "user", "content": (
+            f"Your answer is missing or has invalid values for: {', '.join(failing)}. "
+            f"Return ONLY a JSON object with exactly these fields: {', '.join(failing)}."
+        )}
+    ]
+    try:
+        repaired = parse_json(llm.complete_text(
+            call_type, repair_messages, **structured_kwargs(f"{prompt_type}_repair", partial_schema), **kwargs
+        ))
+    except openai.OpenAIError as e:
+        logger.warning("Structured %s repair request failed: %s", prompt_type, e)
+        repaired = None
+
+    still_failing = []
+    for field in failing:
+        if isinstance(repaired, dict) and field in repaired and not validate(schema["properties"][field], repaired[field]):
+            data[field] = repaired[field]
+        else:
+            still_failing.append(field)
+            data[field] = default_value(schema["properties"][field])
+
+    record_outcome(prompt_type, parse_failed=parse_failed, invalid=True,
+                   repaired=not still_failing, repair_failed=bool(still_failing))
+    return data
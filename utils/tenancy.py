@@ -0,0 +1,202 @@
+# Per-user data partitioning: every learner's files live in assets/users/<user_id>/.
+#
+# The user of a script run is set once at the top of each page (init_user) and kept
+# per thread, so storage and the other modules find the right directory without
+# passing the id around. Background workers are started through bind() to keep
+# the user of the page that started them.
+#
+# Existing single-user data in assets/ is not used until it is migrated to a user:
+#   python -m utils.tenancy migrate --user alice
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import streamlit as st
+
+from utils import profiler
+
+ASSETS_DIR = "assets"
+USERS_DIR = "assets/users"
+DEFAULT_USER_ID = "default"
+
+# Files and directories that belong to one learner (everything else in assets/ is shared)
+USER_FILES = [
+    "user_vocabulary.json",
+    "lesson_plan.json",
+    "lesson_plan_inputs.json",
+    "chat_history.json",
+    "session_summaries.json",
+    "vocab_candidates.json",
+    "mistake_index.json",
+    "quiz_pool.json",
+    "prefetched_openings.json",
+    "pdf_jsons",
+    "pdfs"
+]
+
+USER_ID_PATTERN = re.compile(r"[\w@+-][\w@.+-]{0,63}")
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_legacy_checked = False
+
+
+def normalize_user_id(user_id):
+    """
+    Make a user id safe to use as a directory name
+
+    Returns:
+        str: The id itself if it is a plain name or e-mail address, a hash of it otherwise
+    """
+    user_id = str(user_id).strip()
+    if USER_ID_PATTERN.fullmatch(user_id):
+        return user_id
+    return hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+
+
+def current_user_id():
+    return getattr(_local, "user_id", None) or DEFAULT_USER_ID
+
+
+def set_current_user(user_id):
+    _local.user_id = normalize_user_id(user_id) if user_id else None
+
+
+@contextmanager
+def user_scope(user_id):
+    """Run a block as the given user, e.g. `with tenancy.user_scope("alice"): storage.load_vocabulary()`"""
+    previous = getattr(_local, "user_id", None)
+    set_current_user(user_id)
+    try:
+        yield
+    finally:
+        _local.user_id = previous
+
+
+def bind(fn):
+    """Wrap fn to run as the current user, for starting background threads and executor jobs"""
+    user_id = current_user_id()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with user_scope(user_id):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def auth_configured():
+    """Whether Streamlit authentication is set up ([auth] in secrets.toml)"""
+    try:
+        return "auth" in st.secrets
+    except FileNotFoundError:  # no secrets file
+        return False
+
+
+def init_user():
+    """
+    Set the user of this script run. With Streamlit authentication configured it is
+    the logged-in user, and visitors who are not logged in are asked to log in.
+    Without authentication it is ?user=<id> in the URL (kept for the browser
+    session), else the default user.
+
+    Returns:
+        str: The user id
+    """
+    if auth_configured():
+        if not st.user.is_logged_in:
+            st.info("Please log in to see your lessons.")
+            st.button("Log in", on_click=st.login)
+            profiler.stop()
+        user_id = st.user.get("email") or st.user.get("sub")
+    else:
+        user_id = st.query_params.get("user") or st.session_state.get("user_id")
+    set_current_user(user_id)
+    st.session_state.user_id = current_user_id()
+    return st.session_state.user_id
+
+
+def user_dir(user_id=None):
+    """Directory of the user's data (the current user by default), created if missing"""
+    _warn_legacy_data()
+    path = os.path.join(USERS_DIR, normalize_user_id(user_id) if user_id else current_user_id())
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def user_path(name, user_id=None):
+    """Path of one of the user's files, e.g. user_path("chat_history.json")"""
+    return os.path.join(user_dir(user_id), name)
+
+
+def list_users():
+    try:
+        return sorted(d for d in os.listdir(USERS_DIR) if os.path.isdir(os.path.join(USERS_DIR, d)))
+    except FileNotFoundError:
+        return []
+
+
+def migrate_legacy_data(user_id=DEFAULT_USER_ID):
+    """
+    Move the single-user files from assets/ into the user's directory. Files the
+    user already has are left in place, so running it twice does nothing.
+
+    Returns:
+        list: Names of the moved files and directories
+    """
+    target = os.path.join(USERS_DIR, normalize_user_id(user_id))
+    moved = []
+    for name in USER_FILES:
+        source = os.path.join(ASSETS_DIR, name)
+        destination = os.path.join(target, name)
+        if os.path.exists(source) and not os.path.exists(destination):
+            os.makedirs(target, exist_ok=True)
+            os.replace(source, destination)
+            moved.append(name)
+
+    # Sessions point to their HTML summary, which moved with pdfs/
+    summaries_path = os.path.join(target, "session_summaries.json")
+    if "pdfs" in moved and os.path.exists(summaries_path):
+        with open(summaries_path, "r") as f:
+            sessions = json.load(f)
+        for session in sessions:
+            if session.get("pdf_path"):
+                session["pdf_path"] = os.path.join(target, "pdfs", os.path.basename(session["pdf_path"]))
+        with open(summaries_path, "w") as f:
+            json.dump(sessions, f, indent=2)
+    return moved
+
+
+def _warn_legacy_data():
+    """Log once per process if single-user files in assets/ are waiting to be migrated"""
+    global _legacy_checked
+    if _legacy_checked:
+        return
+    _legacy_checked = True
+    legacy = [name for name in USER_FILES if os.path.exists(os.path.join(ASSETS_DIR, name))]
+    if legacy:
+        logger.warning(
+            "Single-user data in %s/ is not used until it is migrated (%s): python -m utils.tenancy migrate --user <id>",
+            ASSETS_DIR, ", ".join(legacy)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-user data directories")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Move the single-user files in assets/ to a user")
+    migrate.add_argument("--user", default=DEFAULT_USER_ID)
+    subparsers.add_parser("list", help="List the users that have data")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        moved = migrate_legacy_data(args.user)
+        print(f"Moved to {os.path.join(USERS_DIR, normalize_user_id(args.user))}: {', '.join(moved) or 'nothing'}")
+    else:
+        print("\n".join(list_users()))
@@ -0,0 +1,125 @@
+import logging
+import re
+from datetime import datetime
+
+from utils import storage, dictionary_cache
+
+# ~~wrong~~ **right**: the correction format the tutor is asked to use
+CORRECTION_PATTERN = re.compile(r'~~[^~\n]+~~\s*(?:→|->)?\s*\*\*([^*\n]+)\*\*')
+# Vocabulary list items: "- zuverlässig", "- **die Besprechung** – meeting", "* der Termin (appointment)".
+# Numbered items and "Label: explanation" bullets are exercises/headings, not vocabulary
+TERM = r"[^\W\d_][^\W\d_'’ /-]*(?:[ '’/-]+[^\W\d_][^\W\d_'’-]*)*"
+SUGGESTION_PATTERN = re.compile(
+    rf'^[ \t]*[-*•][ \t]+(?:\*\*({TERM})\*\*|({TERM}))[ \t]*(?:$|(?:–|—| - |=|\().*$)',
+    re.MULTILINE
+)
+
+MAX_WORDS_PER_CANDIDATE = 4
+
+logger = logging.getLogger(__name__)
+
+
+def _clean(candidate):
+    """Trim punctuation around a candidate and reject headings, sentences and numbers"""
+    candidate = candidate.strip().strip('.,;:!?"„“”«»()')
+    if not candidate or len(candidate) > 60:
+        return None
+    if len(candidate.split()) > MAX_WORDS_PER_CANDIDATE:
+        return None
+    if not re.search(r'[^\W\d_]', candidate) or re.match(r'^\d', candidate):
+        return None
+    return candidate
+
+
+def extract_candidates(text):
+    """
+    Extract vocabulary candidates from one assistant message
+
+    Args:
+        text: Message content (markdown)
+
+    Returns:
+        list: Unique candidates, corrections first, in order of appearance
+    """
+    found = []
+    for match in CORRECTION_PATTERN.finditer(text):
+        found.append((match.start(), "correction", match.group(1)))
+    for match in SUGGESTION_PATTERN.finditer(text):
+        # "die Frist / der Termin" lists two words
+        for term in (match.group(1) or match.group(2)).split(" / "):
+            found.append((match.start(), "suggestion", term))
+
+    candidates = []
+    seen = set()
+    for _, source, raw in sorted(found, key=lambda c: (c[1] != "correction", c[0])):
+        word = _clean(raw)
+        if word and word.casefold() not in seen:
+            seen.add(word.casefold())
+            candidates.append({"word": word, "source": source})
+    return candidates
+
+
+def harvest_message(message, known_words=None):
+    """
+    Queue vocabulary candidates from a newly appended assistant message.
+    Only the given message is parsed, older messages are never rescanned.
+
+    Args:
+        message: Chat message dict (role, content, timestamp, session_id)
+        known_words: Words already in the user's vocabulary (loaded from storage if None)
+
+    Returns:
+        list: Candidates that were added to the queue
+    """
+    if message.get("role") != "assistant" or not message.get("content"):
+        return []
+
+    if known_words is None:
+        known_words = [w["word"] if isinstance(w, dict) else w for w in storage.load_vocabulary()]
+
+    skip = {w.casefold() for w in known_words}
+
+    candidates = []
+    for candidate in extract_candidates(message["content"]):
+        if candidate["word"].casefold() in skip:
+            continue
+        candidate["session_id"] = message.get("session_id")
+        candidate["found_at"] = message.get("timestamp") or datetime.now().isoformat()
+        candidates.append(candidate)
+
+    if not candidates:
+        return []
+    # Words already queued (possibly by another tab meanwhile) are skipped when adding
+    try:
+        return storage.add_vocab_candidates(candidates)
+    except storage.ConflictError as e:
+        # Suggestions are best effort, the reply itself is saved either way
+        logger.warning("Vocabulary candidates not queued: %s", e)
+        return []
+
+
+def dismiss_candidates(words=None):
+    """Remove the given words (or all words) from the queue"""
+    storage.remove_vocab_candidates(words)
+
+
+def enrich_candidates(language, model, temperature, api_key=None, batch_size=10):
+    """
+    Enrich the oldest queued candidates in one batch and remove them from the queue
+
+    Returns:
+        list: {"word", "translation", "example"} entries ready for the vocabulary
+    """
+    queue = storage.load_vocab_candidates()
+    batch = [c["word"] for c in queue[:batch_size]]
+    if not batch:
+        return []
+
+    entries = dictionary_cache.get_words_details(batch, language, model, temperature, api_key)
+    # Words the model could not enrich are dropped too, so they don't block the queue
+    try:
+        dismiss_candidates(batch)
+    except storage.ConflictError as e:
+        # They stay queued; enriching them again is served from the dictionary cache
+        logger.warning("Enriched vocabulary candidates not removed from the queue: %s", e)
+    return entries